@@ -1,25 +1,57 @@
 import streamlit as st
+from google_clients import authenticate_google_services, get_client_factory
+from gmail_sync import sync_mailbox, backfill_emails
 from main import (
-    authenticate_google_services,
-    fetch_and_store_emails,
+    reply_to_emails,
     init_db,
     SessionLocal,
-    Email,
-    summarize_email,
-    generate_reply,
     extract_question_from_email,
     extract_meeting_datetime,
     create_event,
-    generate_event_title
 )
-from email_actions import send_email
-from datetime import datetime, timedelta
+from llm_integration import summarize_email, generate_reply, generate_event_title
+from jobs import JobManager, DONE, FAILED
+from llm_cache import llm_cache
+from metrics import metrics, Metrics, METRICS_FILE
+from database import (
+    list_email_headers,
+    get_email_body,
+    search_emails,
+    get_overview_counts,
+    get_hourly_counts,
+    get_daily_counts,
+    get_top_senders,
+)
+from datetime import datetime
+import os
 import pandas as pd
 import plotly.express as px
 from dateutil.tz import gettz
 
 st.set_page_config(page_title="AI Email Assistant", page_icon="📬", layout="wide")
 
+INBOX_PAGE_SIZE = 25
+JOBS_SHOWN = 5
+
+@st.cache_resource
+def get_job_manager():
+    # One executor for the whole server process, shared by every session and rerun
+    return JobManager()
+
+@st.cache_resource
+def prepare_database():
+    # Schema migrations, the search index and the rollup check run once per server process, not on every rerun
+    init_db()
+
+def describe_result(job):
+    if job.key == "sync":
+        return f"{job.result} new email(s)"
+    if job.key == "auto_reply":
+        return f"{job.result['replied']} email(s) replied, {job.result['events']} event(s) scheduled"
+    if job.key == "backfill":
+        return f"{job.result} message(s) processed"
+    return "done"
+
 # -------------------- Session State Defaults --------------------
 default_settings = {
     "max_emails": 10,
@@ -29,7 +61,8 @@ default_settings = {
     "timezone": "Asia/Kolkata",
     "slack_enabled": True,
     "ai_temperature": 0.7,
-    "selected_email_ids": set()
+    "selected_email_ids": set(),
+    "seen_finished_jobs": set(),
 }
 for key, value in default_settings.items():
     st.session_state.setdefault(key, value)
@@ -60,38 +93,58 @@ with st.sidebar:
                 st.error(f"Auth Failed: {e}")
     else:
         st.success("✅ Authenticated")
-        st.radio("View Mode", ["Dashboard", "Inbox", "AI Assistant", "Calendar", "Insights", "Settings"], key='view')
+        st.radio("View Mode", ["Dashboard", "Inbox", "AI Assistant", "Calendar", "Insights", "Performance", "Settings"], key='view')
         st.markdown("---")
         st.subheader("Actions")
+        jobs = get_job_manager()
         if st.button("📥 Fetch Emails"):
-            fetch_and_store_emails(st.session_state.gmail_service)
-            st.success("Fetched!")
-            st.rerun()
+            job, started = jobs.submit("Fetch emails", sync_mailbox, st.session_state.gmail_service,
+                                       max_results=st.session_state.max_emails, key="sync")
+            if not started:
+                st.info("A fetch is already running.")
         if st.button("🤖 Auto Reply Emails"):
-            session = SessionLocal()
-            emails = session.query(Email).filter(Email.id.in_(st.session_state.selected_email_ids)).all()
-            if not emails:
+            if not st.session_state.selected_email_ids:
                 st.warning("No selected emails to reply.")
             else:
-                replied_count = 0
-                for email in emails:
-                    if '[Replied]' in email.subject:
-                        continue
-                    reply = generate_reply(email.body)
-                    if reply and "Draft generation failed" not in reply.lower():
-                        send_email(st.session_state.gmail_service, email.sender, f"Re: {email.subject} [Replied]", reply)
-                        email.subject += " [Replied]"
-                        parsed_dt = extract_meeting_datetime(email.body, email_received_date=email.date)
-                        if parsed_dt:
-                            start_time = parsed_dt.replace(tzinfo=gettz(st.session_state.timezone))
-                            summary = generate_event_title(email.body)
-                            create_event(st.session_state.calendar_service, summary, start_time.isoformat())
-                        replied_count += 1
-                session.commit()
-                st.success(f"✅ {replied_count} email(s) replied.")
-            session.close()
-            st.session_state.selected_email_ids.clear()
-            st.rerun()
+                job, started = jobs.submit("Auto reply", reply_to_emails, st.session_state.gmail_service,
+                                           st.session_state.calendar_service,
+                                           list(st.session_state.selected_email_ids),
+                                           duration_minutes=st.session_state.meeting_duration,
+                                           timezone=st.session_state.timezone, key="auto_reply")
+                if started:
+                    st.session_state.selected_email_ids.clear()
+                else:
+                    st.info("Auto reply is already running.")
+
+        # Re-renders on its own every second while a job runs, without rerunning the whole page
+        @st.fragment(run_every=1 if any(job.is_active for job in jobs.jobs()) else None)
+        def render_jobs():
+            recent = jobs.jobs()[:JOBS_SHOWN]
+            if not recent:
+                return
+            st.markdown("---")
+            st.subheader("Background Jobs")
+            for job in recent:
+                if job.is_active:
+                    st.progress(job.progress, text=f"{job.name}: {job.message or job.state}")
+                    if job.cancel_requested:
+                        st.caption("Cancelling...")
+                    elif st.button("✖️ Cancel", key=f"cancel_job_{job.id}"):
+                        job.cancel()
+                elif job.state == DONE:
+                    st.success(f"{job.name}: {describe_result(job)}")
+                elif job.state == FAILED:
+                    st.error(f"{job.name} failed: {job.error}")
+                else:
+                    st.warning(f"{job.name} cancelled")
+            # Refresh cached views once per finished job
+            finished = {job.id for job in recent if not job.is_active}
+            if finished - st.session_state.seen_finished_jobs:
+                st.session_state.seen_finished_jobs |= finished
+                st.cache_data.clear()
+                st.rerun(scope="app")
+
+        render_jobs()
 
 # -------------------- Main --------------------
 st.title("📨 AI Email Assistant")
@@ -100,71 +153,130 @@ if not st.session_state.authenticated:
     st.warning("Please authenticate to proceed.")
     st.stop()
 
-init_db()
+prepare_database()
 session = SessionLocal()
-emails = session.query(Email).order_by(Email.date.desc()).all()
-df = pd.DataFrame([{
-    "ID": e.id,
-    "Subject": e.subject,
-    "Sender": e.sender,
-    "Date": e.date,
-    "Body": e.body
-} for e in emails])
+
+# Dashboard and Insights read the rollup tables maintained at ingestion; results are cached between reruns
+@st.cache_data(ttl=60)
+def load_overview_counts(today):
+    with SessionLocal() as s:
+        return get_overview_counts(s, today)
+
+@st.cache_data(ttl=60)
+def load_hourly_counts():
+    with SessionLocal() as s:
+        return pd.DataFrame(get_hourly_counts(s), columns=["Hour", "Count"])
+
+@st.cache_data(ttl=60)
+def load_daily_counts():
+    with SessionLocal() as s:
+        return pd.DataFrame(get_daily_counts(s), columns=["Date", "Count"])
+
+@st.cache_data(ttl=60)
+def load_top_senders(limit=10):
+    with SessionLocal() as s:
+        return pd.DataFrame(get_top_senders(s, limit), columns=["Sender", "Count"])
+
+# -------------------- Inbox Rows --------------------
+def render_email_row(row, snippet=None):
+    with st.expander(f"📧 {row.subject} - {row.sender}"):
+        st.write(f"**Date:** {row.date}")
+        st.write(f"**From:** {row.sender}")
+        if row.status:
+            st.caption(f"Status: {row.status}")
+        if snippet:
+            st.markdown(f"…{snippet}…")
+        # Bodies are only read from the database for expanded emails
+        if st.toggle("📄 Show body", key=f"body_{row.id}"):
+            st.write(get_email_body(session, row.id))
+
+        selected = st.checkbox("✅ Select this email", key=f"select_{row.id}")
+        if selected:
+            st.session_state.selected_email_ids.add(row.id)
+        else:
+            st.session_state.selected_email_ids.discard(row.id)
+
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            if st.button("🧠 Summarize", key=f"summary_{row.id}"):
+                st.success(summarize_email(get_email_body(session, row.id)))
+        with col2:
+            if st.button("✉️ Draft Reply", key=f"reply_{row.id}"):
+                from reply_index import reply_index  # Keeps NumPy off the app's startup path
+                body = get_email_body(session, row.id)
+                # A close enough past reply is offered for review instead of asking the model for a new draft
+                match = reply_index.lookup(body)
+                if match:
+                    st.caption(f"💡 Reply sent to a similar email ({match['similarity']:.0%} match)")
+                    st.info(match["reply"])
+                else:
+                    st.info(generate_reply(body))
+        with col3:
+            if st.button("📅 Schedule Meeting", key=f"meet_{row.id}"):
+                body = get_email_body(session, row.id)
+                meeting_dt = extract_meeting_datetime(body, row.date)
+                if meeting_dt:
+                    start_time = meeting_dt.replace(second=0, microsecond=0)
+                    summary = generate_event_title(body)
+                    link = create_event(st.session_state.calendar_service, summary, start_time.isoformat(),
+                                        duration_minutes=st.session_state.meeting_duration,
+                                        timezone=st.session_state.timezone)
+                    if link:
+                        st.success(f"Event Created! [View]({link})")
+                    else:
+                        st.error("Event creation failed.")
+                else:
+                    st.warning("No valid datetime found.")
 
 # -------------------- Dashboard --------------------
 if st.session_state.view == "Dashboard":
     st.header("📊 Overview")
     col1, col2, col3 = st.columns(3)
-    today = datetime.now().date()
-    today_count = len(df[df['Date'].dt.date == today]) if not df.empty and 'Date' in df.columns else 0
-    col1.metric("Total Emails", len(df))
-    col2.metric("Today's Emails", today_count)
-    col3.metric("Unique Senders", df['Sender'].nunique() if not df.empty else 0)
-
-    if not df.empty:
-        df['Hour'] = df['Date'].dt.hour
+    counts = load_overview_counts(datetime.now().date())
+    col1.metric("Total Emails", counts['total'])
+    col2.metric("Today's Emails", counts['today'])
+    col3.metric("Unique Senders", counts['unique_senders'])
+
+    hourly = load_hourly_counts()
+    if not hourly.empty:
         st.subheader("📈 Email Distribution by Hour")
-        fig = px.histogram(df, x='Hour', nbins=24, title='Hourly Email Volume')
+        fig = px.bar(hourly, x='Hour', y='Count', title='Hourly Email Volume')
         st.plotly_chart(fig, use_container_width=True)
 
 # -------------------- Inbox --------------------
 elif st.session_state.view == "Inbox":
     st.header("📥 Inbox")
-    if df.empty:
-        st.info("No emails fetched yet.")
+    search_query = st.text_input("🔍 Search emails", placeholder="Subject, sender or text")
+    # (date, id) of the last email on each previous page
+    st.session_state.setdefault("inbox_cursors", [])
+    cursors = st.session_state.inbox_cursors
+
+    if search_query.strip():
+        results = search_emails(session, search_query, limit=INBOX_PAGE_SIZE)
+        st.caption(f"{len(results)} match(es), best first")
+        for row in results:
+            render_email_row(row, snippet=row.snippet)
     else:
-        for _, row in df.iterrows():
-            with st.expander(f"📧 {row['Subject']} - {row['Sender']}"):
-                st.write(f"**Date:** {row['Date']}")
-                st.write(f"**From:** {row['Sender']}")
-                st.write(row['Body'])
-
-                selected = st.checkbox("✅ Select this email", key=f"select_{row['ID']}")
-                if selected:
-                    st.session_state.selected_email_ids.add(row['ID'])
-                else:
-                    st.session_state.selected_email_ids.discard(row['ID'])
-
-                col1, col2, col3 = st.columns(3)
-                with col1:
-                    if st.button("🧠 Summarize", key=f"summary_{row['ID']}"):
-                        st.success(summarize_email(row['Body']))
-                with col2:
-                    if st.button("✉️ Draft Reply", key=f"reply_{row['ID']}"):
-                        st.info(generate_reply(row['Body']))
-                with col3:
-                    if st.button("📅 Schedule Meeting", key=f"meet_{row['ID']}"):
-                        meeting_dt = extract_meeting_datetime(row['Body'], row['Date'])
-                        if meeting_dt:
-                            start_time = meeting_dt.replace(tzinfo=gettz(st.session_state.timezone))
-                            summary = generate_event_title(row['Body'])
-                            link = create_event(st.session_state.calendar_service, summary, start_time.isoformat())
-                            if link:
-                                st.success(f"Event Created! [View]({link})")
-                            else:
-                                st.error("Event creation failed.")
-                        else:
-                            st.warning("No valid datetime found.")
+        rows = list_email_headers(session, limit=INBOX_PAGE_SIZE + 1, before=cursors[-1] if cursors else None)
+        has_next_page = len(rows) > INBOX_PAGE_SIZE
+        rows = rows[:INBOX_PAGE_SIZE]
+
+        if not rows and not cursors:
+            st.info("No emails fetched yet.")
+        else:
+            for row in rows:
+                render_email_row(row)
+
+            col_prev, col_page, col_next = st.columns([1, 2, 1])
+            with col_prev:
+                if cursors and st.button("⬅️ Newer"):
+                    cursors.pop()
+                    st.rerun()
+            col_page.caption(f"Page {len(cursors) + 1}")
+            with col_next:
+                if has_next_page and st.button("Older ➡️"):
+                    cursors.append((rows[-1].date, rows[-1].id))
+                    st.rerun()
 
 # -------------------- AI Assistant Playground --------------------
 elif st.session_state.view == "AI Assistant":
@@ -192,21 +304,101 @@ elif st.session_state.view == "Calendar":
     time = st.time_input("Start Time")
     if st.button("Create Calendar Event"):
         dt = datetime.combine(date, time).replace(tzinfo=gettz(st.session_state.timezone))
-        link = create_event(st.session_state.calendar_service, title, dt.isoformat())
+        link = create_event(st.session_state.calendar_service, title, dt.isoformat(),
+                            duration_minutes=st.session_state.meeting_duration)
         if link:
             st.success(f"📅 Event created! [View]({link})")
 
 # -------------------- Insights --------------------
 elif st.session_state.view == "Insights":
     st.header("📊 Email Trends")
-    if not df.empty and 'Date' in df.columns:
+    daily = load_daily_counts()
+    if not daily.empty:
         st.subheader("Daily Volume")
-        daily = df.groupby(df['Date'].dt.date).size().reset_index(name='Count')
         st.bar_chart(daily.set_index('Date'))
 
         st.subheader("Top Senders")
-        top = df['Sender'].value_counts().head(10)
-        st.dataframe(top)
+        st.dataframe(load_top_senders(10).set_index('Sender'))
+
+# -------------------- Performance --------------------
+elif st.session_state.view == "Performance":
+    st.header("⏱️ Performance")
+    # The background service (`main.py serve`) runs in its own process and shares its numbers via METRICS_FILE
+    service_metrics = Metrics.load_file()
+    sources = ["This app"] + (["Background service"] if service_metrics else [])
+    source = st.radio("Source", sources, horizontal=True)
+    registry = service_metrics if source == "Background service" else metrics
+    if registry is metrics:
+        st.caption("Latency per stage since this app process started (percentiles are bucket upper bounds)."
+                   + ("" if METRICS_FILE else " Set METRICS_FILE to also see the background service."))
+    else:
+        written = datetime.fromtimestamp(os.path.getmtime(METRICS_FILE))
+        st.caption(f"Latency per stage of the background service, as written to {METRICS_FILE} at "
+                   f"{written:%H:%M:%S} (percentiles are bucket upper bounds).")
+    snapshot = registry.snapshot()
+    if not snapshot["stages"]:
+        st.info("No timings recorded yet. Fetch or reply to some emails first.")
+    else:
+        stages = pd.DataFrame(snapshot["stages"]).rename(columns={
+            "stage": "Stage", "calls": "Calls", "errors": "Errors", "error_rate": "Error Rate",
+            "total_s": "Total (s)", "mean_ms": "Mean (ms)", "p50_ms": "p50 (ms)", "p95_ms": "p95 (ms)",
+        }).sort_values("Total (s)", ascending=False)
+
+        st.subheader("Where the time goes")
+        st.plotly_chart(px.bar(stages, x="Stage", y="Total (s)", hover_data=["Calls", "Mean (ms)"]),
+                        use_container_width=True)
+        st.dataframe(stages.set_index("Stage").style.format({
+            "Error Rate": "{:.1%}", "Total (s)": "{:.2f}", "Mean (ms)": "{:.1f}",
+            "p50 (ms)": "{:.0f}", "p95 (ms)": "{:.0f}",
+        }))
+
+    tokens = [(dict(labels), value) for (name, labels), value in snapshot["counters"].items()
+              if name == "llm_tokens_total"]
+    if tokens:
+        st.subheader("🔤 LLM Tokens by Task")
+        token_df = pd.DataFrame([{**labels, "Tokens": value} for labels, value in tokens])
+        st.dataframe(token_df.pivot_table(index="task", columns="direction", values="Tokens", aggfunc="sum",
+                                          fill_value=0))
+
+    compaction = {}
+    for (name, labels), value in snapshot["counters"].items():
+        if name in ("prompt_tokens_raw_total", "prompt_tokens_sent_total"):
+            column = "Raw" if name == "prompt_tokens_raw_total" else "Sent"
+            compaction.setdefault(dict(labels)["task"], {})[column] = value
+    if compaction:
+        st.subheader("✂️ Prompt Compaction")
+        compaction_df = pd.DataFrame.from_dict(compaction, orient="index").fillna(0)
+        compaction_df["Saved"] = 1 - compaction_df["Sent"] / compaction_df["Raw"]
+        st.dataframe(compaction_df.style.format({"Raw": "{:.0f}", "Sent": "{:.0f}", "Saved": "{:.0%}"}))
+
+    st.subheader("🔌 Google API Clients")
+    if registry is metrics:
+        client_stats = get_client_factory().stats()
+    else:
+        client_stats = {name[len("google_client_"):]: int(value) for (name, _), value in snapshot["gauges"].items()
+                        if name.startswith("google_client_")}
+    col1, col2, col3, col4, col5 = st.columns(5)
+    col1.metric("Connections Created", client_stats.get("http_clients", 0))
+    col2.metric("Reused from Pool", client_stats.get("connection_reuses", 0))
+    col3.metric("Open Sockets", client_stats.get("open_connections", 0))
+    col4.metric("Client Reuses", client_stats.get("service_reuses", 0))
+    col5.metric("Token Refreshes", client_stats.get("credential_refreshes", 0))
+
+    st.subheader("♻️ Reply Reuse")
+    from reply_index import reply_index
+    reused = sum(value for (name, _), value in snapshot["counters"].items() if name == "reply_reuse_total")
+    col1, col2, col3 = st.columns(3)
+    stored = (reply_index.stats()["replies"] if registry is metrics
+              else int(snapshot["gauges"].get(("reply_index_size", ()), 0)))
+    col1.metric("Stored Replies", stored)
+    col2.metric("Replies Reused", int(reused))
+    col3.metric("Suggestion Threshold", f"{reply_index.suggest_threshold:.0%}")
+
+    with st.expander("Prometheus metrics"):
+        st.code(registry.render_prometheus(), language="text")
+    if registry is metrics and st.button("Reset Metrics"):
+        metrics.reset()
+        st.rerun()
 
 # -------------------- Settings --------------------
 elif st.session_state.view == "Settings":
@@ -214,6 +406,18 @@ elif st.session_state.view == "Settings":
     st.subheader("🔢 Max Emails to Fetch")
     st.session_state.max_emails = st.slider("How many emails to fetch?", 5, 50, st.session_state.max_emails)
 
+    st.subheader("📚 Backfill Mailbox History")
+    backfill_query = st.text_input("Gmail search query (leave empty for all mail)", value="")
+    backfill_limit = st.number_input("Maximum messages to load (0 = no limit)", min_value=0, value=1000, step=500)
+    if st.button("Start Backfill"):
+        job, started = get_job_manager().submit("Backfill", backfill_emails, st.session_state.gmail_service,
+                                                query=backfill_query, max_emails=backfill_limit or None,
+                                                key="backfill")
+        if started:
+            st.success("📚 Backfill started; progress is shown in the sidebar.")
+        else:
+            st.info("A backfill is already running.")
+
     st.subheader("🤖 Auto-Reply Toggle")
     st.session_state.auto_reply_enabled = st.checkbox("Enable Auto Reply", value=st.session_state.auto_reply_enabled)
 
@@ -233,6 +437,16 @@ elif st.session_state.view == "Settings":
     st.subheader("🧠 AI Model Temperature")
     st.session_state.ai_temperature = st.slider("AI Temperature (creativity)", 0.0, 1.0, st.session_state.ai_temperature, step=0.05)
 
+    st.subheader("🗄️ AI Response Cache")
+    cache_stats = llm_cache.stats()
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Hits", cache_stats["hits"])
+    col2.metric("Misses", cache_stats["misses"])
+    col3.metric("Hit Rate", f"{cache_stats['hit_rate']:.0%}")
+    if st.button("Clear AI Cache"):
+        llm_cache.clear()
+        st.success("AI cache cleared.")
+
 # -------------------- Footer --------------------
 session.close()
 st.markdown("---")
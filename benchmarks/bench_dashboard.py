@@ -0,0 +1,79 @@
+"""
+Dashboard benchmark: loads synthetic emails into a throwaway database, then compares building the
+Dashboard/Insights numbers from a DataFrame of the whole table with reading the rollup tables.
+Run from the repository root:
+
+    python -m benchmarks.bench_dashboard --rows 1000000
+"""
+import time
+
+import pandas as pd
+
+from benchmarks._common import make_parser, synthetic_rows, temp_database
+from database import (
+    Email,
+    bulk_insert_emails,
+    get_daily_counts,
+    get_hourly_counts,
+    get_overview_counts,
+    get_top_senders,
+    update_rollups,
+)
+
+LOAD_CHUNK = 50_000
+
+
+def dataframe_dashboard(session, today):
+    rows = session.query(Email.id, Email.sender, Email.date).all()
+    df = pd.DataFrame(rows, columns=["ID", "Sender", "Date"])
+    return (
+        len(df),
+        len(df[df['Date'].dt.date == today]),
+        df['Sender'].nunique(),
+        df['Date'].dt.hour.value_counts(),
+        df.groupby(df['Date'].dt.date).size(),
+        df['Sender'].value_counts().head(10),
+    )
+
+
+def rollup_dashboard(session, today):
+    return (
+        get_overview_counts(session, today),
+        get_hourly_counts(session),
+        get_daily_counts(session),
+        get_top_senders(session, 10),
+    )
+
+
+def timed(label, func, *args, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - started)
+    print(f"{label:<24} best {min(timings) * 1000:10.2f} ms")
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with temp_database() as Session:
+        started = time.perf_counter()
+        with Session() as session:
+            for start in range(0, args.rows, LOAD_CHUNK):
+                rows = synthetic_rows(min(LOAD_CHUNK, args.rows - start), f"c{start:08x}-")
+                update_rollups(session, bulk_insert_emails(session, rows))
+                session.commit()
+        print(f"loaded {args.rows} rows in {time.perf_counter() - started:.1f}s")
+
+        today = synthetic_rows(1, "x")[0]['date'].date()
+        with Session() as session:
+            timed("full-table DataFrame", dataframe_dashboard, session, today, repeat=args.repeat)
+            timed("rollup tables", rollup_dashboard, session, today, repeat=args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Meeting-datetime extraction benchmark: compares running dateparser over the whole body with the
+candidate-span pre-filter in calendar_integration on long emails, and checks each result against
+the expected datetime. Run from the repository root:
+
+    python -m benchmarks.bench_datetime --repeat 3
+
+The old search is expected to differ: it ran every language over the whole body, so words in the
+filler text were read as dates ("Tuesday at 3pm" came back as Wednesday 00:00, "tomorrow at 10:30"
+lost its time). The new extractor only parses English windows around times and dates, which gives
+the expected result on every fixture; tests/test_calendar_integration.py asserts the same cases.
+"""
+import time
+from datetime import datetime
+
+from dateparser import parse
+from dateparser.search import search_dates
+
+from benchmarks._common import make_parser
+from calendar_integration import _extract_meeting_datetime, extract_meeting_datetime
+
+FILLER = ("Thanks again for the detailed notes from the workshop. The team reviewed the proposal and "
+          "we think the scope is about right, although the budget section needs another pass. ") * 30
+RECEIVED = datetime(2024, 3, 4, 9, 30)
+
+FIXTURES = {
+    "weekday + time": (FILLER + "Could we meet on Tuesday at 3pm to go over it?", datetime(2024, 3, 5, 15, 0)),
+    "relative": ("Quick one: can we do a call tomorrow at 10:30? " + FILLER, datetime(2024, 3, 5, 10, 30)),
+    "month + day": (FILLER + "The interview is scheduled for March 14 at 11 am." + FILLER,
+                    datetime(2024, 3, 14, 11, 0)),
+    "numeric date": (FILLER + "Deadline moved to 12/05/2024, meeting then." + FILLER, datetime(2024, 12, 5, 0, 0)),
+    "no date": (FILLER * 2, None),
+}
+
+
+def old_extract_meeting_datetime(text, email_received_date):
+    settings = {'RELATIVE_BASE': email_received_date, 'PREFER_DATES_FROM': 'future'}
+    results = search_dates(text, settings=settings)
+    if results:
+        for _, dt in results:
+            if dt:
+                return dt
+    return parse(text, settings=settings)
+
+
+def uncached_extract_meeting_datetime(text, email_received_date):
+    _extract_meeting_datetime.cache_clear()
+    return extract_meeting_datetime(text, email_received_date)
+
+
+def timed(func, text, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = func(text, RECEIVED)
+    return (time.perf_counter() - started) / repeat * 1000, result
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'fixture':<16} {'old ms':>9} {'new ms':>9} {'memo ms':>9}  old ok  new ok")
+    for name, (text, expected) in FIXTURES.items():
+        old_ms, old_dt = timed(old_extract_meeting_datetime, text, args.repeat)
+        new_ms, new_dt = timed(uncached_extract_meeting_datetime, text, args.repeat)
+        memo_ms, _ = timed(extract_meeting_datetime, text, args.repeat)
+        print(f"{name:<16} {old_ms:9.1f} {new_ms:9.1f} {memo_ms:9.3f}  {old_dt == expected!s:<6}  "
+              f"{new_dt == expected!s:<6} ({new_dt})")
+
+
+if __name__ == "__main__":
+    main()
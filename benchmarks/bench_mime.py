@@ -0,0 +1,94 @@
+"""
+MIME body extraction benchmark: compares the old top-level-only parser (base64 decode of the
+whole part + html.parser) with mime_parser.extract_body on payloads shaped like Gmail API responses.
+Run from the repository root:
+
+    python -m benchmarks.bench_mime --repeat 50
+"""
+import base64
+import time
+
+from bs4 import BeautifulSoup
+
+from benchmarks._common import make_parser
+from mime_parser import extract_body
+
+
+def encode(text):
+    return base64.urlsafe_b64encode(text.encode("utf-8")).decode("ascii")
+
+
+def leaf(mime_type, text, charset="utf-8"):
+    return {
+        "mimeType": mime_type,
+        "filename": "",
+        "headers": [{"name": "Content-Type", "value": f'{mime_type}; charset="{charset}"'}],
+        "body": {"size": len(text), "data": encode(text)},
+    }
+
+
+def attachment(name, size):
+    return {"mimeType": "application/pdf", "filename": name,
+            "body": {"size": size, "attachmentId": "ANGjdJ_attachment"}}
+
+
+def multipart(subtype, *parts):
+    return {"mimeType": f"multipart/{subtype}", "filename": "", "body": {"size": 0}, "parts": list(parts)}
+
+
+PLAIN = "Hi,\n\nCan we meet on Tuesday at 3pm to go over the draft?\n\nThanks,\nSam\n"
+HTML = "<html><head><style>p{color:red}</style></head><body><p>" + PLAIN.replace("\n", "<br>") + "</p></body></html>"
+NEWSLETTER = ("<html><body>" + "<table><tr><td><a href='https://t.example.com/c?u=1'>Deal</a>"
+              "<p>Huge savings this week on everything.</p></td></tr></table>" * 20000 + "</body></html>")
+
+FIXTURES = {
+    "text/plain only": leaf("text/plain", PLAIN),
+    "text/html only": leaf("text/html", HTML),
+    "alternative": multipart("alternative", leaf("text/plain", PLAIN), leaf("text/html", HTML)),
+    "mixed > alternative + pdf": multipart("mixed", multipart("alternative", leaf("text/plain", PLAIN),
+                                                              leaf("text/html", HTML)),
+                                           attachment("invoice.pdf", 2_000_000)),
+    "related > html + images": multipart("related", leaf("text/html", HTML), attachment("logo.png", 40_000)),
+    "large newsletter (html)": multipart("alternative", leaf("text/html", NEWSLETTER)),
+}
+
+
+def old_parse_email_body(payload):
+    parts = payload.get("parts")
+    if parts:
+        for part in parts:
+            mime_type = part.get("mimeType")
+            data = part.get("body", {}).get("data")
+            if mime_type == "text/plain" and data:
+                return base64.urlsafe_b64decode(data).decode("utf-8")
+            elif mime_type == "text/html" and data:
+                html = base64.urlsafe_b64decode(data).decode("utf-8")
+                return BeautifulSoup(html, "html.parser").get_text()
+    else:
+        data = payload.get("body", {}).get("data")
+        if data:
+            return base64.urlsafe_b64decode(data).decode("utf-8")
+    return ""
+
+
+def timed(func, payload, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = func(payload)
+    return (time.perf_counter() - started) / repeat * 1000, result
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'fixture':<28} {'old ms':>9} {'new ms':>9} {'old chars':>10} {'new chars':>10}")
+    for name, payload in FIXTURES.items():
+        old_ms, old_text = timed(old_parse_email_body, payload, args.repeat)
+        new_ms, new_text = timed(extract_body, payload, args.repeat)
+        print(f"{name:<28} {old_ms:9.2f} {new_ms:9.2f} {len(old_text):>10} {len(new_text):>10}")
+
+
+if __name__ == "__main__":
+    main()
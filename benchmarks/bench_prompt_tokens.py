@@ -0,0 +1,94 @@
+"""
+Prompt-size benchmark: runs prompt_prep.prepare_email_text over a fixture corpus shaped like the
+bodies parse_email_body produces (reply chains, legal footers, tracking links, HTML-derived text)
+and reports the estimated input tokens before and after, per fixture and per task.
+Run from the repository root:
+
+    python -m benchmarks.bench_prompt_tokens --repeat 20
+"""
+import random
+import time
+
+from benchmarks._common import make_parser
+from prompt_prep import DEFAULT_BUDGETS, estimate_tokens, prepare_email_text
+
+SENTENCES = [
+    "Thanks for sending over the updated proposal.",
+    "The budget numbers look reasonable to me.",
+    "Could we move the review to Thursday at 3pm?",
+    "Legal still needs to sign off on the contract.",
+    "Do you have the final slides ready?",
+    "I have attached the revised timeline for your review.",
+    "Let me know if anything else is needed from our side.",
+]
+SIGNATURE = "--\nAlex Example\nDirector of Operations\nExample Corp | +1 555 0100\nhttps://www.example.com"
+DISCLAIMER = ("CONFIDENTIALITY NOTICE: This e-mail message, including any attachments, is for the sole use of "
+              "the intended recipient(s) and may contain confidential and privileged information. If you are "
+              "not the intended recipient, please contact the sender by reply e-mail and destroy all copies. "
+              "Please consider the environment before printing this email.")
+TRACKING = "https://click.mailer.example.com/ls/click?upn=" + "aGVsbG8td29ybGQ" * 12
+
+
+def paragraph(rng, sentences):
+    return " ".join(rng.choice(SENTENCES) for _ in range(sentences))
+
+
+def reply_chain(rng, depth):
+    body = f"Hi team,\n\n{paragraph(rng, 4)}\n\n{SIGNATURE}"
+    for i in range(depth):
+        quoted = f"{paragraph(rng, 6)}\n\n{SIGNATURE}\n\n{DISCLAIMER}"
+        body += (f"\n\nOn Mon, Jan {i + 1}, 2024 at 10:00 AM Someone <someone@example.com> wrote:\n"
+                 + "\n".join(f"> {line}" for line in quoted.splitlines()))
+    return body
+
+
+def html_newsletter(rng, items):
+    blocks = []
+    for _ in range(items):
+        blocks.append(f"\n\n\n   {paragraph(rng, 2)}   \n\n Read more: {TRACKING}\n\n |  |  | \n\n")
+    footer = ("\n\nYou are receiving this email because you signed up. Unsubscribe: " + TRACKING
+              + "\nManage preferences | View in browser\n")
+    return "Weekly update" + "".join(blocks) + footer
+
+
+def long_plain(rng, paragraphs):
+    return "Hi Sam,\n\n" + "\n\n".join(paragraph(rng, 6) for _ in range(paragraphs)) + "\n\nThanks,\nAlex"
+
+
+def fixtures(rng):
+    return {
+        "short message": f"Hi,\n\n{paragraph(rng, 3)}\n\n{SIGNATURE}",
+        "message + legal footer": f"Hi,\n\n{paragraph(rng, 4)}\n\n{SIGNATURE}\n\n{DISCLAIMER}",
+        "reply chain (10 deep)": reply_chain(rng, 10),
+        "html newsletter": html_newsletter(rng, 40),
+        "long report": long_plain(rng, 60),
+    }
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--task", choices=sorted(DEFAULT_BUDGETS), default=None,
+                        help="only report this task (default: all)")
+    args = parser.parse_args()
+
+    corpus = fixtures(random.Random(42))
+    tasks = [args.task] if args.task else sorted(DEFAULT_BUDGETS)
+    for task in tasks:
+        print(f"\ntask={task} (budget {DEFAULT_BUDGETS[task]} tokens)")
+        print(f"{'fixture':<26} {'raw tok':>8} {'sent tok':>9} {'saved':>7} {'ms/call':>8}")
+        raw_total = sent_total = 0
+        for name, text in corpus.items():
+            started = time.perf_counter()
+            for _ in range(args.repeat):
+                prepared = prepare_email_text(text, task)
+            elapsed_ms = (time.perf_counter() - started) / args.repeat * 1000
+            raw, sent = estimate_tokens(text), estimate_tokens(prepared)
+            raw_total += raw
+            sent_total += sent
+            print(f"{name:<26} {raw:>8} {sent:>9} {1 - sent / raw:>7.0%} {elapsed_ms:>8.2f}")
+        print(f"{'total':<26} {raw_total:>8} {sent_total:>9} {1 - sent_total / raw_total:>7.0%}")
+
+
+if __name__ == "__main__":
+    main()
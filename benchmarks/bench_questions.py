@@ -0,0 +1,73 @@
+"""
+Question-extraction benchmark: runs each nlp_utils.extract_questions tier over a synthetic corpus
+of long reply-chain emails and checks that every tier finds the same questions as the full parser.
+Run from the repository root:
+
+    python -m benchmarks.bench_questions --emails 200
+"""
+import random
+import time
+
+from benchmarks._common import make_parser
+from nlp_utils import extract_questions, extract_questions_batch
+
+SENTENCES = [
+    "Thanks for getting back to me so quickly.",
+    "I have attached the revised proposal for your review.",
+    "Could we move the call to Thursday afternoon?",
+    "The budget numbers look reasonable to me.",
+    "Do you have the final slides ready?",
+    "Let me know if anything else is needed from our side.",
+    "Is the venue confirmed for next month?",
+    "We are still waiting on legal to sign off.",
+]
+
+
+def synthetic_email(rng, quoted_messages):
+    body = " ".join(rng.choice(SENTENCES) for _ in range(rng.randint(3, 8)))
+    parts = [f"Hi team,\n\n{body}\n\n--\nAlex Example\nProject Lead"]
+    for i in range(quoted_messages):
+        quoted = " ".join(rng.choice(SENTENCES) for _ in range(rng.randint(5, 15)))
+        parts.append(f"On Mon, Jan {i + 1}, 2024 at 10:00 AM Someone <someone@example.com> wrote:\n"
+                     + "\n".join(f"> {line}" for line in quoted.split(". ")))
+    return "\n\n".join(parts)
+
+
+def timed(label, func):
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<32} {elapsed * 1000:9.1f} ms")
+    return result
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument("--emails", type=int, default=200)
+    parser.add_argument("--quoted", type=int, default=10, help="quoted messages per email")
+    parser.add_argument("--n-process", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    corpus = [synthetic_email(rng, args.quoted) for _ in range(args.emails)]
+    # Load the pipelines up front so model loading isn't counted
+    extract_questions("Warm up?", mode="parser")
+    extract_questions("Warm up?", mode="sentencizer")
+
+    baseline = timed("parser, raw text (old behaviour)",
+                     lambda: [extract_questions(t, mode="parser", strip_quotes=False) for t in corpus])
+    parser_clean = timed("parser, quotes stripped", lambda: [extract_questions(t, mode="parser") for t in corpus])
+    sentencizer = timed("sentencizer", lambda: [extract_questions(t, mode="sentencizer") for t in corpus])
+    batch = timed("sentencizer, nlp.pipe batch",
+                  lambda: extract_questions_batch(corpus, mode="sentencizer", n_process=args.n_process))
+    fast = timed("fast regex", lambda: [extract_questions(t, mode="fast") for t in corpus])
+
+    for label, result in [("sentencizer", sentencizer), ("nlp.pipe batch", batch), ("fast regex", fast)]:
+        same = sum(a == b for a, b in zip(result, parser_clean))
+        print(f"{label:<16} matches parser on {same}/{len(corpus)} emails")
+    quoted_only = sum(len(a) - len(b) for a, b in zip(baseline, parser_clean))
+    print(f"questions dropped from quoted history: {quoted_only}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Reply index benchmark: stores synthetic (email, reply) pairs in a throwaway database, then times
+loading the MinHash index, similar-reply suggestions for near-duplicate and unrelated emails, and
+the exact same-sender lookup used for unattended reuse.
+Run from the repository root:
+
+    python -m benchmarks.bench_reply_index --replies 100000 --queries 500
+"""
+import random
+import statistics
+import time
+
+from sqlalchemy import insert
+
+from benchmarks._common import make_parser, temp_database
+from database import SentReply
+from reply_index import ReplyIndex, canonical_text, minhash, text_hash
+
+LOAD_CHUNK = 10_000
+NAMES = ["Sam", "Priya", "Alex", "Jordan", "Wei", "Maria", "Tom", "Aisha", "Lena", "Omar"]
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
+TOPICS = ["the quarterly budget", "the onboarding plan", "invoice 4471", "the vendor contract",
+          "the release schedule", "the hiring pipeline", "the support backlog", "the marketing launch",
+          "the data migration", "the security review", "the office move", "the partner renewal"]
+PRODUCTS = ["dashboard", "mobile app", "API", "billing page", "export tool", "sync client"]
+TEMPLATES = [
+    "Hi {name}, could we schedule a call on {day} at {hour}pm to go over {topic}? "
+    "I would like to agree on next steps before the end of the week. Thanks, {sender}",
+    "Hello, I am having trouble logging into the {product} since this morning. It shows an error "
+    "after I enter my password and I need access for {topic}. Can you help? Regards, {sender}",
+    "Dear {name}, please find attached the latest numbers for {topic}. Let me know if you have "
+    "questions or if we should discuss them on {day}. Best, {sender}",
+    "Hey {name}, quick question about {topic}: is the deadline still {day}, or has it moved? "
+    "The {product} team is waiting on an answer. Cheers, {sender}",
+]
+
+
+def synthetic_email(rng, template=None):
+    template = template if template is not None else rng.choice(TEMPLATES)
+    return template.format(name=rng.choice(NAMES), sender=rng.choice(NAMES), day=rng.choice(DAYS),
+                           hour=rng.randint(1, 5), topic=rng.choice(TOPICS), product=rng.choice(PRODUCTS))
+
+
+def unrelated_email(rng, words=60):
+    vocabulary = [f"word{i}" for i in range(5000)]
+    return " ".join(rng.choice(vocabulary) for _ in range(words))
+
+
+def percentiles(timings):
+    timings = sorted(timings)
+    return statistics.median(timings) * 1000, timings[int(len(timings) * 0.95)] * 1000
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument("--replies", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+    rng = random.Random(42)
+
+    with temp_database() as Session:
+        started = time.perf_counter()
+        with Session() as session:
+            for start in range(0, args.replies, LOAD_CHUNK):
+                rows = []
+                for i in range(start, min(start + LOAD_CHUNK, args.replies)):
+                    text = canonical_text(synthetic_email(rng))
+                    rows.append({"email_id": f"m{i:08x}", "sender": rng.choice(NAMES), "email_text": text,
+                                 "text_hash": text_hash(text), "reply": f"Thanks for your email ({i}).",
+                                 "signature": minhash(text).tobytes()})
+                session.execute(insert(SentReply), rows)
+                session.commit()
+        elapsed = time.perf_counter() - started
+        print(f"stored {args.replies} replies in {elapsed:.1f}s "
+              f"({elapsed / args.replies * 1e6:.0f} µs/reply incl. MinHash)")
+
+        index = ReplyIndex(session_factory=Session, enabled=True)
+        started = time.perf_counter()
+        index.stats()
+        print(f"index load               {(time.perf_counter() - started) * 1000:10.1f} ms")
+
+        queries = {
+            "near-duplicate": [synthetic_email(rng) for _ in range(args.queries)],
+            "unrelated": [unrelated_email(rng) for _ in range(args.queries)],
+        }
+        print(f"{'queries':<16} {'p50 ms':>8} {'p95 ms':>8} {'suggested':>10} {'exact':>7}")
+        for label, texts in queries.items():
+            timings, suggested, exact = [], 0, 0
+            for text in texts:
+                started = time.perf_counter()
+                suggested += index.lookup(text) is not None
+                timings.append(time.perf_counter() - started)
+                exact += index.reusable_reply(text, rng.choice(NAMES)) is not None
+            p50, p95 = percentiles(timings)
+            print(f"{label:<16} {p50:>8.2f} {p95:>8.2f} {suggested / len(texts):>10.0%} {exact / len(texts):>7.0%}")
+
+        signature = minhash(canonical_text(queries["near-duplicate"][0]))
+        timings = []
+        for _ in range(args.queries):
+            started = time.perf_counter()
+            index.nearest(signature)
+            timings.append(time.perf_counter() - started)
+        p50, p95 = percentiles(timings)
+        print(f"{'nearest() only':<16} {p50:>8.2f} {p95:>8.2f}")
+
+        timings = []
+        for text in queries["near-duplicate"]:
+            started = time.perf_counter()
+            index.reusable_reply(text, rng.choice(NAMES))
+            timings.append(time.perf_counter() - started)
+        p50, p95 = percentiles(timings)
+        print(f"{'exact reuse':<16} {p50:>8.2f} {p95:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
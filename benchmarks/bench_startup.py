@@ -0,0 +1,59 @@
+"""
+Startup-time benchmark: measures a cold import of `main` and `app` in fresh interpreters
+and lists the slowest imports reported by `python -X importtime`.
+Run from the repository root:
+
+    python -m benchmarks.bench_startup --runs 5
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks._common import make_parser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def cold_import(module):
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", f"import {module}"], cwd=ROOT,
+                            capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    # Importing app outside `streamlit run` may stop early at st.stop(); the import cost is still measured.
+    return elapsed, result.returncode
+
+
+def slowest_imports(module, top):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=ROOT,
+                            capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        # Lines look like "import time:  <self us> | <cumulative us> | <module>"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="number of slowest imports to list")
+    args = parser.parse_args()
+
+    for module in ("main", "app"):
+        timings = []
+        for _ in range(args.runs):
+            elapsed, returncode = cold_import(module)
+            timings.append(elapsed)
+        print(f"import {module:<5} median {statistics.median(timings):6.3f}s  "
+              f"min {min(timings):6.3f}s  max {max(timings):6.3f}s  (exit code {returncode})")
+        for cumulative_us, name in slowest_imports(module, args.top):
+            print(f"    {cumulative_us / 1e6:6.3f}s  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Microbenchmark for the email storage layer.
+
+Inserts synthetic Email rows into a throwaway SQLite database, once with the old
+per-row SELECT + session.add loop and once with database.bulk_insert_emails.
+Run from the repository root:
+
+    python -m benchmarks.bench_storage --rows 100000
+"""
+import time
+
+from benchmarks._common import make_parser, synthetic_rows, temp_database
+from database import Email, bulk_insert_emails
+
+
+def run_naive(Session, rows):
+    session = Session()
+    for row in rows:
+        if not session.query(Email).filter_by(id=row['id']).first():
+            session.add(Email(**row))
+    session.commit()
+    session.close()
+
+
+def run_bulk(Session, rows):
+    session = Session()
+    bulk_insert_emails(session, rows)
+    session.commit()
+    session.close()
+
+
+def timed(label, func, Session, rows):
+    started = time.perf_counter()
+    func(Session, rows)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {len(rows):>8} rows  {elapsed:8.2f}s  {len(rows) / elapsed:>10.0f} rows/s")
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument("--rows", type=int, default=100_000, help="rows for the bulk insert")
+    parser.add_argument("--naive-rows", type=int, default=10_000, help="rows for the per-row baseline (0 to skip)")
+    args = parser.parse_args()
+
+    with temp_database() as Session:
+        if args.naive_rows:
+            timed("per-row select + add", run_naive, Session, synthetic_rows(args.naive_rows, "n"))
+        rows = synthetic_rows(args.rows, "b")
+        timed("bulk_insert_emails", run_bulk, Session, rows)
+        timed("bulk_insert_emails (dupes)", run_bulk, Session, rows)
+
+
+if __name__ == "__main__":
+    main()
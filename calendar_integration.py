@@ -1,62 +1,152 @@
+import re
+import time
+from functools import lru_cache
 from dateparser import parse
 from dateparser.search import search_dates
-from datetime import timedelta
+from datetime import datetime, timedelta
 from googleapiclient.errors import HttpError
 from dateutil.tz import gettz  # ✅ For correct timezone handling
+from metrics import metrics
+
+# Only these short spans around likely date/time expressions are handed to dateparser
+_WEEKDAYS = r"mon(?:day)?|tue(?:s|sday)?|wed(?:nesday)?|thu(?:rs|rsday)?|fri(?:day)?|sat(?:urday)?|sun(?:day)?"
+_MONTHS = (r"jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?"
+           r"|sep(?:t|tember)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?")
+_RELATIVE = (r"today|tonight|tomorrow|yesterday|noon|midnight|next\s+(?:week|month|year)"
+             r"|this\s+(?:week|morning|afternoon|evening)|in\s+\d+\s+(?:minutes?|hours?|days?|weeks?|months?)")
+_TIME = r"\b\d{1,2}(?::\d{2})?\s*(?:[ap]\.?m\b\.?)|\b\d{1,2}:\d{2}\b"
+_NUMERIC_DATE = r"\b\d{1,4}[/.-]\d{1,2}(?:[/.-]\d{2,4})?\b"
+CANDIDATE_RE = re.compile(rf"\b(?:{_WEEKDAYS}|{_MONTHS}|{_RELATIVE})\b|{_TIME}|{_NUMERIC_DATE}", re.IGNORECASE)
+CANDIDATE_CONTEXT = 40  # characters kept on each side of a match
+# search_dates reads "March 14 at 11 am" as the year 2111 and drops the hour of "tomorrow at 11 am";
+# written as "11:00 am" both parse correctly
+HOUR_ONLY_RE = re.compile(r"\b(\d{1,2})\s*([ap])\.?m\b\.?", re.IGNORECASE)
+DATEPARSER_LANGUAGES = ['en']
+BASE_SETTINGS = {'PREFER_DATES_FROM': 'future'}
+
+def candidate_spans(text, context=CANDIDATE_CONTEXT):
+    """
+    Returns short windows of `text` around possible date/time expressions, in order, with overlapping
+    windows merged.
+    """
+    spans = []
+    for match in CANDIDATE_RE.finditer(text):
+        start, end = max(match.start() - context, 0), min(match.end() + context, len(text))
+        # Widen to whole words so dateparser never sees a truncated token
+        if start:
+            start = text.rfind(" ", 0, start) + 1
+        next_space = text.find(" ", end)
+        end = next_space if next_space != -1 else len(text)
+        if spans and start <= spans[-1][1]:
+            spans[-1][1] = end
+        else:
+            spans.append([start, end])
+    return [text[start:end] for start, end in spans]
+
+def _with_minutes(window):
+    return HOUR_ONLY_RE.sub(lambda m: f"{m.group(1)}:00 {m.group(2).lower()}m", window)
 
 def extract_meeting_datetime(text, email_received_date):
     """
     Extracts a datetime object from natural language text using the context of the email's received date.
     """
-    settings = {
-        'RELATIVE_BASE': email_received_date,
-        'PREFER_DATES_FROM': 'future'
-    }
+    windows = [_with_minutes(window) for window in candidate_spans(text)]
+    if not windows:
+        return None
+    # Cached on the short candidate windows rather than the whole body
+    return _extract_meeting_datetime(tuple(windows), email_received_date)
 
-    # Use search_dates to find all possible datetime expressions
-    results = search_dates(text, settings=settings)
-    if results:
-        for _, dt in results:
+@lru_cache(maxsize=1024)
+def _extract_meeting_datetime(windows, email_received_date):
+    settings = {**BASE_SETTINGS, 'RELATIVE_BASE': email_received_date}
+
+    with metrics.timer('dateparser'):
+        # Use search_dates to find all possible datetime expressions
+        for window in windows:
+            results = search_dates(window, languages=DATEPARSER_LANGUAGES, settings=settings)
+            if results:
+                for _, dt in results:
+                    if dt:
+                        return dt
+
+        # Fallback if no expressions matched
+        for window in windows:
+            dt = parse(window, languages=DATEPARSER_LANGUAGES, settings=settings)
             if dt:
                 return dt
+        return None
 
-    # Fallback if no expressions matched
-    return parse(text, settings=settings)
 
+DEFAULT_TIMEZONE = 'Asia/Kolkata'
+EVENT_SOURCE = 'email_assistant'  # Tags events we create, in their private extended properties
 
-def create_event(calendar_service, summary, event_start_time_str):
+def _time_zone_name(start_dt, timezone):
     """
-    Creates an event in Google Calendar starting at the parsed time with a default 1-hour duration.
+    IANA name of the zone `start_dt` is in: its own zone's name when it has one (zoneinfo), else
+    `timezone` if that zone has the same offset at that time. None when the zone is unknown.
     """
-    start_dt = parse(event_start_time_str)
-    if not start_dt:
-        print("⚠️ Could not parse start time.")
-        return None
+    name = getattr(start_dt.tzinfo, 'key', None)
+    if name:
+        return name
+    if start_dt.utcoffset() == start_dt.replace(tzinfo=gettz(timezone)).utcoffset():
+        return timezone
+    return None
 
-    # Convert to IST (Asia/Kolkata)
-    start_dt = start_dt.replace(tzinfo=gettz("Asia/Kolkata"))
-    end_dt = start_dt + timedelta(hours=1)
+def build_event(summary, start_dt, duration_minutes=60, timezone=DEFAULT_TIMEZONE, thread_id=None):
+    """
+    Builds a Calendar event body. Naive start times are taken to be in `timezone`; aware ones keep
+    their own zone. If that zone has no known name, the event has no timeZone and Calendar uses the
+    UTC offset in dateTime.
+    """
+    if start_dt.tzinfo is None:
+        start_dt = start_dt.replace(tzinfo=gettz(timezone))
+    end_dt = start_dt + timedelta(minutes=duration_minutes)
+    private = {'source': EVENT_SOURCE}
+    if thread_id:
+        private['threadId'] = thread_id
 
-    event = {
+    start, end = {'dateTime': start_dt.isoformat()}, {'dateTime': end_dt.isoformat()}
+    zone_name = _time_zone_name(start_dt, timezone)
+    if zone_name:
+        start['timeZone'] = end['timeZone'] = zone_name
+    return {
         'summary': summary,
-        'start': {
-            'dateTime': start_dt.isoformat(),
-            'timeZone': 'Asia/Kolkata'  # ✅ Proper IST timezone
-        },
-        'end': {
-            'dateTime': end_dt.isoformat(),
-            'timeZone': 'Asia/Kolkata'
-        },
+        'start': start,
+        'end': end,
+        'extendedProperties': {'private': private},
     }
 
+def create_event(calendar_service, summary, event_start_time_str, duration_minutes=60, timezone=DEFAULT_TIMEZONE):
+    """
+    Creates an event in Google Calendar starting at the given ISO time, lasting `duration_minutes`.
+    A time without a UTC offset is taken to be in `timezone`.
+    """
+    try:
+        start_dt = datetime.fromisoformat(event_start_time_str)
+    except ValueError:
+        start_dt = parse(event_start_time_str)
+    if not start_dt:
+        print("⚠️ Could not parse start time.")
+        return None
+
+    created_event = insert_event(calendar_service, build_event(summary, start_dt, duration_minutes, timezone))
+    return created_event.get('htmlLink') if created_event else None
+
+def insert_event(calendar_service, event):
+    """
+    Inserts an event body into the primary calendar and returns the created event, or None on error.
+    """
+    started = time.perf_counter()
     try:
         created_event = calendar_service.events().insert(
             calendarId='primary', body=event
         ).execute()
 
+        metrics.observe('calendar_insert', time.perf_counter() - started)
         print(f"📅 Event created: {created_event.get('htmlLink')}")
-        return created_event.get('htmlLink')
+        return created_event
 
     except HttpError as error:
+        metrics.observe('calendar_insert', time.perf_counter() - started, error=True)
         print(f"❌ Calendar Error: {error}")
         return None
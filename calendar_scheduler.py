@@ -0,0 +1,127 @@
+from datetime import datetime
+import httplib2
+from googleapiclient.errors import HttpError
+from calendar_integration import DEFAULT_TIMEZONE, EVENT_SOURCE, build_event
+from metrics import metrics
+
+BATCH_SIZE = 50  # Calendar inserts per batch HTTP request
+
+def _parse_rfc3339(value):
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+def _overlaps(start, end, intervals):
+    return any(start < busy_end and busy_start < end for busy_start, busy_end in intervals)
+
+class EventScheduler:
+    """
+    Collects meeting events and creates them together on flush(): one freebusy query over the whole
+    time window to find conflicts, one events.list to find threads that already have an event, and
+    one batch HTTP request for all the inserts.
+    """
+    def __init__(self, calendar_service, duration_minutes=30, timezone=DEFAULT_TIMEZONE, calendar_id='primary',
+                 skip_conflicts=True):
+        self.service = calendar_service
+        self.duration_minutes = duration_minutes
+        self.timezone = timezone
+        self.calendar_id = calendar_id
+        self.skip_conflicts = skip_conflicts
+        self.pending = []
+
+    def add(self, summary, start_dt, thread_id=None, email_id=None):
+        """
+        Queues an event. Returns False if an event for the same thread is already queued.
+        """
+        if thread_id and any(item['thread_id'] == thread_id for item in self.pending):
+            return False
+        event = build_event(summary, start_dt, self.duration_minutes, self.timezone, thread_id)
+        self.pending.append({
+            'summary': summary,
+            'thread_id': thread_id,
+            'email_id': email_id,
+            'event': event,
+            'start': datetime.fromisoformat(event['start']['dateTime']),
+            'end': datetime.fromisoformat(event['end']['dateTime']),
+        })
+        return True
+
+    def _busy_intervals(self, time_min, time_max):
+        with metrics.timer('calendar_freebusy'):
+            response = self.service.freebusy().query(body={
+                'timeMin': time_min.isoformat(),
+                'timeMax': time_max.isoformat(),
+                'timeZone': self.timezone,
+                'items': [{'id': self.calendar_id}],
+            }).execute()
+        busy = response.get('calendars', {}).get(self.calendar_id, {}).get('busy', [])
+        return [(_parse_rfc3339(b['start']), _parse_rfc3339(b['end'])) for b in busy]
+
+    def _scheduled_threads(self, time_min, time_max):
+        threads, page_token = set(), None
+        while True:
+            response = self.service.events().list(
+                calendarId=self.calendar_id, timeMin=time_min.isoformat(), timeMax=time_max.isoformat(),
+                privateExtendedProperty=f'source={EVENT_SOURCE}', singleEvents=True, pageToken=page_token
+            ).execute()
+            for event in response.get('items', []):
+                thread_id = event.get('extendedProperties', {}).get('private', {}).get('threadId')
+                if thread_id:
+                    threads.add(thread_id)
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                return threads
+
+    def flush(self):
+        """
+        Creates every queued event that is neither a duplicate nor (if `skip_conflicts`) a conflict.
+        Returns one result per queued event with `status` "created", "duplicate", "conflict" or "failed",
+        plus `link` and `event_id` for created events.
+        """
+        pending, self.pending = self.pending, []
+        if not pending:
+            return []
+        time_min = min(item['start'] for item in pending)
+        time_max = max(item['end'] for item in pending)
+        try:
+            busy = self._busy_intervals(time_min, time_max)
+            scheduled_threads = self._scheduled_threads(time_min, time_max)
+        except (HttpError, httplib2.HttpLib2Error, OSError) as error:
+            print(f"❌ Calendar Error: {error}")
+            return [dict(item, status='failed') for item in pending]
+
+        results, to_insert = [], []
+        for item in pending:
+            if item['thread_id'] in scheduled_threads:
+                results.append(dict(item, status='duplicate'))
+            elif self.skip_conflicts and _overlaps(item['start'], item['end'], busy):
+                results.append(dict(item, status='conflict'))
+            else:
+                result = dict(item, status='failed')
+                results.append(result)
+                to_insert.append(result)
+                # Later queued events must not overlap this one either
+                busy.append((item['start'], item['end']))
+
+        def callback(request_id, response, exception):
+            result = to_insert[int(request_id)]
+            if exception is not None:
+                print(f"❌ Calendar Error for '{result['summary']}': {exception}")
+                return
+            result.update(status='created', link=response.get('htmlLink'), event_id=response.get('id'))
+            print(f"📅 Event created: {response.get('htmlLink')}")
+
+        for start in range(0, len(to_insert), BATCH_SIZE):
+            batch = self.service.new_batch_http_request(callback=callback)
+            for index in range(start, min(start + BATCH_SIZE, len(to_insert))):
+                batch.add(self.service.events().insert(calendarId=self.calendar_id, body=to_insert[index]['event']),
+                          request_id=str(index))
+            try:
+                with metrics.timer('calendar_insert_batch'):
+                    batch.execute()
+            except (HttpError, httplib2.HttpLib2Error, OSError) as error:
+                # Events of this batch without a response keep their "failed" status
+                print(f"❌ Calendar batch request failed: {error}")
+
+        for result in results:
+            if result['status'] in ('duplicate', 'conflict'):
+                print(f"⏭️ Skipped event '{result['summary']}': {result['status']}")
+        return results
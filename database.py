@@ -1,28 +1,426 @@
-from sqlalchemy import create_engine, Column, String, Integer, Text, DateTime, ForeignKey
-from sqlalchemy.orm import declarative_base, relationship, sessionmaker
+import os
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import cast, create_engine, event, extract, false, func, insert, inspect, select, text, and_, or_, Column, String, Integer, Boolean, Text, Date, DateTime, ForeignKey, Index, LargeBinary
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import declarative_base, relationship, sessionmaker, Session
+
+DATABASE_URL = os.getenv("EMAIL_DB_URL", "sqlite:///emails.db")
+SQL_ECHO = os.getenv("SQL_ECHO", "").lower() in ("1", "true", "yes")
+BULK_CHUNK_SIZE = 500
+ROLLUPS_BUILT_KEY = 'rollups_built'
+PENDING_SINCE_KEY = 'pending_since'
+# Email.date keeps the sender's wall-clock time, so the pending cutoff allows for any UTC offset
+PENDING_SINCE_MARGIN = timedelta(hours=14)
+
+# Per-email processing states: new -> classified -> replied, or skipped / failed along the way.
+# An older message answered by the reply to a newer one in the same thread becomes superseded.
+# Historical mail loaded by a backfill is archived and never processed.
+# Rows stored before processing states existed have no status and are left alone.
+STATUS_NEW = 'new'
+STATUS_CLASSIFIED = 'classified'
+STATUS_REPLIED = 'replied'
+STATUS_SKIPPED = 'skipped'
+STATUS_FAILED = 'failed'
+STATUS_SUPERSEDED = 'superseded'
+STATUS_ARCHIVED = 'archived'
+PENDING_STATUSES = (STATUS_NEW, STATUS_CLASSIFIED)
+MAX_ATTEMPTS = 3
+
+# FTS5 index over emails, kept in sync by triggers. It is an external-content table keyed on the
+# implicit rowid of `emails`; run rebuild_search_index() after a VACUUM, which may renumber rowids.
+SEARCH_INDEX_DDL = [
+    "CREATE VIRTUAL TABLE emails_fts USING fts5(subject, sender, body, content='emails', content_rowid='rowid')",
+    "CREATE TRIGGER IF NOT EXISTS emails_fts_ai AFTER INSERT ON emails BEGIN "
+    "INSERT INTO emails_fts(rowid, subject, sender, body) VALUES (new.rowid, new.subject, new.sender, new.body); END",
+    "CREATE TRIGGER IF NOT EXISTS emails_fts_ad AFTER DELETE ON emails BEGIN "
+    "INSERT INTO emails_fts(emails_fts, rowid, subject, sender, body) "
+    "VALUES ('delete', old.rowid, old.subject, old.sender, old.body); END",
+    "CREATE TRIGGER IF NOT EXISTS emails_fts_au AFTER UPDATE OF subject, sender, body ON emails BEGIN "
+    "INSERT INTO emails_fts(emails_fts, rowid, subject, sender, body) "
+    "VALUES ('delete', old.rowid, old.subject, old.sender, old.body); "
+    "INSERT INTO emails_fts(rowid, subject, sender, body) VALUES (new.rowid, new.subject, new.sender, new.body); END",
+]
+# bm25 column weights: subject, sender, body
+SEARCH_WEIGHTS = (5.0, 2.0, 1.0)
 
 Base = declarative_base()
 
 class Email(Base):
     __tablename__ = 'emails'
+    __table_args__ = (
+        Index('ix_emails_date_id', 'date', 'id'),  # Keyset pagination for the Inbox
+        Index('ix_emails_status_date', 'status', 'date'),  # Worker loops pick pending mail, oldest first
+    )
 
     id = Column(String, primary_key=True)  # Gmail message ID
     thread_id = Column(String, index=True)  # Gmail thread ID
-    sender = Column(String)
+    sender = Column(String, index=True)
     recipient = Column(String)
     subject = Column(String)
     date = Column(DateTime)
     body = Column(Text)
+    label_ids = Column(String)  # Comma-separated Gmail label IDs
+    is_automated = Column(Boolean, default=False)  # Bot, newsletter or bulk mail, set at ingestion
+    # Processing state, see STATUS_* below
+    status = Column(String, default='new')
+    attempts = Column(Integer, default=0)  # LLM/reply attempts so far
+    summary = Column(Text)
+    replied_at = Column(DateTime)
+    event_id = Column(String)  # Calendar event created for this email
 
     def __repr__(self):
         return f"<Email(subject={self.subject}, sender={self.sender})>"
 
+# Rollups kept up to date by the ingestion path so the Dashboard and Insights views never scan `emails`
+class HourlyEmailCount(Base):
+    __tablename__ = 'email_counts_by_hour'
+
+    hour = Column(Integer, primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
+
+class DailyEmailCount(Base):
+    __tablename__ = 'email_counts_by_day'
+
+    day = Column(Date, primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
+
+class SenderEmailCount(Base):
+    __tablename__ = 'email_counts_by_sender'
+
+    sender = Column(String, primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
+
+class SyncState(Base):
+    __tablename__ = 'sync_state'
+
+    key = Column(String, primary_key=True)
+    value = Column(String)
+
+    def __repr__(self):
+        return f"<SyncState(key={self.key}, value={self.value})>"
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets the Streamlit app read while ingestion writes, and NORMAL sync is safe under WAL.
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-64000")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+def create_db_engine(url=DATABASE_URL, echo=SQL_ECHO):
+    """
+    Creates an engine for `url`. SQL echo stays off unless requested (e.g. SQL_ECHO=1).
+    """
+    db_engine = create_engine(url, echo=echo)
+    if db_engine.dialect.name == 'sqlite':
+        event.listen(db_engine, 'connect', _set_sqlite_pragmas)
+    return db_engine
+
+class LLMCacheEntry(Base):
+    __tablename__ = 'llm_cache'
+
+    key = Column(String, primary_key=True)  # SHA-256 of task, prompt, model and generation config
+    value = Column(Text)
+    created_at = Column(DateTime)
+    last_accessed = Column(DateTime, index=True)
+
+    def __repr__(self):
+        return f"<LLMCacheEntry(key={self.key[:12]}, last_accessed={self.last_accessed})>"
+
+# Past (email, reply) pairs behind the similar-reply index in reply_index.py
+class SentReply(Base):
+    __tablename__ = 'sent_replies'
+    __table_args__ = (
+        Index('ix_sent_replies_sender_hash', 'sender', 'text_hash'),  # Exact-match reuse
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    email_id = Column(String, index=True)
+    sender = Column(String)
+    created_at = Column(DateTime)
+    email_text = Column(Text)  # Cleaned text the reply was written for
+    text_hash = Column(String)  # SHA-256 of email_text
+    reply = Column(Text)
+    signature = Column(LargeBinary)  # MinHash signature of email_text, uint32 values
+
+    def __repr__(self):
+        return f"<SentReply(id={self.id}, email_id={self.email_id})>"
+
 # Create SQLite engine
-engine = create_engine('sqlite:///emails.db', echo=True)
+engine = create_db_engine()
 
 # Create session factory
 SessionLocal = sessionmaker(bind=engine)
 
 # Create tables
-def init_db():
-    Base.metadata.create_all(engine)
+def init_db(db_engine=None):
+    db_engine = db_engine or engine
+    Base.metadata.create_all(db_engine)
+    _add_missing_columns(db_engine)
+    _add_missing_indexes(db_engine)
+    if db_engine.dialect.name == 'sqlite':
+        _create_search_index(db_engine)
+    with Session(db_engine) as session:
+        if get_sync_state(session, ROLLUPS_BUILT_KEY) is None:
+            rebuild_rollups(session)
+            set_sync_state(session, ROLLUPS_BUILT_KEY, 1)
+            session.commit()
+
+def _add_missing_columns(db_engine):
+    """
+    `create_all` never alters existing tables, so columns added to a model after the
+    database was first created are appended here.
+    """
+    inspector = inspect(db_engine)
+    with db_engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {col['name'] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    col_type = column.type.compile(dialect=db_engine.dialect)
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}'))
+
+def _add_missing_indexes(db_engine):
+    # Like columns, indexes added to an existing table are not created by `create_all`
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db_engine, checkfirst=True)
+
+def _create_search_index(db_engine):
+    with db_engine.begin() as conn:
+        exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE type='table' AND name='emails_fts'")).first()
+        for statement in SEARCH_INDEX_DDL[exists is not None:]:
+            conn.execute(text(statement))
+        if not exists:
+            # Index the emails stored before the search table existed
+            conn.execute(text("INSERT INTO emails_fts(emails_fts) VALUES ('rebuild')"))
+
+def rebuild_search_index(session):
+    session.execute(text("INSERT INTO emails_fts(emails_fts) VALUES ('rebuild')"))
+
+def utcnow():
+    # Naive UTC, as the DateTime columns store and return it
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def get_sync_state(session, key, default=None):
+    state = session.get(SyncState, key)
+    return state.value if state else default
+
+def set_sync_state(session, key, value):
+    """
+    Stores a sync cursor such as the last Gmail historyId. Passing None removes it.
+    """
+    state = session.get(SyncState, key)
+    if value is None:
+        if state:
+            session.delete(state)
+    elif state:
+        state.value = str(value)
+    else:
+        session.add(SyncState(key=key, value=str(value)))
+
+
+def _conflict_insert(session, model):
+    """
+    The dialect's INSERT with ON CONFLICT support (SQLite, PostgreSQL), or None for other databases.
+    """
+    dialect = session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        return sqlite_insert(model)
+    if dialect == 'postgresql':
+        return postgresql_insert(model)
+    return None
+
+def bulk_insert_emails(session, rows, chunk_size=BULK_CHUNK_SIZE):
+    """
+    Inserts email rows (dicts of column values) with one `executemany` per chunk instead of a
+    SELECT and `session.add` per row. IDs that are already stored are skipped.
+    Returns the rows that were actually new.
+    """
+    stmt = _conflict_insert(session, Email)
+    # Without ON CONFLICT support this relies on the existing-ID check below
+    stmt = stmt.on_conflict_do_nothing(index_elements=['id']) if stmt is not None else insert(Email)
+    inserted = []
+    for start in range(0, len(rows), chunk_size):
+        chunk = {row['id']: row for row in rows[start:start + chunk_size]}
+        existing = set(session.scalars(select(Email.id).where(Email.id.in_(chunk.keys()))))
+        new_rows = [row for msg_id, row in chunk.items() if msg_id not in existing]
+        if new_rows:
+            session.execute(stmt, new_rows)
+            inserted.extend(new_rows)
+    return inserted
+
+def list_email_headers(session, limit=25, before=None):
+    """
+    Returns up to `limit` emails, newest first, without their bodies. `before` is the (date, id)
+    of the last row on the previous page; keyset pagination keeps every page equally cheap.
+    """
+    query = select(Email.id, Email.subject, Email.sender, Email.date, Email.status)
+    if before:
+        date, email_id = before
+        if date is None:
+            # SQLite sorts NULL dates last in descending order
+            query = query.where(and_(Email.date.is_(None), Email.id < email_id))
+        else:
+            query = query.where(or_(Email.date < date, and_(Email.date == date, Email.id < email_id),
+                                    Email.date.is_(None)))
+    query = query.order_by(Email.date.desc(), Email.id.desc()).limit(limit)
+    return session.execute(query).all()
+
+def get_email_body(session, email_id):
+    return session.scalar(select(Email.body).where(Email.id == email_id))
+
+def _value(row, name):
+    return row[name] if isinstance(row, dict) else getattr(row, name)
+
+def update_rollups(session, rows, sign=1):
+    """
+    Adds emails (dicts of column values or Email objects) to the rollup tables, or removes them
+    with sign=-1. Each table gets one upsert for the whole batch where the database supports it.
+    """
+    hours, days, senders = Counter(), Counter(), Counter()
+    for row in rows:
+        date = _value(row, 'date')
+        if date:
+            hours[date.hour] += sign
+            days[date.date()] += sign
+        senders[_value(row, 'sender') or ''] += sign
+
+    for model, key, counts in ((HourlyEmailCount, 'hour', hours), (DailyEmailCount, 'day', days),
+                               (SenderEmailCount, 'sender', senders)):
+        if not counts:
+            continue
+        stmt = _conflict_insert(session, model)
+        if stmt is not None:
+            stmt = stmt.on_conflict_do_update(index_elements=[key], set_={'total': model.total + stmt.excluded.total})
+            session.execute(stmt, [{key: value, 'total': total} for value, total in counts.items()])
+        else:
+            for value, total in counts.items():
+                column = getattr(model, key)
+                if not session.query(model).filter(column == value).update({'total': model.total + total}):
+                    session.add(model(**{key: value, 'total': total}))
+            session.flush()
+        if sign < 0:
+            session.query(model).filter(model.total <= 0).delete()
+
+def rebuild_rollups(session):
+    """
+    Recomputes every rollup table from `emails`, e.g. for a database created before rollups existed.
+    """
+    for model in (HourlyEmailCount, DailyEmailCount, SenderEmailCount):
+        session.query(model).delete()
+    hour = cast(extract('hour', Email.date), Integer)
+    # SQLite has no DATE type; date() gives the 'YYYY-MM-DD' text the Date column stores
+    day = func.date(Email.date) if session.get_bind().dialect.name == 'sqlite' else cast(Email.date, Date)
+    sender = func.coalesce(Email.sender, '')
+    for model, key, column, dated in ((HourlyEmailCount, 'hour', hour, True), (DailyEmailCount, 'day', day, True),
+                                      (SenderEmailCount, 'sender', sender, False)):
+        query = select(column, func.count()).group_by(column)
+        if dated:
+            query = query.where(Email.date.is_not(None))
+        session.execute(insert(model).from_select([key, 'total'], query))
+
+def get_overview_counts(session, today):
+    return {
+        'total': session.scalar(select(func.coalesce(func.sum(SenderEmailCount.total), 0))),
+        'today': session.scalar(select(DailyEmailCount.total).where(DailyEmailCount.day == today)) or 0,
+        'unique_senders': session.scalar(select(func.count()).select_from(SenderEmailCount)),
+    }
+
+def get_hourly_counts(session):
+    return session.execute(select(HourlyEmailCount.hour, HourlyEmailCount.total).order_by(HourlyEmailCount.hour)).all()
+
+def get_daily_counts(session):
+    return session.execute(select(DailyEmailCount.day, DailyEmailCount.total).order_by(DailyEmailCount.day)).all()
+
+def get_top_senders(session, limit=10):
+    query = select(SenderEmailCount.sender, SenderEmailCount.total).order_by(SenderEmailCount.total.desc())
+    return session.execute(query.limit(limit)).all()
+
+def _fts_query(user_query):
+    """
+    Turns free text into a safe FTS5 query: every word is quoted (so operators and punctuation
+    can't cause syntax errors), words are ANDed, and the last word matches as a prefix.
+    """
+    terms = ['"' + term.replace('"', '""') + '"' for term in user_query.split()]
+    if terms:
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+def search_emails(session, user_query, limit=20):
+    """
+    Full-text search over subject, sender and body, best BM25 match first. Each row carries a
+    highlighted `snippet` of the body with matches wrapped in ** for Markdown.
+    """
+    match = _fts_query(user_query)
+    if not match:
+        return []
+    weights = ', '.join(str(weight) for weight in SEARCH_WEIGHTS)
+    query = text(
+        "SELECT e.id, e.subject, e.sender, e.date, e.status, "
+        "snippet(emails_fts, 2, '**', '**', '…', 16) AS snippet, "
+        f"bm25(emails_fts, {weights}) AS rank "
+        "FROM emails_fts JOIN emails e ON e.rowid = emails_fts.rowid "
+        "WHERE emails_fts MATCH :match ORDER BY rank LIMIT :limit"
+    ).columns(date=DateTime)
+    return session.execute(query, {'match': match, 'limit': limit}).all()
+
+def get_thread_emails(session, thread_ids):
+    """
+    Every stored email of the given threads, grouped by thread and oldest first within a thread.
+    """
+    return session.query(Email).filter(Email.thread_id.in_(list(thread_ids))).order_by(
+        Email.thread_id, Email.date, Email.id
+    ).all()
+
+def load_reply_signatures(session):
+    """
+    IDs and MinHash signatures of every stored reply, oldest first, without the texts.
+    """
+    return session.execute(select(SentReply.id, SentReply.signature).order_by(SentReply.id)).all()
+
+def get_pending_since(session):
+    value = get_sync_state(session, PENDING_SINCE_KEY)
+    return datetime.fromisoformat(value) if value else None
+
+def start_pending_window(session, message_ids=()):
+    """
+    Records, once, from when on stored mail counts as pending: the oldest of `message_ids` (the
+    messages of the first sync) or now. Mail stored earlier, e.g. by a backfill, is never auto-replied to.
+    """
+    if get_sync_state(session, PENDING_SINCE_KEY) is not None:
+        return
+    now = utcnow()
+    oldest = session.scalar(select(func.min(Email.date)).where(Email.id.in_(list(message_ids))))
+    since = min(oldest or now, now) - PENDING_SINCE_MARGIN
+    set_sync_state(session, PENDING_SINCE_KEY, since.isoformat())
+
+def record_attempt_failure(email):
+    # Leave the email pending for another run until it has used up its attempts
+    if (email.attempts or 0) >= MAX_ATTEMPTS:
+        email.status = STATUS_FAILED
+
+def find_sent_reply(session, sender, text_hash):
+    """
+    The newest reply sent to `sender` for an email with exactly this cleaned text, or None.
+    """
+    return session.scalars(select(SentReply).where(
+        SentReply.sender == sender, SentReply.text_hash == text_hash
+    ).order_by(SentReply.id.desc()).limit(1)).first()
+
+def query_pending_emails(session, statuses=PENDING_STATUSES):
+    """
+    Emails still waiting to be processed, oldest first. Served by ix_emails_status_date, so the cost
+    grows with the amount of new mail rather than the size of the table. Only mail received since
+    the sync cursor was first saved counts (see start_pending_window); before that nothing is pending.
+    """
+    since = get_pending_since(session)
+    return session.query(Email).filter(
+        Email.status.in_(statuses),
+        func.coalesce(Email.attempts, 0) < MAX_ATTEMPTS,
+        Email.date >= since if since else false(),
+    ).order_by(Email.date)
@@ -1,6 +1,7 @@
 import base64
 from email.mime.text import MIMEText
 from email.message import EmailMessage
+from metrics import metrics
 
 def create_message(to, subject, body):
     message = MIMEText(body)
@@ -10,5 +11,6 @@ def create_message(to, subject, body):
 
 def send_email(service, to, subject, body):
     message = create_message(to, subject, body)
-    sent = service.users().messages().send(userId="me", body=message).execute()
-    print(f"📤 Sent Email to {to} | ID: {sent['id']}")
\ No newline at end of file
+    with metrics.timer('gmail_send'):
+        sent = service.users().messages().send(userId="me", body=message).execute()
+    print(f"📤 Sent Email to {to} | ID: {sent['id']}")
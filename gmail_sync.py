@@ -0,0 +1,326 @@
+from googleapiclient.errors import HttpError
+from database import (
+    SessionLocal,
+    Email,
+    bulk_insert_emails,
+    update_rollups,
+    get_sync_state,
+    set_sync_state,
+    start_pending_window,
+    STATUS_NEW,
+    STATUS_ARCHIVED,
+)
+from jobs import no_progress
+from metrics import metrics
+from mime_parser import extract_body
+from nlp_utils import is_human_sender
+from slack_bot import notifier
+from email.utils import parsedate_to_datetime
+import os
+import time
+
+# Gmail accepts at most 100 calls per batch request, but recommends staying around 50
+# to avoid per-user rate limiting.
+BATCH_SIZE = int(os.getenv("GMAIL_BATCH_SIZE", "50"))
+MAX_BATCH_SIZE = 100
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+HISTORY_ID_KEY = 'gmail_history_id'
+HISTORY_TYPES = ['messageAdded', 'messageDeleted', 'labelAdded', 'labelRemoved']
+BACKFILL_TOKEN_KEY = 'backfill_page_token'
+MAX_PAGE_SIZE = 500  # Largest page messages.list will return
+
+def parse_email_body(payload):
+    return extract_body(payload)
+
+def parse_message(full_msg):
+    """
+    Turns a Gmail `messages.get` response into the column values of an `Email` row.
+    """
+    payload = full_msg.get('payload', {})
+    headers = payload.get('headers', [])
+    with metrics.timer('body_parse'):
+        body = parse_email_body(payload)
+
+    email_data = {
+        'id': full_msg['id'],
+        'thread_id': full_msg['threadId'],
+        'sender': '',
+        'recipient': '',
+        'subject': '',
+        'date': None,
+        'body': body,
+        'label_ids': ','.join(full_msg.get('labelIds', [])),
+    }
+    header_values = {}
+    for header in headers:
+        name = header['name']
+        value = header['value']
+        if name == 'From':
+            email_data['sender'] = value
+        elif name == 'To':
+            email_data['recipient'] = value
+        elif name == 'Subject':
+            email_data['subject'] = value
+        elif name == 'Date':
+            email_data['date'] = parsedate_to_datetime(value)
+        header_values[name] = value
+    email_data['is_automated'] = not is_human_sender(email_data['sender'], header_values)
+    return email_data
+
+def fetch_messages(service, message_ids, batch_size=BATCH_SIZE, max_retries=3, progress=no_progress,
+                   gave_up=None):
+    """
+    Fetches full Gmail messages using batch HTTP requests instead of one round-trip per message.
+    Sub-requests that fail with a rate-limit or server error are retried with exponential backoff. Returns messages in the order of `message_ids`.
+    IDs still failing after `max_retries` are appended to `gave_up`, if given, so callers can try them again later.
+    `progress(done, total, message)` is called after every batch.
+    """
+    batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+    fetched = {}
+    pending = list(message_ids)
+    attempt = 0
+
+    while pending:
+        failed = []
+
+        def callback(request_id, response, exception):
+            if exception is None:
+                fetched[request_id] = response
+            elif isinstance(exception, HttpError) and exception.resp.status not in RETRYABLE_STATUSES:
+                metrics.inc('gmail_message_errors_total')
+                print(f"❌ Could not fetch message {request_id}: {exception}")
+            else:
+                failed.append((request_id, exception))
+
+        total_batches = (len(pending) + batch_size - 1) // batch_size
+        for batch_no, start in enumerate(range(0, len(pending), batch_size), start=1):
+            chunk = pending[start:start + batch_size]
+            batch = service.new_batch_http_request(callback=callback)
+            for msg_id in chunk:
+                batch.add(service.users().messages().get(userId='me', id=msg_id), request_id=msg_id)
+            started = time.perf_counter()
+            with metrics.timer('gmail_fetch'):
+                batch.execute()
+            elapsed = time.perf_counter() - started
+            print(f"⏱️ Batch {batch_no}/{total_batches}: {len(chunk)} messages in {elapsed:.2f}s")
+            progress(len(fetched), len(message_ids), f"Fetched {len(fetched)}/{len(message_ids)} message(s)")
+
+        if not failed:
+            break
+        attempt += 1
+        if attempt > max_retries:
+            for msg_id, error in failed:
+                print(f"❌ Giving up on message {msg_id}: {error}")
+            if gave_up is not None:
+                gave_up.extend(msg_id for msg_id, _ in failed)
+            break
+        delay = 2 ** (attempt - 1)
+        print(f"🔁 Retrying {len(failed)} failed message(s) in {delay}s")
+        time.sleep(delay)
+        pending = [msg_id for msg_id, _ in failed]
+
+    return [fetched[msg_id] for msg_id in message_ids if msg_id in fetched]
+
+def store_messages(session, full_msgs, notify=True, status=STATUS_NEW):
+    """
+    Bulk-inserts messages that are not stored yet, with the given processing `status`, and, if `notify`
+    is set, queues a Slack alert for each (sent as a digest in the background).
+    Returns the column values of the newly stored emails.
+    """
+    rows = [dict(parse_message(full_msg), status=status) for full_msg in full_msgs]
+    with metrics.timer('db_write'):
+        stored = bulk_insert_emails(session, rows)
+        update_rollups(session, stored)
+    for email_data in stored:
+        print(f"✅ Stored email: {email_data['subject']}")
+        if notify:
+            slack_msg = f"📬 *New Email Received!*\n*Subject:* {email_data['subject']}\n*From:* {email_data['sender']}"
+            notifier.notify(slack_msg)
+    return stored
+
+def fetch_and_store_emails(service, max_results=10, batch_size=BATCH_SIZE):
+    session = SessionLocal()
+    results = service.users().messages().list(userId='me', maxResults=max_results, q="is:unread").execute()
+    messages = results.get('messages', [])
+
+    store_messages(session, fetch_messages(service, [msg['id'] for msg in messages], batch_size=batch_size))
+    with metrics.timer('db_commit'):
+        session.commit()
+    session.close()
+
+def iter_message_pages(service, query, page_size=MAX_PAGE_SIZE, page_token=None):
+    """
+    Walks every page of `messages.list` for `query`, yielding each page's message IDs with the
+    token of the page after it (None on the last page).
+    """
+    while True:
+        response = service.users().messages().list(
+            userId='me', q=query, maxResults=min(page_size, MAX_PAGE_SIZE), pageToken=page_token
+        ).execute()
+        page_token = response.get('nextPageToken')
+        yield [msg['id'] for msg in response.get('messages', [])], page_token
+        if not page_token:
+            return
+
+def list_history_changes(service, start_history_id):
+    """
+    Collects every mailbox change since `start_history_id`. Returns the added messages and label
+    changes (message ID -> current label IDs), the deleted message IDs and the newest historyId.
+    Raises HttpError 404 when the start ID is too old for Gmail to replay.
+    """
+    added, deleted, relabeled = {}, set(), {}
+    latest_history_id = start_history_id
+    page_token = None
+
+    while True:
+        response = service.users().history().list(
+            userId='me', startHistoryId=start_history_id, historyTypes=HISTORY_TYPES, pageToken=page_token
+        ).execute()
+        for record in response.get('history', []):
+            for item in record.get('messagesAdded', []):
+                message = item['message']
+                added[message['id']] = message.get('labelIds', [])
+            for item in record.get('messagesDeleted', []):
+                msg_id = item['message']['id']
+                deleted.add(msg_id)
+                added.pop(msg_id, None)
+                relabeled.pop(msg_id, None)
+            for item in record.get('labelsAdded', []) + record.get('labelsRemoved', []):
+                message = item['message']
+                if message['id'] in added:
+                    added[message['id']] = message.get('labelIds', [])
+                else:
+                    relabeled[message['id']] = message.get('labelIds', [])
+        latest_history_id = response.get('historyId', latest_history_id)
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            break
+
+    return added, deleted, relabeled, latest_history_id
+
+def list_mailbox_changes(service, session, max_results=None):
+    """
+    Works out which messages need fetching since the last sync. Deletions and label changes are
+    applied to `session` directly. Returns the message IDs to fetch and the historyId to save once
+    they are stored. Without a usable saved historyId this falls back to listing every unread
+    message, or the newest `max_results` of them.
+    """
+    history_id = get_sync_state(session, HISTORY_ID_KEY)
+    if history_id is not None:
+        try:
+            added, deleted, relabeled, latest_history_id = list_history_changes(service, history_id)
+        except HttpError as error:
+            if error.resp.status != 404:
+                raise
+            print(f"⚠️ historyId {history_id} has expired, running a full resync")
+        else:
+            if deleted:
+                removed = session.query(Email.sender, Email.date).filter(Email.id.in_(deleted)).all()
+                update_rollups(session, removed, sign=-1)
+                session.query(Email).filter(Email.id.in_(deleted)).delete(synchronize_session=False)
+            for email in session.query(Email).filter(Email.id.in_(relabeled.keys())):
+                email.label_ids = ','.join(relabeled[email.id])
+            print(f"🔄 History since {history_id}: {len(added)} added, {len(deleted)} deleted, "
+                  f"{len(relabeled)} relabeled")
+            return [msg_id for msg_id, labels in added.items() if 'INBOX' in labels], latest_history_id
+
+    # Read the history ID before listing so nothing that arrives during the sync is missed.
+    latest_history_id = service.users().getProfile(userId='me').execute()['historyId']
+    message_ids = []
+    for page_ids, _ in iter_message_pages(service, "is:unread", page_size=max_results or MAX_PAGE_SIZE):
+        message_ids.extend(page_ids)
+        if max_results is not None and len(message_ids) >= max_results:
+            break
+    return message_ids[:max_results], latest_history_id
+
+def sync_mailbox(service, max_results=None, batch_size=BATCH_SIZE, progress=no_progress):
+    """
+    Syncs the local database with Gmail. The first run does a full sync; later runs only replay
+    the history since the saved historyId, so the cost depends on what changed, not on mailbox size.
+    `max_results` caps how many unread messages a full sync fetches. Nothing is saved if `progress`
+    raises. Returns the number of new emails.
+    """
+    session = SessionLocal()
+    try:
+        progress(message="Listing mailbox changes")
+        with metrics.timer('gmail_list'):
+            message_ids, history_id = list_mailbox_changes(service, session, max_results=max_results)
+        gave_up = []
+        full_msgs = fetch_messages(service, message_ids, batch_size=batch_size, progress=progress, gave_up=gave_up)
+        stored = store_messages(session, full_msgs)
+        start_pending_window(session, message_ids)
+        if gave_up:
+            # Keep the old cursor so the next sync replays these changes and fetches the messages again
+            print(f"⚠️ {len(gave_up)} message(s) could not be fetched; historyId not advanced")
+        else:
+            set_sync_state(session, HISTORY_ID_KEY, history_id)
+        with metrics.timer('db_commit'):
+            session.commit()
+    finally:
+        session.close()
+    print(f"🔄 Synced {len(stored)} new email(s)")
+    return len(stored)
+
+def backfill_emails(service, query='', max_emails=None, page_size=MAX_PAGE_SIZE, chunk_size=BATCH_SIZE,
+                    batch_size=BATCH_SIZE, resume=True, progress=no_progress):
+    """
+    Loads historical mail by walking every page of `messages.list`. Messages are fetched and committed
+    `chunk_size` at a time, so memory stays bounded by one chunk however large the mailbox is.
+    The next page token is saved after every page, so a crashed or cancelled backfill resumes where it stopped.
+    Returns the number of messages processed.
+    """
+    session = SessionLocal()
+    token_key = f"{BACKFILL_TOKEN_KEY}:{query}"
+    page_token = get_sync_state(session, token_key) if resume else None
+    processed = 0
+
+    try:
+        for message_ids, page_token in iter_message_pages(service, query, page_size=page_size, page_token=page_token):
+            limit_reached = max_emails is not None and processed + len(message_ids) >= max_emails
+            if limit_reached:
+                message_ids = message_ids[:max_emails - processed]
+
+            for start in range(0, len(message_ids), chunk_size):
+                chunk = message_ids[start:start + chunk_size]
+                # Historical mail is stored archived so the reply flows never pick it up
+                store_messages(session, fetch_messages(service, chunk, batch_size=batch_size), notify=False,
+                               status=STATUS_ARCHIVED)
+                with metrics.timer('db_commit'):
+                    session.commit()
+                session.expunge_all()
+                processed += len(chunk)
+                progress(processed, max_emails, f"Backfilled {processed} message(s)")
+
+            # A page cut short by max_emails is listed again on resume; already stored messages are skipped.
+            if limit_reached:
+                break
+            set_sync_state(session, token_key, page_token)
+            session.commit()
+            print(f"📚 Backfilled {processed} message(s) so far")
+    finally:
+        session.close()
+    print(f"📚 Backfill finished: {processed} message(s) processed")
+    return processed
+
+def mark_email_as_read(service, msg_id):
+    service.users().messages().modify(userId='me', id=msg_id, body={'removeLabelIds': ['UNREAD']}).execute()
+    print(f"📭 Marked email {msg_id} as read")
+
+def mark_emails_as_read(service, msg_ids):
+    """
+    Marks messages as read with one batchModify call. For emails that were already answered, so a failure
+    is reported instead of raised: nothing must make the caller send the reply again.
+    """
+    msg_ids = list(msg_ids)
+    if not msg_ids:
+        return True
+    try:
+        service.users().messages().batchModify(
+            userId='me', body={'ids': msg_ids, 'removeLabelIds': ['UNREAD']}
+        ).execute()
+    except (HttpError, OSError) as e:
+        print(f"⚠️ Could not mark {len(msg_ids)} email(s) as read: {e}")
+        return False
+    print(f"📭 Marked {len(msg_ids)} email(s) as read")
+    return True
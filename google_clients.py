@@ -0,0 +1,236 @@
+import os
+import socket
+import threading
+import weakref
+from datetime import timedelta
+
+import httplib2
+from dotenv import load_dotenv
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_oauthlib.flow import InstalledAppFlow
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build, build_from_document
+
+from database import utcnow
+
+load_dotenv()
+
+HTTP_TIMEOUT = float(os.getenv("GOOGLE_HTTP_TIMEOUT", "60"))  # seconds
+# Refresh the access token this long before it expires, ahead of google-auth's own per-request check
+REFRESH_MARGIN = timedelta(seconds=int(os.getenv("GOOGLE_TOKEN_REFRESH_MARGIN", "300")))
+# Connections (with their clients) kept for reuse after the thread that used them has ended
+MAX_IDLE_CONNECTIONS = int(os.getenv("GOOGLE_MAX_IDLE_CONNECTIONS", "8"))
+
+SCOPES = [
+    'https://www.googleapis.com/auth/gmail.readonly',
+    'https://www.googleapis.com/auth/gmail.send',
+    'https://www.googleapis.com/auth/gmail.modify',
+    'https://www.googleapis.com/auth/calendar.events'
+]
+
+# Shared by every caller of authenticate_google_services, see get_client_factory()
+_client_factory = None
+_client_factory_lock = threading.Lock()
+
+class _Connection:
+    """
+    One authorized httplib2 connection and the API clients built on it. Used by one thread at a time.
+    """
+    def __init__(self, http):
+        self.http = http
+        self.services = {}
+
+class _Lease:
+    # Held in a thread-local; when the thread ends it is garbage collected and the connection is released
+    def __init__(self, connection):
+        self.connection = connection
+
+class ClientFactory:
+    """
+    Hands out Google API clients over one shared OAuth credential. Discovery documents are read
+    from the copies bundled with google-api-python-client once per process, and every client is
+    built from its own parsed copy, since googleapiclient adds entries to the document as it is used.
+
+    httplib2 is not thread-safe, so each thread leases a connection with its clients for as long as
+    it runs. When the thread ends (e.g. a Streamlit rerun finishes) the connection goes back to a
+    small idle pool and the next thread reuses it, keep-alive socket included. The token is refreshed
+    under a lock shortly before it expires, so worker threads never race to refresh it.
+    """
+    def __init__(self, credentials, token_path=None, timeout=HTTP_TIMEOUT, refresh_margin=REFRESH_MARGIN,
+                 max_idle=MAX_IDLE_CONNECTIONS):
+        self.credentials = credentials
+        self.token_path = token_path
+        self.timeout = timeout
+        self.refresh_margin = refresh_margin
+        self.max_idle = max_idle
+        self._local = threading.local()
+        self._documents = {}
+        self._idle = []
+        self._pool_lock = threading.Lock()
+        self._document_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._https = weakref.WeakSet()
+        self._stats = {"discovery_documents": 0, "services_built": 0, "service_lookups": 0,
+                       "http_clients": 0, "connection_reuses": 0, "credential_refreshes": 0}
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def _document(self, name, version):
+        # The raw JSON text: build_from_document parses a fresh copy for every client
+        key = (name, version)
+        with self._document_lock:
+            if key not in self._documents:
+                self._documents[key] = discovery_cache.get_static_doc(name, version)
+                self._count("discovery_documents")
+            return self._documents[key]
+
+    def _connection(self):
+        lease = getattr(self._local, "lease", None)
+        if lease is None:
+            with self._pool_lock:
+                connection = self._idle.pop() if self._idle else None
+            if connection is not None:
+                self._count("connection_reuses")
+            else:
+                raw_http = httplib2.Http(timeout=self.timeout)
+                connection = _Connection(AuthorizedHttp(self.credentials, http=raw_http))
+                self._https.add(raw_http)
+                self._count("http_clients")
+            lease = self._local.lease = _Lease(connection)
+            weakref.finalize(lease, self._release, connection)
+        return lease.connection
+
+    def _release(self, connection):
+        with self._pool_lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(connection)
+                return
+        connection.http.http.close()
+
+    def refresh_if_needed(self):
+        """
+        Refreshes the shared credential if it is invalid or expires within `refresh_margin`.
+        Only one thread refreshes; the others wait and then use the new token.
+        """
+        if self._is_fresh():
+            return
+        with self._refresh_lock:
+            if self._is_fresh():
+                return
+            self.credentials.refresh(Request())
+            self._count("credential_refreshes")
+            if self.token_path:
+                with open(self.token_path, 'w') as token:
+                    token.write(self.credentials.to_json())
+            print("🔑 Refreshed Google access token")
+
+    def _is_fresh(self):
+        creds = self.credentials
+        if not creds.token:
+            return False
+        # google-auth keeps `expiry` as naive UTC
+        return creds.expiry is None or creds.expiry - self.refresh_margin > utcnow()
+
+    def service(self, name, version):
+        """
+        Returns the calling thread's client for the API, building it on first use.
+        """
+        self.refresh_if_needed()
+        connection = self._connection()
+        self._count("service_lookups")
+        key = (name, version)
+        if key not in connection.services:
+            document = self._document(name, version)
+            if document is not None:
+                connection.services[key] = build_from_document(document, http=connection.http)
+            else:
+                connection.services[key] = build(name, version, http=connection.http, cache_discovery=False)
+            self._count("services_built")
+        return connection.services[key]
+
+    def stats(self):
+        """
+        Counters for discovery loads, client builds, lookups served by an existing client, connections
+        created and reused from the pool, token refreshes, and the keep-alive sockets currently open.
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+        with self._pool_lock:
+            stats["idle_connections"] = len(self._idle)
+        stats["service_reuses"] = stats["service_lookups"] - stats["services_built"]
+        stats["open_connections"] = sum(len(http.connections) for http in list(self._https))
+        return stats
+
+class ThreadLocalService:
+    """
+    Stands in for a googleapiclient service object and forwards every call to the client leased by
+    the calling thread, so one object can be shared by the Streamlit app, jobs and pipeline workers.
+    """
+    def __init__(self, factory, name, version):
+        self._factory = factory
+        self._name = name
+        self._version = version
+
+    def __getattr__(self, attr):
+        return getattr(self._factory.service(self._name, self._version), attr)
+
+def get_free_port():
+    with socket.socket() as s:
+        s.bind(('', 0))
+        return s.getsockname()[1]
+
+def load_credentials():
+    creds = None
+    if os.path.exists('token.json'):
+        creds = Credentials.from_authorized_user_file('token.json', SCOPES)
+    if not creds or not creds.valid:
+        if creds and creds.expired and creds.refresh_token:
+            creds.refresh(Request())
+        else:
+            client_id = os.getenv("GOOGLE_CLIENT_ID")
+            client_secret = os.getenv("GOOGLE_CLIENT_SECRET")
+            if not client_id or not client_secret:
+                raise RuntimeError("Google OAuth credentials not found in environment variables.")
+
+            flow = InstalledAppFlow.from_client_config(
+                {
+                    "installed": {
+                        "client_id": client_id,
+                        "client_secret": client_secret,
+                        "auth_uri": "https://accounts.google.com/o/oauth2/auth",
+                        "token_uri": "https://oauth2.googleapis.com/token",
+                        "redirect_uris": ["http://localhost"]
+                    }
+                },
+                SCOPES
+            )
+            port = get_free_port()
+            creds = flow.run_local_server(port=port, open_browser=False)
+            with open('token.json', 'w') as token:
+                token.write(creds.to_json())
+    return creds
+
+def get_client_factory():
+    """
+    Returns the process-wide ClientFactory, loading credentials (and running the OAuth flow if
+    needed) on first use.
+    """
+    global _client_factory
+    if _client_factory is None:
+        with _client_factory_lock:
+            if _client_factory is None:
+                _client_factory = ClientFactory(load_credentials(), token_path='token.json')
+    return _client_factory
+
+def authenticate_google_services():
+    """
+    Returns Gmail and Calendar services that are safe to share between threads: each call is
+    served by the client the calling thread leased from the factory's pool.
+    """
+    factory = get_client_factory()
+    return ThreadLocalService(factory, 'gmail', 'v1'), ThreadLocalService(factory, 'calendar', 'v3')
@@ -0,0 +1,149 @@
+import itertools
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+JOB_WORKERS = 2
+MAX_FINISHED_JOBS = 20  # finished jobs kept for display
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+ACTIVE_STATES = (PENDING, RUNNING)
+
+def no_progress(done=None, total=None, message=None):
+    """Default `progress` callback for functions that can also run outside a job."""
+
+class JobCancelled(Exception):
+    """Raised inside a job by `Job.update` once cancellation has been requested."""
+
+class Job:
+    """
+    One background task. The task reports progress through `update`, which is also where a
+    requested cancellation takes effect, so work stops at the next progress report.
+    """
+    def __init__(self, job_id, name, key):
+        self.id = job_id
+        self.name = name
+        self.key = key
+        self.state = PENDING
+        self.done = 0
+        self.total = None
+        self.message = ''
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    def update(self, done=None, total=None, message=None):
+        if self._cancel.is_set():
+            raise JobCancelled()
+        with self._lock:
+            if done is not None:
+                self.done = done
+            if total is not None:
+                self.total = total
+            if message is not None:
+                self.message = message
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    @property
+    def progress(self):
+        with self._lock:
+            if self.state == DONE:
+                return 1.0
+            if not self.total:
+                return 0.0
+            return min(self.done / self.total, 1.0)
+
+    @property
+    def is_active(self):
+        return self.state in ACTIVE_STATES
+
+class JobManager:
+    """
+    Runs jobs on a small shared thread pool. A job submitted with a `key` that already has an
+    active job is not started again; the running job is returned instead.
+    """
+    def __init__(self, max_workers=JOB_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, name, func, *args, key=None, **kwargs):
+        """
+        Starts `func(*args, progress=job.update, **kwargs)` in the background and returns
+        `(job, started)`; `started` is False when an active job with the same key was returned.
+        """
+        key = key or name
+        with self._lock:
+            active = self._active(key)
+            if active is not None:
+                return active, False
+            job = Job(next(self._ids), name, key)
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job, func, args, kwargs)
+        return job, True
+
+    def _run(self, job, func, args, kwargs):
+        if job.cancel_requested:
+            job.state = CANCELLED
+            job.finished_at = time.time()
+            return
+        job.state = RUNNING
+        try:
+            job.result = func(*args, progress=job.update, **kwargs)
+            job.state = DONE
+        except JobCancelled:
+            job.state = CANCELLED
+        except Exception as e:
+            job.error = f"{e.__class__.__name__}: {e}"
+            job.state = FAILED
+            print(f"❌ Job '{job.name}' failed:\n{traceback.format_exc()}")
+        finally:
+            job.finished_at = time.time()
+
+    def _prune(self):
+        finished = [job for job in self._jobs.values() if not job.is_active]
+        for job in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            del self._jobs[job.id]
+
+    def _active(self, key):
+        for job in self._jobs.values():
+            if job.key == key and job.is_active:
+                return job
+        return None
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def active(self, key):
+        with self._lock:
+            return self._active(key)
+
+    def jobs(self):
+        """
+        All known jobs, newest first.
+        """
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda job: job.id, reverse=True)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+        return job
@@ -0,0 +1,133 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from database import SessionLocal, LLMCacheEntry, utcnow
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE", "1") != "0"
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))  # seconds
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+# Above this temperature outputs are meant to vary, so they are never cached
+LLM_CACHE_MAX_TEMPERATURE = float(os.getenv("LLM_CACHE_MAX_TEMPERATURE", "0.3"))
+MEMORY_ENTRIES = 1024
+EVICTION_INTERVAL = 100  # puts between size checks on the SQLite table
+
+def _config_value(config, name):
+    if isinstance(config, dict):
+        return config.get(name)
+    return getattr(config, name, None)
+
+class LLMCache:
+    """
+    Two-level cache for model output: an in-process LRU for sub-millisecond repeat hits, backed by
+    the `llm_cache` SQLite table so results survive restarts and are shared between processes.
+    Cache errors are logged and treated as misses, so they never break a model call.
+    """
+    def __init__(self, ttl_seconds=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES,
+                 max_temperature=LLM_CACHE_MAX_TEMPERATURE, enabled=LLM_CACHE_ENABLED):
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.max_entries = max_entries
+        self.max_temperature = max_temperature
+        self.enabled = enabled
+        self._memory = OrderedDict()  # key -> (value, created_at)
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(task, prompt, model_name, config):
+        payload = "\x1f".join([task, model_name, repr(config), prompt])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def is_cacheable(self, config):
+        temperature = _config_value(config, "temperature")
+        return self.enabled and (temperature is None or temperature <= self.max_temperature)
+
+    def get(self, key):
+        now = utcnow()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and now - entry[1] < self.ttl:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self._memory.pop(key, None)
+
+        value = None
+        try:
+            with SessionLocal() as session:
+                row = session.get(LLMCacheEntry, key)
+                if row and now - row.created_at < self.ttl:
+                    row.last_accessed = now
+                    value = row.value
+                    self._remember(key, value, row.created_at)
+                elif row:
+                    session.delete(row)
+                session.commit()
+        except SQLAlchemyError as e:
+            logger.warning(f"LLM cache lookup failed: {e}")
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def put(self, key, value):
+        now = utcnow()
+        self._remember(key, value, now)
+        try:
+            with SessionLocal() as session:
+                session.merge(LLMCacheEntry(key=key, value=value, created_at=now, last_accessed=now))
+                session.commit()
+                with self._lock:
+                    self._puts += 1
+                    check_size = self._puts % EVICTION_INTERVAL == 0
+                if check_size:
+                    self._evict(session)
+        except SQLAlchemyError as e:
+            logger.warning(f"LLM cache write failed: {e}")
+
+    def _remember(self, key, value, created_at):
+        with self._lock:
+            self._memory[key] = (value, created_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > MEMORY_ENTRIES:
+                self._memory.popitem(last=False)
+
+    def _evict(self, session):
+        """
+        Drops expired rows, then the least recently used rows beyond `max_entries`.
+        """
+        session.query(LLMCacheEntry).filter(LLMCacheEntry.created_at < utcnow() - self.ttl).delete()
+        keep = select(LLMCacheEntry.key).order_by(LLMCacheEntry.last_accessed.desc()).limit(self.max_entries)
+        session.query(LLMCacheEntry).filter(LLMCacheEntry.key.not_in(keep)).delete(synchronize_session=False)
+        session.commit()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self.hits = self.misses = 0
+        with SessionLocal() as session:
+            session.query(LLMCacheEntry).delete()
+            session.commit()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "memory_entries": len(self._memory),
+            }
+
+llm_cache = LLMCache()
@@ -1,52 +1,218 @@
+import json
 import logging
 import os
-import streamlit as st
-import google.generativeai as genai
-from google.generativeai import GenerationConfig
-
-# Hybrid: read API key from Streamlit secrets or fallback to .env
-api_key = None
-try:
-    api_key = st.secrets["GEMINI_API_KEY"]
-except Exception:
-    from dotenv import load_dotenv
-    load_dotenv()
-    api_key = os.getenv("GEMINI_API_KEY")
-
-if not api_key:
-    raise RuntimeError("GEMINI_API_KEY not found in Streamlit secrets or .env")
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from llm_cache import llm_cache
+from metrics import metrics
+from nlp_utils import extract_questions
+from prompt_prep import condense, estimate_tokens, prepare_email_text, strip_boilerplate
 
 logger = logging.getLogger(__name__)
-genai.configure(api_key=api_key)
-model = genai.GenerativeModel("models/gemini-2.0-flash")
-gen_config = GenerationConfig(max_output_tokens=150, temperature=0.1, top_p=0.9)
+MODEL_NAME = "models/gemini-2.0-flash"
+# Created on first use by get_model(); tests may assign a stub here directly
+model = None
+_model_lock = threading.Lock()
+
+# Generation configs are plain dicts so building them doesn't import the Gemini SDK
+gen_config = {"max_output_tokens": 150, "temperature": 0.1, "top_p": 0.9}
+# One combined analysis carries a summary, a reply and a title, so it needs a larger output budget
+analysis_config = {"max_output_tokens": 600, "temperature": 0.1, "top_p": 0.9}
+
+ANALYSIS_FIELDS = {"summary": str, "reply": str, "event_title": str, "questions": list}
+
+# Concurrency and quota settings for batch calls such as analyze_emails
+LLM_WORKERS = int(os.getenv("LLM_WORKERS", "8"))
+REQUESTS_PER_MINUTE = int(os.getenv("GEMINI_RPM", "60"))
+TOKENS_PER_MINUTE = int(os.getenv("GEMINI_TPM", "1000000"))
+MAX_RETRIES = 5
+# Size of the extractive summary kept for an email answered with a reused reply
+REUSED_SUMMARY_BUDGET = 80
+# Returned in place of a summary or reply when the email has no text
+EMPTY_EMAIL_TEXT = "Email content is empty."
+
+class RateLimiter:
+    """
+    Thread-safe sliding one-minute window that caps both the number of requests and the
+    estimated prompt tokens sent to the model.
+    """
+    def __init__(self, requests_per_minute, tokens_per_minute=None, window=60.0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.window = window
+        self._calls = deque()  # (timestamp, tokens)
+        self._tokens_in_window = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=0):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._calls and now - self._calls[0][0] >= self.window:
+                    self._tokens_in_window -= self._calls.popleft()[1]
+                under_request_cap = len(self._calls) < self.requests_per_minute
+                under_token_cap = (
+                    self.tokens_per_minute is None
+                    or not self._calls
+                    or self._tokens_in_window + tokens <= self.tokens_per_minute
+                )
+                if under_request_cap and under_token_cap:
+                    self._calls.append((now, tokens))
+                    self._tokens_in_window += tokens
+                    return
+                wait = self.window - (now - self._calls[0][0])
+            time.sleep(max(wait, 0.01))
+
+rate_limiter = RateLimiter(REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE)
+
+def _load_api_key() -> str:
+    # Hybrid: read API key from Streamlit secrets or fallback to .env
+    api_key = None
+    try:
+        import streamlit as st
+        api_key = st.secrets["GEMINI_API_KEY"]
+    except Exception:
+        from dotenv import load_dotenv
+        load_dotenv()
+        api_key = os.getenv("GEMINI_API_KEY")
+
+    if not api_key:
+        raise RuntimeError("GEMINI_API_KEY not found in Streamlit secrets or .env")
+    return api_key
+
+def get_model():
+    """
+    Configures Gemini and creates the model on first use, so importing this module stays cheap.
+    Safe to call from several threads; the model is shared by the whole process.
+    """
+    global model
+    if model is None:
+        with _model_lock:
+            if model is None:
+                import google.generativeai as genai
+                genai.configure(api_key=_load_api_key())
+                model = genai.GenerativeModel(MODEL_NAME)
+    return model
+
+def _is_rate_limited(error: Exception) -> bool:
+    from google.api_core import exceptions as google_exceptions
+    return isinstance(error, google_exceptions.ResourceExhausted) or getattr(error, "code", None) == 429
+
+def _record_usage(task: str, prompt: str, response):
+    """
+    Counts prompt and output tokens, using the API's usage metadata when the SDK provides it
+    and the character-based estimate otherwise.
+    """
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        prompt_tokens = usage.prompt_token_count
+        output_tokens = usage.candidates_token_count
+    else:
+        try:
+            output_text = response.text
+        except Exception:
+            output_text = ""
+        prompt_tokens, output_tokens = estimate_tokens(prompt), estimate_tokens(output_text)
+    metrics.inc("llm_calls_total", task=task)
+    metrics.inc("llm_tokens_total", prompt_tokens, task=task, direction="prompt")
+    metrics.inc("llm_tokens_total", output_tokens, task=task, direction="output")
+
+def _generate(prompt: str, config: dict = None, task: str = "generic"):
+    """
+    Calls the model through the shared rate limiter, backing off exponentially on 429 responses.
+    """
+    config = config or gen_config
+    for attempt in range(MAX_RETRIES + 1):
+        with metrics.timer("gemini_wait"):
+            rate_limiter.acquire(estimate_tokens(prompt))
+        try:
+            with metrics.timer("gemini"):
+                response = get_model().generate_content(prompt, generation_config=config)
+            _record_usage(task, prompt, response)
+            return response
+        except Exception as e:
+            if not _is_rate_limited(e) or attempt == MAX_RETRIES:
+                raise
+            metrics.inc("llm_rate_limited_total")
+            delay = min(2 ** attempt, 30) + random.uniform(0, 1)
+            logger.warning(f"Rate limited by Gemini, retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+def _generate_text(task: str, prompt: str, config: dict = None, is_valid=None) -> str:
+    """
+    Returns the model's text for `prompt`, served from the LLM cache when the same task, prompt,
+    model and generation config were seen before. Output failing `is_valid` is not cached, so a
+    retry asks the model again instead of getting the same bad answer for the whole TTL.
+    """
+    config = config or gen_config
+    if not llm_cache.is_cacheable(config):
+        return _generate(prompt, config, task).text
+    key = llm_cache.make_key(task, prompt, getattr(model, "model_name", MODEL_NAME), config)
+    text = llm_cache.get(key)
+    if text is None:
+        text = _generate(prompt, config, task).text
+        if is_valid is None or is_valid(text):
+            llm_cache.put(key, text)
+    return text
+
+def _prepare(email_text: str, task: str) -> str:
+    """
+    Strips boilerplate from the email and fits it to the task's prompt budget, recording the savings.
+    """
+    prepared = prepare_email_text(email_text, task)
+    metrics.inc("prompt_tokens_raw_total", estimate_tokens(email_text), task=task)
+    metrics.inc("prompt_tokens_sent_total", estimate_tokens(prepared), task=task)
+    return prepared
+
+def _reused_reply(email_text: str, sender: str):
+    """
+    Returns the reply sent earlier to the same sender for the same text, if any.
+    The index (and NumPy) is only imported on first use, like the Gemini SDK.
+    """
+    from reply_index import reply_index
+    match = reply_index.reusable_reply(email_text, sender)
+    if match is not None:
+        metrics.inc("reply_reuse_total")
+        logger.info(f"Reusing reply {match['id']} for a repeated email from {sender}")
+    return match
 
 def summarize_email(email_text: str) -> str:
     if not email_text.strip():
-        return "Email content is empty."
+        return EMPTY_EMAIL_TEXT
+    email_text = _prepare(email_text, "summary")
     prompt = (
         "Summarize this email in a concise, bullet-point style, preserving key facts:\n\n"
         f"{email_text}\n\nSummary:"
     )
     try:
-        resp = model.generate_content(prompt, generation_config=gen_config)
-        return resp.text.strip()
+        return _generate_text("summary", prompt).strip()
     except Exception as e:
         logger.error(f"Error during summarization: {e}")
         return "An error occurred during summarization."
 
+def _is_malformed_reply(reply: str) -> bool:
+    return len(reply) < 10 or any(c in reply for c in ["�", "𒨷", "¶"])
+
+def is_usable_reply(reply: str) -> bool:
+    # The reply functions return these placeholder texts instead of raising
+    return (bool(reply) and reply != EMPTY_EMAIL_TEXT and "Draft generation failed" not in reply
+            and "error" not in reply.lower())
+
 def generate_reply(email_text: str) -> str:
     if not email_text.strip():
-        return "Email content is empty."
+        return EMPTY_EMAIL_TEXT
+    email_text = _prepare(email_text, "reply")
     prompt = (
         "You are an AI email assistant. Write a clear, polite reply to the following email. "
         "Avoid repeating the original message.\n\n"
         f"Email:\n{email_text}\n\nReply:"
     )
     try:
-        resp = model.generate_content(prompt, generation_config=gen_config)
-        reply = resp.text.strip()
-        if len(reply) < 10 or any(c in reply for c in ["�", "𒨷", "¶"]):
+        reply = _generate_text("reply", prompt, is_valid=lambda text: not _is_malformed_reply(text.strip())).strip()
+        if _is_malformed_reply(reply):
             return "Draft generation failed; reply was too short or malformed."
         return reply
     except Exception as e:
@@ -54,10 +220,112 @@ def generate_reply(email_text: str) -> str:
         return "An error occurred while generating the reply."
 
 def generate_event_title(email_text: str) -> str:
+    email_text = _prepare(email_text, "event_title")
     prompt = f"From this email, generate a short and relevant calendar event title:\n\n{email_text}\n\nTitle:"
     try:
-        resp = model.generate_content(prompt, generation_config=gen_config)
-        return resp.text.strip().split("\n")[0]
+        return _generate_text("event_title", prompt).strip().split("\n")[0]
     except Exception as e:
         logger.error(f"Error generating event title: {e}")
         return "Meeting"
+
+def _parse_analysis(text: str) -> dict:
+    """
+    Parses and validates the JSON produced by analyze_email. Raises ValueError if it does not match the schema.
+    """
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end < start:
+        raise ValueError("no JSON object in model output")
+    data = json.loads(text[start:end + 1])
+    if not isinstance(data, dict):
+        raise ValueError("model output is not a JSON object")
+    for field, field_type in ANALYSIS_FIELDS.items():
+        if not isinstance(data.get(field), field_type):
+            raise ValueError(f"field '{field}' is missing or not a {field_type.__name__}")
+    if not all(isinstance(q, str) for q in data["questions"]):
+        raise ValueError("field 'questions' must be a list of strings")
+    return {field: data[field] for field in ANALYSIS_FIELDS}
+
+def _is_valid_analysis(text: str) -> bool:
+    try:
+        return not _is_malformed_reply(_parse_analysis(text)["reply"].strip())
+    except ValueError:
+        return False
+
+def analyze_email(email_text: str, sender: str = None) -> dict:
+    """
+    Produces the summary, reply draft, event title and detected questions for an email in a single
+    model call. Falls back to the individual calls if the combined output cannot be parsed.
+    If `sender` sent exactly this text before, the reply sent then is reused and no call is made:
+    the result carries the stored reply's id as `reused_from`, an extractive summary of this email
+    and no event title (see event_title_for).
+    """
+    if not email_text.strip():
+        return {
+            "summary": EMPTY_EMAIL_TEXT,
+            "reply": EMPTY_EMAIL_TEXT,
+            "event_title": "Meeting",
+            "questions": [],
+        }
+    match = _reused_reply(email_text, sender) if sender else None
+    if match is not None:
+        return {
+            "summary": condense(strip_boilerplate(email_text) or email_text.strip(), REUSED_SUMMARY_BUDGET),
+            "reply": match["reply"],
+            "event_title": None,
+            "questions": extract_questions(email_text),
+            "reused_from": match["id"],
+        }
+    prepared = _prepare(email_text, "analysis")
+    prompt = (
+        "You are an AI email assistant. Analyze the following email and respond with only a JSON object "
+        "matching this schema:\n"
+        '{"summary": string, "reply": string, "event_title": string, "questions": [string]}\n'
+        "- summary: concise bullet-point summary preserving key facts\n"
+        "- reply: a clear, polite reply that avoids repeating the original message\n"
+        "- event_title: a short, relevant calendar event title\n"
+        "- questions: questions the sender asks, quoted verbatim (empty list if none)\n\n"
+        f"Email:\n{prepared}\n\nJSON:"
+    )
+    try:
+        analysis = _parse_analysis(_generate_text("analysis", prompt, analysis_config, is_valid=_is_valid_analysis))
+    except Exception as e:
+        logger.warning(f"Combined analysis failed, falling back to individual calls: {e}")
+        return {
+            "summary": summarize_email(email_text),
+            "reply": generate_reply(email_text),
+            "event_title": generate_event_title(email_text),
+            "questions": extract_questions(email_text),
+        }
+
+    analysis["summary"] = analysis["summary"].strip()
+    analysis["reply"] = analysis["reply"].strip()
+    if _is_malformed_reply(analysis["reply"]):
+        analysis["reply"] = "Draft generation failed; reply was too short or malformed."
+    analysis["event_title"] = analysis["event_title"].strip().split("\n")[0] or "Meeting"
+    return analysis
+
+def event_title_for(analysis: dict, email_text: str) -> str:
+    """
+    The analysis' event title. A reused reply comes without one, so it is generated only when needed.
+    """
+    return analysis["event_title"] or generate_event_title(email_text)
+
+def analyze_emails(email_texts, max_workers: int = LLM_WORKERS, progress=None, senders=None) -> list:
+    """
+    Runs analyze_email over many emails concurrently, keeping the order of `email_texts`.
+    `senders`, if given, holds the sender of each email. `progress(done, total, message)` is called
+    as analyses finish; if it raises, analyses that have not started yet are cancelled.
+    """
+    email_texts = list(email_texts)
+    if not email_texts:
+        return []
+    senders = list(senders) if senders is not None else [None] * len(email_texts)
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(email_texts)))
+    try:
+        futures = [executor.submit(analyze_email, text, sender) for text, sender in zip(email_texts, senders)]
+        if progress:
+            for done, _ in enumerate(as_completed(futures), start=1):
+                progress(done, len(futures), f"Analyzed {done}/{len(futures)} email(s)")
+        return [future.result() for future in futures]
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
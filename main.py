@@ -1,159 +1,153 @@
 # main.py
 
-from googleapiclient.discovery import build
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
 from web_search import search_web_duckduckgo
-from calendar_integration import create_event, extract_meeting_datetime
+from calendar_integration import create_event, extract_meeting_datetime, DEFAULT_TIMEZONE
+from calendar_scheduler import EventScheduler
 from nlp_utils import extract_questions, is_human_sender
-from database import init_db, SessionLocal, Email
-from llm_integration import summarize_email, generate_reply, generate_event_title
+from rules import rule_engine
+from database import (
+    init_db,
+    SessionLocal,
+    utcnow,
+    Email,
+    query_pending_emails,
+    record_attempt_failure,
+    STATUS_CLASSIFIED,
+    STATUS_REPLIED,
+    STATUS_SKIPPED,
+    STATUS_SUPERSEDED,
+)
+from llm_integration import analyze_email, analyze_emails, event_title_for, is_usable_reply
 from email_actions import send_email
+from gmail_sync import sync_mailbox, mark_emails_as_read
+from google_clients import authenticate_google_services
+from jobs import no_progress
 from slack_bot import send_slack_message
-from email.utils import parsedate_to_datetime
+from metrics import metrics
+from threads import collapse_threads
 from datetime import datetime
-from dateutil.tz import gettz
-from bs4 import BeautifulSoup
-import os
-import base64
+import argparse
 from dotenv import load_dotenv
-import socket
-
-def get_free_port():
-    with socket.socket() as s:
-        s.bind(('', 0))
-        return s.getsockname()[1]
 
 load_dotenv()
 
-SCOPES = [
-    'https://www.googleapis.com/auth/gmail.readonly',
-    'https://www.googleapis.com/auth/gmail.send',
-    'https://www.googleapis.com/auth/gmail.modify',
-    'https://www.googleapis.com/auth/calendar.events'
-]
-
 def extract_question_from_email(text):
     questions = extract_questions(text)
     return questions[0] if questions else None
 
-def authenticate_google_services():
-    creds = None
-    if os.path.exists('token.json'):
-        creds = Credentials.from_authorized_user_file('token.json', SCOPES)
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            client_id = os.getenv("GOOGLE_CLIENT_ID")
-            client_secret = os.getenv("GOOGLE_CLIENT_SECRET")
-            if not client_id or not client_secret:
-                raise RuntimeError("Google OAuth credentials not found in environment variables.")
-
-            flow = InstalledAppFlow.from_client_config(
-                {
-                    "installed": {
-                        "client_id": client_id,
-                        "client_secret": client_secret,
-                        "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-                        "token_uri": "https://oauth2.googleapis.com/token",
-                        "redirect_uris": ["http://localhost"]
-                    }
-                },
-                SCOPES
-            )
-            port = get_free_port()
-            creds = flow.run_local_server(port=port, open_browser=False)
-            with open('token.json', 'w') as token:
-                token.write(creds.to_json())
-
-    gmail_service = build('gmail', 'v1', credentials=creds)
-    calendar_service = build('calendar', 'v3', credentials=creds)
-    return gmail_service, calendar_service
-
-
-
-def parse_email_body(payload):
-    parts = payload.get("parts")
-    if parts:
-        for part in parts:
-            mime_type = part.get("mimeType")
-            data = part.get("body", {}).get("data")
-            if mime_type == "text/plain" and data:
-                return base64.urlsafe_b64decode(data).decode("utf-8")
-            elif mime_type == "text/html" and data:
-                html = base64.urlsafe_b64decode(data).decode("utf-8")
-                return BeautifulSoup(html, "html.parser").get_text()
-    else:
-        data = payload.get("body", {}).get("data")
-        if data:
-            return base64.urlsafe_b64decode(data).decode("utf-8")
-    return ""
-
-def fetch_and_store_emails(service):
-    session = SessionLocal()
-    results = service.users().messages().list(userId='me', maxResults=10, q="is:unread").execute()
-    messages = results.get('messages', [])
-
-    for msg in messages:
-        full_msg = service.users().messages().get(userId='me', id=msg['id']).execute()
-        payload = full_msg.get('payload', {})
-        headers = payload.get('headers', [])
-
-        email_data = {
-            'id': full_msg['id'],
-            'thread_id': full_msg['threadId'],
-            'sender': '',
-            'recipient': '',
-            'subject': '',
-            'date': None,
-            'body': parse_email_body(payload),
-        }
-        for header in headers:
-            name = header['name']
-            value = header['value']
-            if name == 'From':
-                email_data['sender'] = value
-            elif name == 'To':
-                email_data['recipient'] = value
-            elif name == 'Subject':
-                email_data['subject'] = value
-            elif name == 'Date':
-                email_data['date'] = parsedate_to_datetime(value)
-
-        if not session.query(Email).filter_by(id=email_data['id']).first():
-            email = Email(**email_data)
-            session.add(email)
-            print(f"✅ Stored email: {email.subject}")
-            slack_msg = f"📬 *New Email Received!*\n*Subject:* {email.subject}\n*From:* {email.sender}"
-            send_slack_message(message=slack_msg)
-    session.commit()
-    session.close()
-
-def mark_email_as_read(service, msg_id):
-    service.users().messages().modify(userId='me', id=msg_id, body={'removeLabelIds': ['UNREAD']}).execute()
-    print(f"📭 Marked email {msg_id} as read")
-
 def auto_reply_unread_emails(gmail_service, calendar_service):
+    """
+    Replies to emails that are still pending. Finished emails keep their status, so each run only
+    pays for mail that arrived (or failed) since the last one. Pending emails of one thread get a
+    single reply to the newest of them, written with the earlier messages as context.
+    """
+    from reply_index import reply_index  # NumPy is only imported once there is mail to answer
     session = SessionLocal()
-    emails = session.query(Email).all()
+    emails = query_pending_emails(session).all()
 
+    candidates = []
     for email in emails:
-        if not is_human_sender(email.sender):
+        if email.is_automated or not is_human_sender(email.sender):
             print(f"🤖 Ignored bot/newsletter sender: {email.sender}")
+            email.status = STATUS_SKIPPED
             continue
+        email.status = STATUS_CLASSIFIED
+        candidates.append(email)
+    threads = collapse_threads(session, candidates)
+    for thread in threads:
+        thread['email'].attempts = (thread['email'].attempts or 0) + 1
+    session.commit()
+    if len(threads) < len(candidates):
+        print(f"🧵 {len(candidates)} pending email(s) collapsed into {len(threads)} thread(s)")
 
-        reply = generate_reply(email.body)
+    analyses = analyze_emails([thread['text'] for thread in threads],
+                              senders=[thread['email'].sender for thread in threads])
 
-        if reply and "Draft generation failed" not in reply and "error" not in reply.lower():
+    for thread, analysis in zip(threads, analyses):
+        email = thread['email']
+        email.summary = analysis["summary"]
+        reply = analysis["reply"]
+        if is_usable_reply(reply):
             send_email(gmail_service, email.sender, f"Re: {email.subject}", reply)
+            # Committed before anything else can fail, so the reply is never sent twice
+            email.status = STATUS_REPLIED
+            email.replied_at = utcnow()
+            for older in thread['superseded']:
+                older.status = STATUS_SUPERSEDED
+            session.commit()
             print(f"✅ Auto-reply sent to {email.sender} for email {email.id}")
-            mark_email_as_read(gmail_service, email.id)
+            mark_emails_as_read(gmail_service, [email.id] + [older.id for older in thread['superseded']])
+            reply_index.add(email.id, thread['text'], analysis, sender=email.sender)
         else:
             print(f"📝 No auto-reply sent for email {email.id}")
+            record_attempt_failure(email)
+            session.commit()
     session.close()
 
+def reply_to_emails(gmail_service, calendar_service, email_ids, duration_minutes=30, timezone=DEFAULT_TIMEZONE,
+                    progress=no_progress):
+    """
+    Replies to the given emails, once per thread, and schedules the meetings they mention.
+    Each reply is committed as soon as it is sent, so stopping midway (e.g. `progress` raising on
+    cancellation) never sends one twice; the meetings of emails replied to so far are still created.
+    Returns the number of replies sent and events created.
+    """
+    from reply_index import reply_index
+    session = SessionLocal()
+    try:
+        emails = session.query(Email).filter(Email.id.in_(list(email_ids))).all()
+        # Emails replied to before statuses existed still carry the old '[Replied]' subject tag
+        emails = [email for email in emails
+                  if email.status != STATUS_REPLIED and '[Replied]' not in (email.subject or '')]
+        threads = collapse_threads(session, emails)
+        for thread in threads:
+            thread['email'].attempts = (thread['email'].attempts or 0) + 1
+        session.commit()
+
+        progress(0, len(threads), f"Analyzing {len(threads)} thread(s)")
+        analyses = analyze_emails([thread['text'] for thread in threads], progress=progress,
+                                  senders=[thread['email'].sender for thread in threads])
+
+        scheduler = EventScheduler(calendar_service, duration_minutes=duration_minutes, timezone=timezone)
+        replied = 0
+        try:
+            for done, (thread, analysis) in enumerate(zip(threads, analyses), start=1):
+                progress(done - 1, len(threads), f"Replying {done}/{len(threads)}")
+                email = thread['email']
+                email.summary = analysis["summary"]
+                reply = analysis["reply"]
+                if is_usable_reply(reply):
+                    send_email(gmail_service, email.sender, f"Re: {email.subject}", reply)
+                    email.status = STATUS_REPLIED
+                    email.replied_at = utcnow()
+                    reply_index.add(email.id, thread['text'], analysis, sender=email.sender)
+                    for older in thread['superseded']:
+                        older.status = STATUS_SUPERSEDED
+                    parsed_dt = extract_meeting_datetime(email.body, email_received_date=email.date or datetime.now())
+                    if parsed_dt and not email.event_id:
+                        # Naive times are taken to be in `timezone`; a zone named in the email is kept
+                        start_time = parsed_dt.replace(second=0, microsecond=0)
+                        scheduler.add(event_title_for(analysis, thread['text']), start_time,
+                                      thread_id=email.thread_id, email_id=email.id)
+                    replied += 1
+                else:
+                    record_attempt_failure(email)
+                session.commit()
+
+            progress(len(threads), len(threads), "Scheduling meetings")
+        finally:
+            # Also runs when the job is cancelled: these emails are already marked replied, so their
+            # meetings would never be created otherwise
+            results = scheduler.flush()
+            emails_by_id = {thread['email'].id: thread['email'] for thread in threads}
+            for result in results:
+                if result.get('event_id') and result.get('email_id') in emails_by_id:
+                    emails_by_id[result['email_id']].event_id = result['event_id']
+            session.commit()
+    finally:
+        session.close()
+    return {'replied': replied, 'events': sum(result['status'] == 'created' for result in results)}
+
 def demo_llm_integration(calendar_service):
     session = SessionLocal()
     email = session.query(Email).order_by(Email.date.desc()).first()
@@ -164,17 +158,19 @@ def demo_llm_integration(calendar_service):
     print(f"\n📬 Email Subject: {email.subject}")
     print(f"\n📝 Email Body:\n{email.body}\n")
 
-    summary = summarize_email(email.body)
+    # One combined model call over the newest message and a compact excerpt of its thread
+    analysis = analyze_email(collapse_threads(session, [email])[0]['text'])
+    summary = analysis["summary"]
     print("🔍 === Summary ===")
     print(summary)
 
-    reply = generate_reply(email.body)
+    reply = analysis["reply"]
     print("\n✉️ === Draft Reply ===")
     print(reply)
 
     send_slack_message(f"🧠 *Summary of:* {email.subject}\n{summary}")
 
-    question = extract_question_from_email(email.body)
+    question = analysis["questions"][0] if analysis["questions"] else None
     if question:
         print(f"\n❓ Question Detected: {question}")
         search_results = search_web_duckduckgo(question)
@@ -183,16 +179,15 @@ def demo_llm_integration(calendar_service):
         slack_info = f"🔍 *Answer Found for:* {question}\n{search_results[:500]}..."
         send_slack_message(message=slack_info)
 
-    keywords_for_calendar = ["interview", "meeting", "date", "time", "schedule", "appointment", "call", "event", "calendar", "reminder"]
-    if any(keyword in email.body.lower() for keyword in keywords_for_calendar):
+    if rule_engine.has_calendar_keywords(email.body):
         print("\n🗓️ Looking for meeting details in email...")
         email_date = email.date or datetime.now()
         parsed_dt = extract_meeting_datetime(email.body, email_received_date=email_date)
 
         if parsed_dt:
-            event_start_time = parsed_dt.replace(second=0, microsecond=0, tzinfo=gettz("Asia/Kolkata"))
+            event_start_time = parsed_dt.replace(second=0, microsecond=0)
             event_start_str = event_start_time.isoformat()
-            meeting_summary = generate_event_title(email.body)
+            meeting_summary = analysis["event_title"]
             event_link = create_event(calendar_service, meeting_summary, event_start_str)
 
             if event_link:
@@ -213,9 +208,31 @@ def demo_llm_integration(calendar_service):
 
     session.close()
 
-if __name__ == '__main__':
+def run_once():
     init_db()
     gmail_service, calendar_service = authenticate_google_services()
-    fetch_and_store_emails(gmail_service)
+    sync_mailbox(gmail_service)
     auto_reply_unread_emails(gmail_service, calendar_service)
     demo_llm_integration(calendar_service)
+    metrics.write_file()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="AI email assistant")
+    subcommands = parser.add_subparsers(dest='command')
+    subcommands.add_parser('run', help="sync, auto-reply and run the LLM demo once (default)")
+    serve_parser = subcommands.add_parser('serve', help="keep polling and processing mail until stopped")
+    serve_parser.add_argument('--poll-interval', type=float, default=60, help="seconds between mailbox polls")
+    serve_parser.add_argument('--queue-size', type=int, default=100, help="capacity of each stage queue")
+    serve_parser.add_argument('--llm-workers', type=int, default=None, help="concurrent LLM calls")
+    serve_parser.add_argument('--metrics-port', type=int, default=None,
+                              help="serve Prometheus metrics on this port (default: METRICS_PORT)")
+    serve_parser.add_argument('--timezone', default=DEFAULT_TIMEZONE, help="timezone of scheduled meetings")
+    serve_parser.add_argument('--meeting-duration', type=int, default=30, help="meeting length in minutes")
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        from pipeline import serve
+        serve(poll_interval=args.poll_interval, queue_size=args.queue_size, llm_workers=args.llm_workers,
+              metrics_port=args.metrics_port, timezone=args.timezone, duration_minutes=args.meeting_duration)
+    else:
+        run_once()
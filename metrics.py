@@ -0,0 +1,261 @@
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Latency bucket upper bounds in seconds, from sub-millisecond regex work up to slow LLM calls
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+METRICS_FILE = os.getenv("METRICS_FILE")  # Written by write_file() when set
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # Serve /metrics over HTTP when non-zero
+METRIC_PREFIX = "email_assistant"
+_SAMPLE_RE = re.compile(r"^(\w+)(?:\{(.*)\})? (\S+)$")
+_LABEL_RE = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _unescape(value):
+    return re.sub(r"\\(.)", lambda m: "\n" if m.group(1) == "n" else m.group(1), value)
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "count", "total", "errors")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+
+    def observe(self, seconds):
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.total += seconds
+
+    def quantile(self, q):
+        """
+        Estimates a quantile from the bucket counts (upper bound of the bucket that reaches it).
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+class Metrics:
+    """
+    In-process registry of per-stage latency histograms, error counts and plain counters (such as
+    LLM tokens). Thread-safe and dependency-free; `render_prometheus` produces the Prometheus text
+    exposition format for the optional HTTP endpoint or the metrics file.
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._histograms = {}
+        self._counters = defaultdict(float)  # (name, sorted label pairs) -> value
+        self._gauges = {}  # same keys as _counters
+        self._lock = threading.Lock()
+        self._server = None
+
+    def observe(self, stage, seconds, error=False):
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = _Histogram(self.buckets)
+            histogram.observe(seconds)
+            if error:
+                histogram.errors += 1
+
+    @contextmanager
+    def timer(self, stage):
+        """
+        Times the block as one call of `stage`; an exception escaping the block is counted as an error.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.observe(stage, time.perf_counter() - started, error=True)
+            raise
+        self.observe(stage, time.perf_counter() - started)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += amount
+
+    def set_gauge(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = value
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._gauges.clear()
+
+    def snapshot(self):
+        """
+        Returns one summary dict per stage (calls, errors, error rate, mean/p50/p95 latency in ms)
+        and the counters and gauges as {(name, labels): value}.
+        """
+        with self._lock:
+            stages = []
+            for stage, h in sorted(self._histograms.items()):
+                stages.append({
+                    "stage": stage,
+                    "calls": h.count,
+                    "errors": h.errors,
+                    "error_rate": h.errors / h.count if h.count else 0.0,
+                    "total_s": h.total,
+                    "mean_ms": h.total / h.count * 1000 if h.count else 0.0,
+                    "p50_ms": h.quantile(0.5) * 1000,
+                    "p95_ms": h.quantile(0.95) * 1000,
+                })
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+        return {"stages": stages, "counters": counters, "gauges": gauges}
+
+    def render_prometheus(self):
+        with self._lock:
+            lines = [
+                f"# HELP {METRIC_PREFIX}_stage_seconds Latency of each processing stage.",
+                f"# TYPE {METRIC_PREFIX}_stage_seconds histogram",
+            ]
+            for stage, h in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, n in zip(h.buckets, h.counts):
+                    cumulative += n
+                    lines.append(f"{METRIC_PREFIX}_stage_seconds_bucket"
+                                 f"{_format_labels([('stage', stage), ('le', bound)])} {cumulative}")
+                lines.append(f"{METRIC_PREFIX}_stage_seconds_bucket"
+                             f"{_format_labels([('stage', stage), ('le', '+Inf')])} {h.count}")
+                lines.append(f"{METRIC_PREFIX}_stage_seconds_sum{_format_labels([('stage', stage)])} {h.total}")
+                lines.append(f"{METRIC_PREFIX}_stage_seconds_count{_format_labels([('stage', stage)])} {h.count}")
+
+            lines += [
+                f"# HELP {METRIC_PREFIX}_stage_errors_total Calls of each stage that raised.",
+                f"# TYPE {METRIC_PREFIX}_stage_errors_total counter",
+            ]
+            for stage, h in sorted(self._histograms.items()):
+                lines.append(f"{METRIC_PREFIX}_stage_errors_total{_format_labels([('stage', stage)])} {h.errors}")
+
+            for kind, values in (("counter", self._counters), ("gauge", self._gauges)):
+                typed = set()
+                for (name, labels), value in sorted(values.items()):
+                    if name not in typed:
+                        lines.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+                        typed.add(name)
+                    lines.append(f"{METRIC_PREFIX}_{name}{_format_labels(labels)} {value:.15g}")
+        return "\n".join(lines) + "\n"
+
+    def write_file(self, path=METRICS_FILE):
+        """
+        Writes the Prometheus text to `path` (for node_exporter's textfile collector or manual
+        inspection). Does nothing when no path is configured.
+        """
+        if not path:
+            return
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render_prometheus())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def from_prometheus(cls, text, buckets=LATENCY_BUCKETS):
+        """
+        Rebuilds a registry from `render_prometheus` output, so one process can show the metrics
+        another one wrote (e.g. the metrics file of `main.py serve`).
+        """
+        registry = cls(buckets)
+        kinds, cumulative = {}, defaultdict(dict)  # stage -> {bucket bound: cumulative count}
+        prefix = f"{METRIC_PREFIX}_"
+        for line in text.splitlines():
+            if line.startswith("# TYPE "):
+                _, _, name, kind = line.split()
+                kinds[name] = kind
+                continue
+            match = _SAMPLE_RE.match(line)
+            if not match or not match.group(1).startswith(prefix):
+                continue
+            full_name, value = match.group(1), float(match.group(3))
+            name = full_name[len(prefix):]
+            labels = {key: _unescape(raw) for key, raw in _LABEL_RE.findall(match.group(2) or "")}
+            if name.startswith("stage_"):
+                stage = labels["stage"]
+                histogram = registry._histograms.setdefault(stage, _Histogram(buckets))
+                if name == "stage_seconds_bucket" and labels["le"] != "+Inf":
+                    cumulative[stage][float(labels["le"])] = value
+                elif name == "stage_seconds_sum":
+                    histogram.total = value
+                elif name == "stage_seconds_count":
+                    histogram.count = int(value)
+                elif name == "stage_errors_total":
+                    histogram.errors = int(value)
+            elif kinds.get(full_name) == "gauge":
+                registry.set_gauge(name, value, **labels)
+            else:
+                registry.inc(name, value, **labels)
+
+        for stage, counts in cumulative.items():
+            histogram, previous = registry._histograms[stage], 0
+            for i, bound in enumerate(buckets):
+                total = int(counts.get(bound, previous))
+                histogram.counts[i] = total - previous
+                previous = total
+        return registry
+
+    @classmethod
+    def load_file(cls, path=METRICS_FILE):
+        """
+        Reads the metrics file written by `write_file`. Returns None when no file is configured or written yet.
+        """
+        if not path or not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            return cls.from_prometheus(f.read())
+
+    def start_http_server(self, port=METRICS_PORT, host="0.0.0.0"):
+        """
+        Serves the metrics at http://host:port/metrics from a daemon thread. Calling it again is a no-op.
+        """
+        if not port or self._server is not None:
+            return self._server
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+        print(f"📈 Metrics served on http://{host}:{port}/metrics")
+        return self._server
+
+metrics = Metrics()
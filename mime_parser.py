@@ -0,0 +1,64 @@
+import base64
+import os
+import re
+from bs4 import BeautifulSoup
+
+# Bodies are cut to this many decoded bytes so huge newsletters can't stall the pipeline
+MAX_BODY_BYTES = int(os.getenv("MAX_BODY_BYTES", str(256 * 1024)))
+CHARSET_RE = re.compile(r'charset="?([\w.:-]+)"?', re.IGNORECASE)
+
+def _is_attachment(part):
+    return bool(part.get("filename")) or "attachmentId" in part.get("body", {})
+
+def _charset(part):
+    for header in part.get("headers", []):
+        if header["name"].lower() == "content-type":
+            match = CHARSET_RE.search(header["value"])
+            if match:
+                return match.group(1)
+    return "utf-8"
+
+def _decode(part, max_bytes):
+    data = part["body"]["data"]
+    # base64 carries 3 bytes in every 4 characters, so trim the encoded string before decoding
+    max_chars = -(-max_bytes // 3) * 4
+    data = data[:max_chars]
+    raw = base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))[:max_bytes]
+    try:
+        return raw.decode(_charset(part), errors="replace")
+    except LookupError:
+        return raw.decode("utf-8", errors="replace")
+
+def find_part(payload, mime_type):
+    """
+    Walks the MIME tree depth-first and returns the first inline part of `mime_type` that has data.
+    Attachments are skipped without being decoded.
+    """
+    stack = [payload]
+    while stack:
+        part = stack.pop()
+        if part.get("parts"):
+            stack.extend(reversed(part["parts"]))
+        elif (part.get("mimeType") == mime_type and not _is_attachment(part)
+              and part.get("body", {}).get("data")):
+            return part
+    return None
+
+def html_to_text(html):
+    soup = BeautifulSoup(html, "lxml")
+    for tag in soup(["script", "style", "head"]):
+        tag.decompose()
+    return soup.get_text()
+
+def extract_body(payload, max_bytes=MAX_BODY_BYTES):
+    """
+    Returns the text of a Gmail message payload, preferring text/plain anywhere in the MIME tree
+    and falling back to text/html converted to text.
+    """
+    part = find_part(payload, "text/plain")
+    if part:
+        return _decode(part, max_bytes)
+    part = find_part(payload, "text/html")
+    if part:
+        return html_to_text(_decode(part, max_bytes))
+    return ""
@@ -1,19 +1,103 @@
-import spacy
+import re
+import threading
+from rules import rule_engine
+from metrics import metrics
 
-# Load spaCy NLP model
-nlp = spacy.load("en_core_web_sm")
+# spaCy pipelines are loaded on first use by _get_pipeline()
+_pipelines = {}
+_pipelines_lock = threading.Lock()
 
-def extract_questions(text):
+# Where a quoted earlier message starts: "On <date>, <name> wrote:" (possibly wrapped onto two
+# lines), Outlook's "-----Original Message-----", or a forwarded "From: ... Sent: ..." block.
+QUOTE_HEADER_RE = re.compile(
+    r"^[ \t]*(?:On\b[^\n]{0,200}(?:\n[^\n]{0,200})?\bwrote:[ \t]*$"
+    r"|-{2,}[ \t]*Original Message[ \t]*-{2,}"
+    r"|From:[^\n]*\n(?:[^\n]*\n)?Sent:)",
+    re.MULTILINE | re.IGNORECASE,
+)
+QUOTED_LINE_RE = re.compile(r"^[ \t]*>.*(?:\n|$)", re.MULTILINE)
+SIGNATURE_RE = re.compile(r"^(?:--[ \t]?|__+|Sent from my \w+.*)$", re.MULTILINE)
+# Sentence ends at . ! or ? followed by whitespace, or at a blank line
+SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+|\n[ \t]*\n")
+
+def _get_pipeline(kind):
+    """
+    Loads a spaCy pipeline once per process. "parser" is en_core_web_sm without NER and the
+    lemmatizer; "sentencizer" is a blank English pipeline with the rule-based sentencizer.
+    """
+    if kind not in _pipelines:
+        with _pipelines_lock:
+            if kind not in _pipelines:
+                with metrics.timer("spacy_load"):
+                    import spacy
+                    if kind == "parser":
+                        nlp = spacy.load("en_core_web_sm", disable=["ner", "lemmatizer"])
+                    else:
+                        nlp = spacy.blank("en")
+                        nlp.add_pipe("sentencizer")
+                _pipelines[kind] = nlp
+    return _pipelines[kind]
+
+def get_nlp():
+    """
+    Returns the full spaCy pipeline, loading it on first use.
+    """
+    return _get_pipeline("parser")
+
+def strip_quoted_text(text):
+    """
+    Removes quoted replies: everything after a reply/forward header and any line starting with '>'.
+    """
+    match = QUOTE_HEADER_RE.search(text)
+    if match:
+        text = text[:match.start()]
+    return QUOTED_LINE_RE.sub("", text)
+
+def strip_signature(text):
+    match = SIGNATURE_RE.search(text)
+    return text[:match.start()] if match else text
+
+def clean_email_text(text):
+    return strip_signature(strip_quoted_text(text)).strip()
+
+def _questions_from_sentences(sentences):
+    return [s.strip() for s in sentences if s.strip().endswith('?')]
+
+def extract_questions(text, mode="fast", strip_quotes=True):
+    """
+    Returns sentences ending with a '?'. Quoted replies and signatures are stripped first unless
+    `strip_quotes` is False. `mode` selects the sentence splitter:
+    "fast" (regex, no spaCy, the default), "sentencizer" (spaCy's rule-based sentencizer) or "parser"
+    (full spaCy parse), which only runs when asked for.
+    """
+    if strip_quotes:
+        text = clean_email_text(text)
+    if mode == "fast":
+        return _questions_from_sentences(SENTENCE_SPLIT_RE.split(text))
+    nlp = _get_pipeline(mode)
+    with metrics.timer("spacy"):
+        doc = nlp(text)
+    return _questions_from_sentences(sent.text for sent in doc.sents)
+
+def extract_questions_batch(texts, mode="fast", strip_quotes=True, n_process=1, batch_size=64):
     """
-    Uses spaCy to split text into sentences and return sentences ending with a '?'.
+    Extracts questions from many emails at once, with the same modes as extract_questions. The spaCy
+    modes stream the texts through `nlp.pipe`, optionally across `n_process` worker processes.
     """
-    doc = nlp(text)
-    questions = [sent.text.strip() for sent in doc.sents if sent.text.strip().endswith('?')]
-    return questions
+    if strip_quotes:
+        texts = [clean_email_text(text) for text in texts]
+    if mode == "fast":
+        return [_questions_from_sentences(SENTENCE_SPLIT_RE.split(text)) for text in texts]
+    nlp = _get_pipeline(mode)
+    with metrics.timer("spacy_batch"):
+        return [
+            _questions_from_sentences(sent.text for sent in doc.sents)
+            for doc in nlp.pipe(texts, n_process=n_process, batch_size=batch_size)
+        ]
 
-def is_human_sender(sender_email: str) -> bool:
+def is_human_sender(sender_email: str, headers=None) -> bool:
     """
     Returns True if sender does not appear to be a bot, notification, or newsletter.
+    Pass the message headers to also catch bulk mail such as List-Unsubscribe or Precedence: bulk.
     """
-    keywords_to_exclude = ["no-reply", "noreply", "newsletter", "slack", "notification", "mailer", "mailbot", "automated"]
-    return all(kw not in sender_email.lower() for kw in keywords_to_exclude)
+    return rule_engine.is_human(sender_email, headers)
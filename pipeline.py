@@ -0,0 +1,289 @@
+import queue
+import signal
+import threading
+import time
+from datetime import datetime
+from calendar_integration import extract_meeting_datetime, DEFAULT_TIMEZONE
+from calendar_scheduler import EventScheduler
+from database import (
+    init_db,
+    SessionLocal,
+    utcnow,
+    Email,
+    set_sync_state,
+    start_pending_window,
+    query_pending_emails,
+    record_attempt_failure,
+    PENDING_STATUSES,
+    STATUS_NEW,
+    STATUS_CLASSIFIED,
+    STATUS_REPLIED,
+    STATUS_SKIPPED,
+    STATUS_SUPERSEDED,
+)
+from email_actions import send_email
+from gmail_sync import fetch_messages, list_mailbox_changes, mark_emails_as_read, store_messages, BATCH_SIZE, HISTORY_ID_KEY
+from google_clients import authenticate_google_services, get_client_factory
+from llm_integration import analyze_email, event_title_for, is_usable_reply, LLM_WORKERS
+from metrics import metrics, METRICS_PORT
+from nlp_utils import is_human_sender
+from slack_bot import notifier
+from threads import collapse_threads
+
+STAGES = ('parse', 'classify', 'llm', 'act')
+
+class Pipeline:
+    """
+    Long-running mail processor: ingest -> parse -> classify -> LLM -> act, each stage with its own
+    worker threads and connected by bounded queues so a slow stage applies back-pressure upstream.
+
+    Progress is persisted in Email.status. Whenever the pipeline is idle, stored emails that are not
+    finished (after a restart, or a failed attempt) are queued again at the stage where they stopped.
+    A Gmail historyId is only saved once every message it covers has been stored. When several
+    messages of one thread are pending, only the newest is answered, with the earlier ones as context.
+    """
+    def __init__(self, gmail_service, calendar_service, poll_interval=60, queue_size=100, workers=None,
+                 timezone=DEFAULT_TIMEZONE, duration_minutes=30):
+        self.gmail_service = gmail_service
+        self.calendar_service = calendar_service
+        self.poll_interval = poll_interval
+        self.timezone = timezone
+        self.duration_minutes = duration_minutes
+        self.workers = {'parse': 1, 'classify': 1, 'llm': LLM_WORKERS, 'act': 1}
+        self.workers.update(workers or {})
+        self.queues = {stage: queue.Queue(maxsize=queue_size) for stage in STAGES}
+        self.stop_event = threading.Event()
+        self.fetch_failed = threading.Event()
+        self.threads = []
+
+    def start(self):
+        handlers = {'parse': self._parse, 'classify': self._classify, 'llm': self._llm, 'act': self._act}
+        self.threads.append(threading.Thread(target=self._ingest, name='ingest', daemon=True))
+        for stage in STAGES:
+            for n in range(self.workers[stage]):
+                self.threads.append(threading.Thread(target=self._worker, args=(stage, handlers[stage]),
+                                                     name=f'{stage}-{n}', daemon=True))
+        for thread in self.threads:
+            thread.start()
+        print(f"🚀 Pipeline started with workers {self.workers}")
+
+    def stop(self, timeout=30.0):
+        """
+        Stops polling and lets every worker finish the item it is working on. Queued items are not
+        lost: their state is in the database and they are picked up again on the next start.
+        """
+        self.stop_event.set()
+        deadline = time.monotonic() + timeout
+        for thread in self.threads:
+            thread.join(max(deadline - time.monotonic(), 0))
+        print("🛑 Pipeline stopped")
+
+    def _put(self, stage, item):
+        # Blocking put that still notices shutdown
+        while not self.stop_event.is_set():
+            try:
+                self.queues[stage].put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _worker(self, stage, handler):
+        work = self.queues[stage]
+        while not self.stop_event.is_set():
+            try:
+                item = work.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                with metrics.timer(f'pipeline_{stage}'):
+                    handler(item)
+            except Exception as e:
+                print(f"❌ {stage} stage failed on {item!r}: {e}")
+            finally:
+                work.task_done()
+
+    # -------------------- Stages --------------------
+    def _requeue_pending(self):
+        # Only while no stage has work in flight, so an email is never queued twice
+        if any(self.queues[stage].unfinished_tasks for stage in STAGES):
+            return
+        session = SessionLocal()
+        pending = [(email.id, email.status) for email in query_pending_emails(session)]
+        session.close()
+        if pending:
+            print(f"♻️ Re-queuing {len(pending)} unfinished email(s)")
+        for email_id, status in pending:
+            self._put('classify' if status == STATUS_NEW else 'llm', email_id)
+
+    def _ingest(self):
+        while not self.stop_event.is_set():
+            try:
+                self._requeue_pending()
+                self._poll()
+            except Exception as e:
+                print(f"❌ Mailbox poll failed: {e}")
+            self.write_metrics()
+            self.stop_event.wait(self.poll_interval)
+
+    def write_metrics(self):
+        """
+        Records the current queue depths and writes the metrics file, if one is configured.
+        """
+        for stage in STAGES:
+            metrics.set_gauge('queue_depth', self.queues[stage].qsize(), stage=stage)
+        for name, value in get_client_factory().stats().items():
+            metrics.set_gauge(f'google_client_{name}', value)
+        from reply_index import reply_index  # Imported on first use, like in main.py
+        metrics.set_gauge('reply_index_size', reply_index.stats()['replies'])
+        try:
+            metrics.write_file()
+        except OSError as e:
+            print(f"⚠️ Could not write metrics file: {e}")
+
+    def _poll(self):
+        session = SessionLocal()
+        try:
+            with metrics.timer('gmail_list'):
+                message_ids, history_id = list_mailbox_changes(self.gmail_service, session)
+            session.commit()
+            self.fetch_failed.clear()
+            for start in range(0, len(message_ids), BATCH_SIZE):
+                if not self._put('parse', message_ids[start:start + BATCH_SIZE]):
+                    return
+            # Only move the cursor once every message it covers has been stored
+            while self.queues['parse'].unfinished_tasks:
+                if self.stop_event.wait(0.1):
+                    return
+            start_pending_window(session, message_ids)
+            if self.fetch_failed.is_set():
+                # The next poll replays the same history and fetches the missing messages again
+                print("⚠️ Some messages could not be fetched; historyId not advanced")
+            else:
+                set_sync_state(session, HISTORY_ID_KEY, history_id)
+            session.commit()
+        finally:
+            session.close()
+
+    def _parse(self, message_ids):
+        gave_up = []
+        full_msgs = fetch_messages(self.gmail_service, message_ids, gave_up=gave_up)
+        if gave_up:
+            self.fetch_failed.set()
+        session = SessionLocal()
+        try:
+            stored = store_messages(session, full_msgs)
+            with metrics.timer('db_commit'):
+                session.commit()
+        finally:
+            session.close()
+        for email_data in stored:
+            self._put('classify', email_data['id'])
+
+    def _classify(self, email_id):
+        session = SessionLocal()
+        try:
+            email = session.get(Email, email_id)
+            if email is None or email.status != STATUS_NEW:
+                return
+            if email.is_automated or not is_human_sender(email.sender):
+                email.status = STATUS_SKIPPED
+                print(f"🤖 Ignored bot/newsletter sender: {email.sender}")
+            else:
+                email.status = STATUS_CLASSIFIED
+            session.commit()
+            status = email.status
+        finally:
+            session.close()
+        if status == STATUS_CLASSIFIED:
+            self._put('llm', email_id)
+
+    def _llm(self, email_id):
+        session = SessionLocal()
+        try:
+            email = session.get(Email, email_id)
+            if email is None or email.status != STATUS_CLASSIFIED:
+                return
+            thread = collapse_threads(session, [email])[0]
+            if any(later.status in PENDING_STATUSES for later in thread['later']):
+                # A newer message of this thread is queued too. Its reply will cover this one; if it is
+                # skipped or fails instead, this email is still classified and gets queued again.
+                return
+            email.attempts = (email.attempts or 0) + 1
+            session.commit()
+            text = thread['text']
+            sender = email.sender
+            superseded_ids = [older.id for older in thread['superseded']]
+        finally:
+            session.close()
+        self._put('act', (email_id, text, analyze_email(text, sender), superseded_ids))
+
+    def _act(self, item):
+        email_id, text, analysis, superseded_ids = item
+        session = SessionLocal()
+        try:
+            email = session.get(Email, email_id)
+            if email is None or email.status != STATUS_CLASSIFIED:
+                return
+            email.summary = analysis["summary"]
+            reply = analysis["reply"]
+            if not is_usable_reply(reply):
+                record_attempt_failure(email)
+                session.commit()
+                print(f"📝 No auto-reply sent for email {email.id}")
+                return
+
+            send_email(self.gmail_service, email.sender, f"Re: {email.subject}", reply)
+            # Committed before anything else can fail, so a retry never sends the reply twice
+            email.status = STATUS_REPLIED
+            email.replied_at = utcnow()
+            superseded = session.query(Email).filter(Email.id.in_(superseded_ids),
+                                                     Email.status.in_(PENDING_STATUSES)).all()
+            for older in superseded:
+                older.status = STATUS_SUPERSEDED
+            session.commit()
+            mark_emails_as_read(self.gmail_service, [email.id] + [older.id for older in superseded])
+            print(f"✅ Auto-reply sent to {email.sender} for email {email.id}")
+            from reply_index import reply_index
+            reply_index.add(email.id, text, analysis, sender=email.sender)
+
+            parsed_dt = extract_meeting_datetime(email.body, email_received_date=email.date or datetime.now())
+            if parsed_dt and not email.event_id:
+                # Same checks as reply_to_emails: no event over a busy slot or twice for one thread
+                scheduler = EventScheduler(self.calendar_service, duration_minutes=self.duration_minutes,
+                                           timezone=self.timezone)
+                scheduler.add(event_title_for(analysis, text), parsed_dt.replace(second=0, microsecond=0),
+                              thread_id=email.thread_id, email_id=email.id)
+                for result in scheduler.flush():
+                    if result.get('event_id'):
+                        email.event_id = result['event_id']
+                        session.commit()
+        finally:
+            session.close()
+
+def serve(poll_interval=60, queue_size=100, llm_workers=None, metrics_port=None, timezone=DEFAULT_TIMEZONE,
+          duration_minutes=30):
+    """
+    Runs the pipeline until SIGINT or SIGTERM. Each worker thread gets its own long-lived Gmail and
+    Calendar connection, so API calls run in parallel without a shared lock.
+    With `metrics_port` (or METRICS_PORT) set, Prometheus metrics are served at /metrics.
+    """
+    init_db()
+    metrics.start_http_server(metrics_port or METRICS_PORT)
+    gmail_service, calendar_service = authenticate_google_services()
+    workers = {'llm': llm_workers} if llm_workers else None
+    pipeline = Pipeline(gmail_service, calendar_service, poll_interval=poll_interval, queue_size=queue_size,
+                        workers=workers, timezone=timezone, duration_minutes=duration_minutes)
+
+    def request_stop(signum, frame):
+        print(f"\n⏹️ Received signal {signum}, shutting down...")
+        pipeline.stop_event.set()
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+    pipeline.start()
+    while not pipeline.stop_event.wait(1):
+        pass
+    pipeline.stop()
+    notifier.flush()
+    pipeline.write_metrics()
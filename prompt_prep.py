@@ -0,0 +1,132 @@
+import os
+import re
+from nlp_utils import strip_quoted_text, SIGNATURE_RE, SENTENCE_SPLIT_RE
+from rules import rule_engine
+
+# Default input budget (estimated tokens) for the email text of each prompt, overridable with
+# PROMPT_BUDGET_<TASK>, e.g. PROMPT_BUDGET_ANALYSIS=3000. 0 disables truncation for that task.
+DEFAULT_BUDGETS = {"summary": 1200, "reply": 1200, "event_title": 300, "analysis": 1500}
+FALLBACK_BUDGET = 1200
+# A signature marker further up than this is more likely a divider inside the message
+SIGNATURE_MAX_LINES = 15
+
+# Legal footers, confidentiality notices and mailing-list boilerplate, matched per paragraph.
+# The first paragraph is never dropped, and unsubscribe lines only match footer wording, so a
+# request such as "Please unsubscribe me from the planning list" survives anywhere in the body.
+DISCLAIMER_RE = re.compile(
+    r"\b(?:intended (?:only|solely) for|confidential(?:ity)? notice|privileged and confidential"
+    r"|if you (?:are not the intended recipient|have received this (?:e-?mail|message) in error)"
+    r"|(?:click|tap) here to unsubscribe|to unsubscribe from (?:this|these|our|all)\b|unsubscribe here\b"
+    r"|you (?:can|may) unsubscribe|(?:you are|you're) receiving this (?:e-?mail|message)"
+    r"|manage (?:your )?(?:email )?preferences|view (?:this email )?in (?:your )?browser"
+    r"|please consider the environment before printing|no virus found|scanned for viruses)",
+    re.IGNORECASE,
+)
+URL_RE = re.compile(r"<?\bhttps?://[^\s<>\"')\]]+>?", re.IGNORECASE)
+# Click-tracking redirectors and analytics parameters that carry no meaning for the model
+TRACKING_HOST_RE = re.compile(r"^(?:click|links?|track(?:ing)?|email|em|t|r|go|l|mailtrack|clicks?)\.|"
+                              r"list-manage\.com$|sendgrid\.net$|mandrillapp\.com$|hubspotlinks\.com$",
+                              re.IGNORECASE)
+MAX_URL_CHARS = 80
+PARAGRAPH_SPLIT_RE = re.compile(r"\n[ \t]*\n")
+# Lines with no letters or digits: table borders, dividers and leftover layout from HTML parts
+NOISE_LINE_RE = re.compile(r"^[^\w]*$", re.MULTILINE)
+BLANK_LINES_RE = re.compile(r"\n{3,}")
+HEADING_RE = re.compile(r":[ \t]*(?:\n|$)")
+SPACES_RE = re.compile(r"[ \t\u00a0]{2,}")
+GAP = "[…]"
+# First line of a thread text built by threads.build_thread_text, whose messages are stripped one by one
+THREAD_CONTEXT_HEADING = "Earlier messages in this conversation (for context only):"
+
+def estimate_tokens(text: str) -> int:
+    # Roughly four characters per token for English text
+    return len(text) // 4 + 1
+
+def budget_for(task):
+    default = DEFAULT_BUDGETS.get(task, FALLBACK_BUDGET)
+    return int(os.getenv(f"PROMPT_BUDGET_{task.upper()}", str(default)))
+
+def _shorten_url(match):
+    url = match.group(0).strip("<>")
+    host = re.sub(r"^https?://", "", url, flags=re.IGNORECASE).split("/", 1)[0].split("?", 1)[0]
+    if TRACKING_HOST_RE.search(host):
+        return "[link]"
+    url = url.split("?", 1)[0] if "?" in url and len(url) > MAX_URL_CHARS else url
+    return url if len(url) <= MAX_URL_CHARS else f"[link to {host}]"
+
+def _strip_trailing_signature(text):
+    lines = text.splitlines()
+    tail_start = max(len(lines) - SIGNATURE_MAX_LINES, 0)
+    for i in range(tail_start, len(lines)):
+        if SIGNATURE_RE.match(lines[i]):
+            return "\n".join(lines[:i])
+    return text
+
+def strip_boilerplate(text):
+    """
+    Removes what the model does not need: quoted replies, a trailing signature, disclaimer and
+    unsubscribe paragraphs, tracking links and the blank/divider lines left by HTML-to-text conversion.
+    Thread texts are returned unchanged: their messages were stripped before being joined.
+    """
+    if text.startswith(THREAD_CONTEXT_HEADING):
+        return text.strip()
+    text = strip_quoted_text(text.replace("\r\n", "\n"))
+    text = _strip_trailing_signature(text)
+    text = URL_RE.sub(_shorten_url, text)
+    text = NOISE_LINE_RE.sub("", text)
+    text = SPACES_RE.sub(" ", text)
+    paragraphs = [p.strip() for p in PARAGRAPH_SPLIT_RE.split(text) if p.strip()]
+    kept = paragraphs[:1] + [p for p in paragraphs[1:] if not DISCLAIMER_RE.search(p)]
+    return BLANK_LINES_RE.sub("\n\n", "\n\n".join(kept)).strip()
+
+def _sentence_score(index, sentence):
+    score = 0.0
+    if HEADING_RE.search(sentence):
+        # Headings such as "Latest message, from ... (reply to this one):" keep the text's structure
+        score += 5
+    if sentence.rstrip().endswith("?"):
+        score += 3
+    if rule_engine.has_calendar_keywords(sentence):
+        score += 2
+    if any(ch.isdigit() for ch in sentence):
+        score += 1
+    # Openings usually state the purpose of the email
+    return score + 2.0 / (index + 1)
+
+def condense(text, budget):
+    """
+    Extractively shortens `text` to about `budget` estimated tokens: questions, scheduling
+    sentences, headings and the opening are kept first, in their original order, with gaps marked by […].
+    """
+    if not budget or estimate_tokens(text) <= budget:
+        return text
+    sentences = [s.strip() for s in SENTENCE_SPLIT_RE.split(text) if s and s.strip()]
+    ranked = sorted(range(len(sentences)), key=lambda i: -_sentence_score(i, sentences[i]))
+    chosen, used = set(), 0
+    for i in ranked:
+        cost = estimate_tokens(sentences[i]) + 1  # room for a joining space or gap marker
+        if used + cost > budget:
+            continue
+        chosen.add(i)
+        used += cost
+    if not chosen:
+        # A single sentence longer than the whole budget: cut it
+        return text[:budget * 4].rsplit(" ", 1)[0] + " " + GAP
+
+    parts, previous = [], -1
+    for i in sorted(chosen):
+        if parts and i != previous + 1:
+            parts.append(GAP)
+        parts.append(sentences[i])
+        previous = i
+    if previous != len(sentences) - 1:
+        parts.append(GAP)
+    return " ".join(parts)
+
+def prepare_email_text(text, task):
+    """
+    Cleans `text` for a prompt of the given task and fits it to the task's token budget.
+    Falls back to the original text if cleaning would leave nothing.
+    """
+    cleaned = strip_boilerplate(text) or text.strip()
+    return condense(cleaned, budget_for(task))
@@ -0,0 +1,194 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import zlib
+
+import numpy as np
+from sqlalchemy.exc import SQLAlchemyError
+
+from database import SessionLocal, SentReply, find_sent_reply, load_reply_signatures, utcnow
+from metrics import metrics
+from prompt_prep import strip_boilerplate
+
+logger = logging.getLogger(__name__)
+
+REPLY_INDEX_ENABLED = os.getenv("REPLY_INDEX", "1") != "0"
+# Estimated Jaccard similarity from which a past reply is offered as a suggestion. Similar is not
+# the same: emails that differ only in a name, day or time score close to 1, so fuzzy matches are
+# never sent automatically.
+REPLY_SUGGEST_THRESHOLD = float(os.getenv("REPLY_SUGGEST_THRESHOLD", "0.6"))
+NUM_PERM = 128
+SHINGLE_SIZE = 3  # words per shingle
+MERSENNE_PRIME = (1 << 31) - 1
+INITIAL_CAPACITY = 1024
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+# Fixed seed: signatures stored in the database must stay comparable across restarts
+_rng = np.random.RandomState(20240501)
+_PERM_A = _rng.randint(1, MERSENNE_PRIME, size=NUM_PERM).astype(np.uint64)
+_PERM_B = _rng.randint(0, MERSENNE_PRIME, size=NUM_PERM).astype(np.uint64)
+
+def shingles(text):
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+def minhash(text):
+    """
+    MinHash signature of the text's word shingles, or None if the text has no words. The share of
+    equal positions between two signatures estimates the Jaccard similarity of their shingle sets.
+    """
+    shingle_set = shingles(text)
+    if not shingle_set:
+        return None
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingle_set), dtype=np.uint64,
+                         count=len(shingle_set))
+    # (a * x + b) mod p for every permutation and shingle, then the minimum per permutation
+    permuted = (np.outer(hashes, _PERM_A) + _PERM_B) % MERSENNE_PRIME
+    return permuted.min(axis=0).astype(np.uint32)
+
+def canonical_text(email_text):
+    return strip_boilerplate(email_text) or email_text.strip()
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class ReplyIndex:
+    """
+    Nearest-neighbour index over past (email, reply) pairs. Signatures are kept in one NumPy matrix,
+    so a lookup is a single vectorised comparison against every stored reply; the texts stay in the
+    `sent_replies` table and are read only for the best match. Loaded from the database on first use.
+
+    `lookup` finds similar emails and is meant for suggestions a person reviews. `reusable_reply`
+    only matches the same text from the same sender, and is what unattended replies may use.
+    """
+    def __init__(self, suggest_threshold=REPLY_SUGGEST_THRESHOLD, enabled=REPLY_INDEX_ENABLED,
+                 session_factory=SessionLocal):
+        self.suggest_threshold = suggest_threshold
+        self.enabled = enabled
+        self.session_factory = session_factory
+        self._matrix = np.zeros((0, NUM_PERM), dtype=np.uint32)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._size = 0
+        self._loaded = False
+        self._load_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            try:
+                with self.session_factory() as session:
+                    rows = load_reply_signatures(session)
+            except SQLAlchemyError as e:
+                logger.warning(f"Could not load the reply index: {e}")
+                rows = []
+            if rows:
+                signatures = np.frombuffer(b"".join(row.signature for row in rows), dtype=np.uint32)
+                self._extend([row.id for row in rows], signatures.reshape(len(rows), NUM_PERM))
+            self._loaded = True
+
+    def _extend(self, reply_ids, signatures):
+        with self._lock:
+            needed = self._size + len(reply_ids)
+            if needed > len(self._ids):
+                # Grow geometrically so appends stay amortised O(1)
+                capacity = max(needed, len(self._ids) * 2, INITIAL_CAPACITY)
+                matrix = np.zeros((capacity, NUM_PERM), dtype=np.uint32)
+                ids = np.zeros(capacity, dtype=np.int64)
+                matrix[:self._size] = self._matrix[:self._size]
+                ids[:self._size] = self._ids[:self._size]
+                self._matrix, self._ids = matrix, ids
+            self._matrix[self._size:needed] = signatures
+            self._ids[self._size:needed] = reply_ids
+            self._size = needed
+
+    def nearest(self, signature):
+        """
+        Returns (reply id, estimated similarity) of the closest stored reply, or None if empty.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            if not self._size:
+                return None
+            matches = np.count_nonzero(self._matrix[:self._size] == signature, axis=1)
+            best = int(matches.argmax())
+            return int(self._ids[best]), matches[best] / NUM_PERM
+
+    def lookup(self, email_text, min_similarity=None):
+        """
+        Finds the past reply closest to `email_text`. Returns a dict with the stored `reply`, its `id`
+        and the estimated `similarity`, or None when nothing reaches `min_similarity` (the
+        suggestion threshold by default).
+        """
+        if not self.enabled or not email_text.strip():
+            return None
+        min_similarity = self.suggest_threshold if min_similarity is None else min_similarity
+        with metrics.timer("reply_index_lookup"):
+            signature = minhash(canonical_text(email_text))
+            found = self.nearest(signature) if signature is not None else None
+        if found is None or found[1] < min_similarity:
+            return None
+        reply_id, similarity = found
+        try:
+            with self.session_factory() as session:
+                row = session.get(SentReply, reply_id)
+        except SQLAlchemyError as e:
+            logger.warning(f"Reply index lookup failed: {e}")
+            return None
+        if row is None:
+            return None
+        return {"id": row.id, "similarity": similarity, "reply": row.reply}
+
+    def reusable_reply(self, email_text, sender):
+        """
+        Returns the stored reply (`id`, `reply`) to an earlier email from `sender` whose cleaned text
+        is exactly the same as `email_text`, or None. Only such a reply is safe to send again unreviewed.
+        """
+        if not self.enabled or not sender or not email_text.strip():
+            return None
+        try:
+            with self.session_factory() as session:
+                row = find_sent_reply(session, sender, text_hash(canonical_text(email_text)))
+        except SQLAlchemyError as e:
+            logger.warning(f"Reply reuse lookup failed: {e}")
+            return None
+        return {"id": row.id, "reply": row.reply} if row else None
+
+    def add(self, email_id, email_text, analysis, sender=None):
+        """
+        Stores a reply that was sent to `sender` for `email_text` so later emails can find it.
+        Replies that were themselves reused are not stored again.
+        """
+        if not self.enabled or analysis.get("reused_from"):
+            return None
+        text = canonical_text(email_text)
+        signature = minhash(text)
+        if signature is None:
+            return None
+        self._ensure_loaded()
+        try:
+            with self.session_factory() as session:
+                row = SentReply(email_id=email_id, sender=sender, created_at=utcnow(), email_text=text,
+                                text_hash=text_hash(text), reply=analysis["reply"], signature=signature.tobytes())
+                session.add(row)
+                session.commit()
+                reply_id = row.id
+        except SQLAlchemyError as e:
+            logger.warning(f"Could not store reply in the reply index: {e}")
+            return None
+        self._extend([reply_id], signature.reshape(1, NUM_PERM))
+        return reply_id
+
+    def stats(self):
+        if self.enabled:
+            self._ensure_loaded()
+        return {"replies": self._size, "enabled": self.enabled}
+
+reply_index = ReplyIndex()
@@ -0,0 +1,103 @@
+import bisect
+import json
+import os
+import re
+
+DEFAULT_RULES = {
+    # Substrings of the From header that mark bots, notifications and newsletters
+    "sender_keywords": ["no-reply", "noreply", "newsletter", "slack", "notification", "mailer", "mailbot", "automated"],
+    # Bulk-mail providers; subdomains match too
+    "sender_domains": ["mailchimp.com", "mcsv.net", "sendgrid.net", "amazonses.com", "mailgun.org"],
+    # Header name -> values that mark bulk mail (an empty list means the header's presence is enough)
+    "bulk_headers": {
+        "list-unsubscribe": [],
+        "list-id": [],
+        "precedence": ["bulk", "list", "junk"],
+        "auto-submitted": ["auto-generated", "auto-replied"],
+    },
+    "calendar_keywords": ["interview", "meeting", "date", "time", "schedule", "appointment", "call", "event",
+                          "calendar", "reminder"],
+}
+
+def load_rules(path=None):
+    """
+    Returns the default rule sets, with any keys from the JSON file at `path` replacing them.
+    """
+    rules = {key: value for key, value in DEFAULT_RULES.items()}
+    if path:
+        with open(path, encoding="utf-8") as f:
+            rules.update(json.load(f))
+    return rules
+
+def _alternation(words):
+    # Longest first so overlapping keywords can't shadow each other
+    return "|".join(re.escape(word) for word in sorted(words, key=len, reverse=True))
+
+class RuleEngine:
+    """
+    Triage rules compiled into one case-insensitive regex per rule set, so each check is a single
+    pass over the text with no lowercased copies.
+    """
+    def __init__(self, rules):
+        sender_patterns = []
+        if rules.get("sender_keywords"):
+            sender_patterns.append(_alternation(rules["sender_keywords"]))
+        if rules.get("sender_domains"):
+            sender_patterns.append(r"[@.](?:" + _alternation(rules["sender_domains"]) + r")\b")
+        self.sender_re = re.compile("|".join(sender_patterns) or r"(?!)", re.IGNORECASE)
+        self.calendar_re = re.compile(_alternation(rules.get("calendar_keywords", [])) or r"(?!)", re.IGNORECASE)
+        self.bulk_headers = {
+            name.lower(): {value.lower() for value in values}
+            for name, values in rules.get("bulk_headers", {}).items()
+        }
+
+    def is_automated_sender(self, sender):
+        return bool(sender) and self.sender_re.search(sender) is not None
+
+    def has_bulk_headers(self, headers):
+        """
+        `headers` maps header names to values, e.g. {"Precedence": "bulk"}.
+        """
+        for name, value in (headers or {}).items():
+            values = self.bulk_headers.get(name.lower())
+            if values is not None and (not values or value.strip().lower() in values):
+                return True
+        return False
+
+    def is_human(self, sender, headers=None):
+        return not self.is_automated_sender(sender) and not self.has_bulk_headers(headers)
+
+    def has_calendar_keywords(self, text):
+        return bool(text) and self.calendar_re.search(text) is not None
+
+    def automated_senders(self, senders):
+        """
+        Batch form of is_automated_sender: joins all senders and scans them with one regex pass.
+        """
+        senders = [sender or "" for sender in senders]
+        flags = [False] * len(senders)
+        if not senders:
+            return flags
+        starts, offset = [], 0
+        for sender in senders:
+            starts.append(offset)
+            offset += len(sender) + 1
+        for match in self.sender_re.finditer("\n".join(senders)):
+            flags[bisect.bisect_right(starts, match.start()) - 1] = True
+        return flags
+
+    def classify_batch(self, emails):
+        """
+        Triages many emails at once. `emails` are dicts with "sender" and optional "headers" and "body";
+        returns a dict per email with `is_human` and `has_calendar_keywords`.
+        """
+        automated = self.automated_senders([email.get("sender") for email in emails])
+        return [
+            {
+                "is_human": not is_automated and not self.has_bulk_headers(email.get("headers")),
+                "has_calendar_keywords": self.has_calendar_keywords(email.get("body")),
+            }
+            for email, is_automated in zip(emails, automated)
+        ]
+
+rule_engine = RuleEngine(load_rules(os.getenv("EMAIL_RULES_FILE")))
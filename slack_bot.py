@@ -1,20 +1,136 @@
+import atexit
 import os
+import queue
+import threading
+import time
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
 from dotenv import load_dotenv
+from metrics import metrics
 
 load_dotenv()  # Load env variables
 
 SLACK_BOT_TOKEN = os.getenv("SLACK_BOT_TOKEN")
 SLACK_CHANNEL_ID = os.getenv("SLACK_CHANNEL_ID")
+SLACK_DIGEST_WINDOW = float(os.getenv("SLACK_DIGEST_WINDOW", "10"))  # seconds
+MAX_DIGEST_CHARS = 3000  # Keep each digest well under Slack's message size limit
+MAX_POST_ATTEMPTS = 5
 
 client = WebClient(token=SLACK_BOT_TOKEN)
 
 def send_slack_message(message: str, channel: str = SLACK_CHANNEL_ID):
     try:
-        response = client.chat_postMessage(channel=channel, text=message)
-        print(f"✅ Slack message sent.")
+        with metrics.timer("slack"):
+            response = client.chat_postMessage(channel=channel, text=message)
+        print("✅ Slack message sent.")
         return response
     except SlackApiError as e:
         print(f"❌ Slack API Error: {e.response['error']}")
         return None
+
+class SlackNotifier:
+    """
+    Background dispatcher for Slack alerts. `notify` only enqueues, so callers never wait on Slack.
+    A worker thread collects alerts for `window` seconds and posts them as one digest message,
+    sleeping for Slack's Retry-After when rate limited. `flush` posts whatever is left and stops the worker.
+    """
+    def __init__(self, slack_client, channel=SLACK_CHANNEL_ID, window=SLACK_DIGEST_WINDOW, max_queue=10000):
+        self.client = slack_client
+        self.channel = channel
+        self.window = window
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="slack-notifier", daemon=True)
+                self._thread.start()
+
+    def notify(self, message: str):
+        self.start()
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            metrics.inc("slack_dropped_total")
+            print("⚠️ Slack notification queue is full, dropping alert.")
+
+    def flush(self, timeout=30.0):
+        with self._lock:
+            thread = self._thread
+        if thread and thread.is_alive():
+            self._stop.set()
+            thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            messages = self._collect()
+            if messages:
+                self._post_digest(messages)
+        messages = self._drain()
+        if messages:
+            self._post_digest(messages)
+
+    def _collect(self):
+        try:
+            messages = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.window
+        while not self._stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                messages.append(self._queue.get(timeout=min(remaining, 0.5)))
+            except queue.Empty:
+                continue
+        return messages
+
+    def _drain(self):
+        messages = []
+        while True:
+            try:
+                messages.append(self._queue.get_nowait())
+            except queue.Empty:
+                return messages
+
+    def _post_digest(self, messages):
+        chunks, current = [], []
+        for message in messages:
+            if current and sum(len(m) + 2 for m in current) + len(message) > MAX_DIGEST_CHARS:
+                chunks.append(current)
+                current = []
+            current.append(message)
+        chunks.append(current)
+
+        for chunk in chunks:
+            text = chunk[0] if len(chunk) == 1 else f"🗂️ *{len(chunk)} notifications*\n\n" + "\n\n".join(chunk)
+            self._post(text)
+
+    def _post(self, text):
+        for _ in range(MAX_POST_ATTEMPTS):
+            try:
+                with metrics.timer("slack"):
+                    self.client.chat_postMessage(channel=self.channel, text=text)
+                print("✅ Slack digest sent.")
+                return True
+            except SlackApiError as e:
+                if e.response.status_code != 429:
+                    print(f"❌ Slack API Error: {e.response['error']}")
+                    return False
+                retry_after = int(e.response.headers.get("Retry-After", 1))
+                print(f"⏳ Slack rate limited, retrying in {retry_after}s")
+                time.sleep(retry_after)
+            except Exception as e:
+                # Network errors (URLError, timeouts) must not kill the worker thread
+                print(f"❌ Slack post failed: {e}")
+                return False
+        print("❌ Slack digest dropped after repeated rate limiting.")
+        return False
+
+notifier = SlackNotifier(client)
+atexit.register(notifier.flush)
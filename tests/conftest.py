@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+# The application modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """
+    Session factory bound to a fresh SQLite database with the full schema.
+    """
+    pytest.importorskip("sqlalchemy")
+    from sqlalchemy.orm import sessionmaker
+    from database import create_db_engine, init_db
+
+    db_engine = create_db_engine(f"sqlite:///{tmp_path / 'test.db'}", echo=False)
+    init_db(db_engine)
+    yield sessionmaker(bind=db_engine)
+    db_engine.dispose()
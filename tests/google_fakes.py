@@ -0,0 +1,44 @@
+"""
+Helpers for testing against googleapiclient services built from the bundled discovery documents,
+with HTTP answered by googleapiclient.http.HttpMockSequence.
+"""
+import json
+
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
+from googleapiclient.http import HttpMockSequence
+
+BOUNDARY = "batch_test_boundary"
+REASONS = {200: "OK", 404: "Not Found", 429: "Too Many Requests", 500: "Internal Server Error",
+           503: "Service Unavailable"}
+
+
+def fake_service(name, version, responses):
+    """
+    A real client for the API whose HTTP calls are answered, in order, by `responses`:
+    (headers, body) pairs as HttpMockSequence expects them.
+    """
+    document = discovery_cache.get_static_doc(name, version)
+    return build_from_document(document, http=HttpMockSequence(responses))
+
+
+def json_response(body, status=200):
+    return {"status": str(status)}, json.dumps(body)
+
+
+def batch_response(parts):
+    """
+    A multipart batch response with one part per (request_id, status, body).
+    """
+    chunks = []
+    for request_id, status, body in parts:
+        payload = json.dumps(body)
+        chunks.append(
+            f"--{BOUNDARY}\r\nContent-Type: application/http\r\nContent-Transfer-Encoding: binary\r\n"
+            f"Content-ID: <response-test + {request_id}>\r\n\r\n"
+            f"HTTP/1.1 {status} {REASONS.get(status, 'Error')}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n\r\n{payload}\r\n"
+        )
+    chunks.append(f"--{BOUNDARY}--")
+    headers = {"status": "200", "content-type": f'multipart/mixed; boundary="{BOUNDARY}"'}
+    return headers, "".join(chunks)
@@ -0,0 +1,47 @@
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("dateparser")
+
+from calendar_integration import _extract_meeting_datetime, candidate_spans, extract_meeting_datetime
+
+RECEIVED = datetime(2030, 5, 6, 9, 30)
+
+
+def test_candidate_spans_ignore_digits_inside_words():
+    assert candidate_spans("Order 12345pm and ref A10:30 are attached.") == []
+    assert candidate_spans("Could we talk at 3pm?") == ["Could we talk at 3pm?"]
+
+
+def test_extraction_is_cached_on_candidate_windows():
+    _extract_meeting_datetime.cache_clear()
+    filler = "The proposal looks good overall. " * 20
+    first = extract_meeting_datetime(filler + "Can we meet tomorrow at 3pm?", RECEIVED)
+    second = extract_meeting_datetime("Hello again. " + filler + "Can we meet tomorrow at 3pm?", RECEIVED)
+
+    assert first == second == datetime(2030, 5, 7, 15, 0)
+    assert _extract_meeting_datetime.cache_info().hits == 1
+    assert extract_meeting_datetime(filler, RECEIVED) is None
+
+
+FILLER = "Thanks again for the detailed notes from the workshop. The scope looks about right. "
+# Received on Monday 2030-05-06 09:30; meeting times without a year or date are in the future
+EXPECTED = [
+    ("Could we meet on Tuesday at 3pm to go over it?", datetime(2030, 5, 7, 15, 0)),
+    ("Quick one: can we do a call tomorrow at 10:30?", datetime(2030, 5, 7, 10, 30)),
+    ("Can we talk tomorrow at 11 am?", datetime(2030, 5, 7, 11, 0)),
+    ("The interview is scheduled for March 14 at 11 am.", datetime(2031, 3, 14, 11, 0)),
+    ("The interview is scheduled for June 14 at 11 am.", datetime(2030, 6, 14, 11, 0)),
+    ("Let's meet on 14 June at 9 a.m. if that works.", datetime(2030, 6, 14, 9, 0)),
+    ("Deadline moved to 12/05/2030, meeting then.", datetime(2030, 12, 5, 0, 0)),
+    ("Would Friday at 4:15 pm suit you?", datetime(2030, 5, 10, 16, 15)),
+    ("Can we catch up in 2 hours?", datetime(2030, 5, 6, 11, 30)),
+    ("No meeting needed, the report is attached.", None),
+]
+
+
+@pytest.mark.parametrize("sentence, expected", EXPECTED)
+def test_meeting_datetimes(sentence, expected):
+    text = FILLER * 20 + sentence + " " + FILLER * 20
+    assert extract_meeting_datetime(text, RECEIVED) == expected
@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import pytest
+
+pytest.importorskip("googleapiclient")
+pytest.importorskip("dateparser")
+
+from calendar_integration import build_event, extract_meeting_datetime
+from calendar_scheduler import EventScheduler
+from google_fakes import batch_response, fake_service, json_response
+
+START = datetime(2030, 5, 6, 10, 0, tzinfo=ZoneInfo("Asia/Kolkata"))
+
+
+def test_build_event_keeps_the_start_time_zone():
+    event = build_event("Sync", datetime(2030, 5, 6, 10, 0, tzinfo=ZoneInfo("Europe/London")), 30, "Asia/Kolkata")
+    assert event["start"]["timeZone"] == event["end"]["timeZone"] == "Europe/London"
+    assert event["start"]["dateTime"] == "2030-05-06T10:00:00+01:00"
+
+    naive = build_event("Sync", datetime(2030, 5, 6, 10, 0), 30, "Asia/Kolkata")
+    assert naive["start"]["timeZone"] == "Asia/Kolkata"
+    assert naive["start"]["dateTime"] == "2030-05-06T10:00:00+05:30"
+
+
+def test_flush_inserts_free_slots_and_skips_conflicts():
+    busy_start = START + timedelta(hours=2)
+    service = fake_service("calendar", "v3", [
+        json_response({"calendars": {"primary": {"busy": [
+            {"start": busy_start.isoformat(), "end": (busy_start + timedelta(hours=1)).isoformat()}]}}}),
+        json_response({"items": []}),
+        batch_response([("0", 200, {"id": "event-1", "htmlLink": "https://calendar.example/event-1"})]),
+    ])
+    scheduler = EventScheduler(service, duration_minutes=30, timezone="Asia/Kolkata")
+    assert scheduler.add("Planning", START, thread_id="t1", email_id="m1")
+    assert scheduler.add("Review", busy_start, thread_id="t2", email_id="m2")
+    assert not scheduler.add("Planning again", START, thread_id="t1", email_id="m3")
+
+    results = {result["email_id"]: result for result in scheduler.flush()}
+    assert results["m1"]["status"] == "created"
+    assert results["m1"]["event_id"] == "event-1"
+    assert results["m2"]["status"] == "conflict"
+
+
+def test_flush_reports_events_of_a_failed_batch_as_failed():
+    service = fake_service("calendar", "v3", [
+        json_response({"calendars": {"primary": {"busy": []}}}),
+        json_response({"items": []}),
+        json_response({"error": {"code": 503, "message": "backend error"}}, status=503),
+    ])
+    scheduler = EventScheduler(service, timezone="Asia/Kolkata")
+    scheduler.add("Planning", START, thread_id="t1", email_id="m1")
+
+    assert [result["status"] for result in scheduler.flush()] == ["failed"]
+
+
+def test_a_zone_named_in_the_email_is_kept():
+    parsed = extract_meeting_datetime("Can we meet Friday at 3pm EST?", datetime(2030, 5, 6, 9, 30))
+    scheduler = EventScheduler(None, timezone="Asia/Kolkata")
+    scheduler.add("Sync", parsed, thread_id="t1")
+    assert scheduler.pending[0]["event"]["start"]["dateTime"] == "2030-05-10T15:00:00-05:00"
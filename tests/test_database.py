@@ -0,0 +1,53 @@
+from datetime import date, datetime
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+import database
+from database import bulk_insert_emails, get_daily_counts, get_hourly_counts, get_top_senders, rebuild_rollups, update_rollups
+
+ROWS = [
+    {"id": "m1", "thread_id": "t1", "sender": "sam@example.com", "subject": "a", "date": datetime(2030, 5, 6, 9, 15)},
+    {"id": "m2", "thread_id": "t2", "sender": "sam@example.com", "subject": "b", "date": datetime(2030, 5, 6, 14, 0)},
+    {"id": "m3", "thread_id": "t3", "sender": "lee@example.com", "subject": "c", "date": datetime(2030, 5, 7, 9, 40)},
+    {"id": "m4", "thread_id": "t4", "sender": None, "subject": "d", "date": None},
+]
+
+
+def rollups(session):
+    return get_hourly_counts(session), get_daily_counts(session), sorted(get_top_senders(session, 10))
+
+
+@pytest.fixture(params=["upsert", "portable"])
+def insert_mode(request, monkeypatch):
+    if request.param == "portable":
+        # What databases without ON CONFLICT get
+        monkeypatch.setattr(database, "_conflict_insert", lambda session, model: None)
+    return request.param
+
+
+def test_rollups_match_a_rebuild(session_factory, insert_mode):
+    with session_factory() as session:
+        update_rollups(session, bulk_insert_emails(session, ROWS[:2]))
+        update_rollups(session, bulk_insert_emails(session, ROWS))
+        session.commit()
+        incremental = rollups(session)
+
+        rebuild_rollups(session)
+        session.commit()
+        assert rollups(session) == incremental
+
+    hours, days, senders = incremental
+    assert hours == [(9, 2), (14, 1)]
+    assert days == [(date(2030, 5, 6), 2), (date(2030, 5, 7), 1)]
+    assert senders == [("", 1), ("lee@example.com", 1), ("sam@example.com", 2)]
+
+
+def test_removing_emails_drops_empty_rollup_rows(session_factory, insert_mode):
+    with session_factory() as session:
+        update_rollups(session, bulk_insert_emails(session, ROWS))
+        update_rollups(session, ROWS[2:3], sign=-1)
+        session.commit()
+        assert session.scalar(database.select(database.DailyEmailCount.total)
+                              .where(database.DailyEmailCount.day == date(2030, 5, 7))) is None
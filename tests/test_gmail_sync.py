@@ -0,0 +1,79 @@
+import pytest
+
+pytest.importorskip("googleapiclient")
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("bs4")
+pytest.importorskip("slack_sdk")
+pytest.importorskip("dotenv")
+
+import gmail_sync
+from google_fakes import batch_response, fake_service, json_response
+
+
+def message(msg_id):
+    return {"id": msg_id, "threadId": f"t-{msg_id}", "payload": {"headers": []}}
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    delays = []
+    monkeypatch.setattr(gmail_sync.time, "sleep", delays.append)
+    return delays
+
+
+def test_fetch_messages_batches_and_keeps_order():
+    service = fake_service("gmail", "v1", [
+        batch_response([("m2", 200, message("m2")), ("m1", 200, message("m1"))]),
+        batch_response([("m3", 200, message("m3"))]),
+    ])
+    fetched = gmail_sync.fetch_messages(service, ["m1", "m2", "m3"], batch_size=2)
+    assert [msg["id"] for msg in fetched] == ["m1", "m2", "m3"]
+
+
+def test_fetch_messages_retries_retryable_errors_only(no_backoff):
+    error = {"error": {"code": 503, "message": "backend error"}}
+    service = fake_service("gmail", "v1", [
+        batch_response([("m1", 200, message("m1")), ("m2", 503, error),
+                        ("m3", 404, {"error": {"code": 404, "message": "not found"}})]),
+        batch_response([("m2", 200, message("m2"))]),
+    ])
+    fetched = gmail_sync.fetch_messages(service, ["m1", "m2", "m3"])
+    assert [msg["id"] for msg in fetched] == ["m1", "m2"]
+    assert no_backoff == [1]
+
+
+def test_fetch_messages_reports_ids_it_gave_up_on(no_backoff):
+    error = {"error": {"code": 429, "message": "rate limited"}}
+    service = fake_service("gmail", "v1", [
+        batch_response([("m1", 200, message("m1")), ("m2", 429, error)]),
+        batch_response([("m2", 429, error)]),
+        batch_response([("m2", 429, error)]),
+    ])
+    gave_up = []
+    fetched = gmail_sync.fetch_messages(service, ["m1", "m2"], max_retries=2, gave_up=gave_up)
+    assert [msg["id"] for msg in fetched] == ["m1"]
+    assert gave_up == ["m2"]
+    assert no_backoff == [1, 2]
+
+
+def test_expired_history_id_resyncs_every_unread_page(session_factory):
+    session = session_factory()
+    gmail_sync.set_sync_state(session, gmail_sync.HISTORY_ID_KEY, "100")
+    service = fake_service("gmail", "v1", [
+        json_response({"error": {"code": 404, "message": "Requested entity was not found."}}, status=404),
+        json_response({"historyId": "900"}),
+        json_response({"messages": [{"id": "m1"}, {"id": "m2"}], "nextPageToken": "page-2"}),
+        json_response({"messages": [{"id": "m3"}]}),
+    ])
+    message_ids, history_id = gmail_sync.list_mailbox_changes(service, session)
+    assert message_ids == ["m1", "m2", "m3"]
+    assert history_id == "900"
+
+
+def test_full_sync_stops_listing_at_max_results(session_factory):
+    service = fake_service("gmail", "v1", [
+        json_response({"historyId": "900"}),
+        json_response({"messages": [{"id": "m1"}, {"id": "m2"}], "nextPageToken": "page-2"}),
+    ])
+    message_ids, _ = gmail_sync.list_mailbox_changes(service, session_factory(), max_results=2)
+    assert message_ids == ["m1", "m2"]
@@ -0,0 +1,214 @@
+import json
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+import llm_cache
+import llm_integration
+from llm_integration import RateLimiter, analyze_email, analyze_emails
+
+
+class StubModel:
+    """
+    Answers analysis prompts with a reply naming the email's ticket number, after a short delay,
+    and records how many calls were in flight at once.
+    """
+    model_name = "stub"
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt, generation_config=None):
+        with self._lock:
+            self.active += 1
+            self.calls += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            time.sleep(self.delay)
+            ticket = re.search(r"ticket (\d+)", prompt).group(1)
+            return SimpleNamespace(text=json.dumps({
+                "summary": f"- ticket {ticket}",
+                "reply": f"Thanks, we are looking into ticket {ticket}.",
+                "event_title": f"Ticket {ticket}",
+                "questions": [],
+            }))
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+@pytest.fixture
+def stub_model(monkeypatch):
+    stub = StubModel()
+    monkeypatch.setattr(llm_integration, "model", stub)
+    monkeypatch.setattr(llm_integration, "rate_limiter", RateLimiter(1000))
+    monkeypatch.setattr(llm_integration.llm_cache, "enabled", False)
+    return stub
+
+
+def test_analyze_emails_runs_concurrently_and_keeps_order(stub_model):
+    texts = [f"Hello, please check ticket {i} when you can. Thanks" for i in range(8)]
+    results = analyze_emails(texts, max_workers=4)
+
+    assert [r["reply"] for r in results] == [f"Thanks, we are looking into ticket {i}." for i in range(8)]
+    assert stub_model.calls == 8
+    assert 1 < stub_model.peak <= 4
+
+
+def test_analyze_emails_reports_progress(stub_model):
+    texts = [f"Hello, please check ticket {i} when you can. Thanks" for i in range(3)]
+    seen = []
+    analyze_emails(texts, max_workers=2, progress=lambda done, total, message: seen.append((done, total)))
+    assert seen == [(1, 3), (2, 3), (3, 3)]
+
+
+class ScriptedModel:
+    """
+    Returns the queued outputs of each task in turn; tasks are told apart by their prompt.
+    """
+    model_name = "scripted"
+
+    def __init__(self, analysis):
+        self.outputs = {"analysis": list(analysis)}
+        self.calls = []
+
+    def generate_content(self, prompt, generation_config=None):
+        task = "analysis" if "JSON" in prompt else "fallback"
+        self.calls.append(task)
+        if task == "analysis":
+            return SimpleNamespace(text=self.outputs["analysis"].pop(0))
+        return SimpleNamespace(text="A fallback answer that is long enough.")
+
+
+def test_invalid_analysis_output_is_not_cached(session_factory, monkeypatch):
+    valid = json.dumps({"summary": "- ok", "reply": "Thanks, that works for me.", "event_title": "Sync",
+                        "questions": []})
+    stub = ScriptedModel(["Sorry, I cannot answer in JSON.", valid])
+    monkeypatch.setattr(llm_integration, "model", stub)
+    monkeypatch.setattr(llm_integration, "rate_limiter", RateLimiter(1000))
+    monkeypatch.setattr(llm_cache, "SessionLocal", session_factory)
+    monkeypatch.setattr(llm_integration, "llm_cache", llm_cache.LLMCache())
+    text = "Hello, can we sync about ticket 7 this week? Thanks"
+
+    first = analyze_email(text)
+    assert first["reply"] == "A fallback answer that is long enough."
+    second = analyze_email(text)
+    assert second["reply"] == "Thanks, that works for me."
+    assert stub.calls.count("analysis") == 2
+    assert analyze_email(text) == second
+    assert stub.calls.count("analysis") == 2
+
+
+class FakeClock:
+    """
+    Stands in for time.monotonic and time.sleep; sleeping advances the clock and is recorded.
+    """
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def fake_clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(llm_integration.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(llm_integration.time, "sleep", clock.sleep)
+    monkeypatch.setattr(llm_integration.random, "uniform", lambda low, high: 0.5)
+    return clock
+
+
+class QuotaExhaustedModel:
+    """
+    Raises ResourceExhausted (HTTP 429) for the first `failures` calls, then answers.
+    """
+    model_name = "quota"
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def generate_content(self, prompt, generation_config=None):
+        from google.api_core.exceptions import ResourceExhausted
+
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ResourceExhausted("Quota exceeded")
+        return SimpleNamespace(text="ok")
+
+
+def test_rate_limited_calls_back_off_exponentially(fake_clock, monkeypatch):
+    pytest.importorskip("google.api_core")
+    stub = QuotaExhaustedModel(failures=3)
+    monkeypatch.setattr(llm_integration, "model", stub)
+    monkeypatch.setattr(llm_integration, "rate_limiter", RateLimiter(1000))
+
+    assert llm_integration._generate("Hello").text == "ok"
+    assert stub.calls == 4
+    assert fake_clock.sleeps == [1.5, 2.5, 4.5]
+
+
+def test_backoff_is_capped_and_gives_up_after_max_retries(fake_clock, monkeypatch):
+    pytest.importorskip("google.api_core")
+    from google.api_core.exceptions import ResourceExhausted
+
+    stub = QuotaExhaustedModel(failures=100)
+    monkeypatch.setattr(llm_integration, "model", stub)
+    monkeypatch.setattr(llm_integration, "rate_limiter", RateLimiter(1000))
+    monkeypatch.setattr(llm_integration, "MAX_RETRIES", 6)
+
+    with pytest.raises(ResourceExhausted):
+        llm_integration._generate("Hello")
+    assert stub.calls == 7
+    assert fake_clock.sleeps == [1.5, 2.5, 4.5, 8.5, 16.5, 30.5]
+
+
+def test_rate_limiter_caps_requests_per_window(fake_clock):
+    limiter = RateLimiter(2, window=60.0)
+    for _ in range(3):
+        limiter.acquire()
+    assert fake_clock.sleeps == [60.0]
+    assert fake_clock.now == 60.0
+
+
+def test_rate_limiter_caps_tokens_per_window(fake_clock):
+    limiter = RateLimiter(100, tokens_per_minute=100, window=60.0)
+    limiter.acquire(80)
+    fake_clock.now = 10.0
+    limiter.acquire(30)
+    assert fake_clock.sleeps == [50.0]
+    # A single request larger than the cap still goes through once the window is empty
+    fake_clock.now = 200.0
+    limiter.acquire(500)
+    assert fake_clock.sleeps == [50.0]
+
+
+@pytest.mark.parametrize("reply, usable", [
+    ("Thanks, Friday at 3pm works for me.", True),
+    ("", False),
+    ("Email content is empty.", False),
+    ("Draft generation failed; reply was too short or malformed.", False),
+    ("An error occurred while generating the reply.", False),
+])
+def test_placeholder_replies_are_not_usable(reply, usable):
+    assert llm_integration.is_usable_reply(reply) is usable
+
+
+def test_empty_email_reply_is_not_usable():
+    assert not llm_integration.is_usable_reply(llm_integration.generate_reply("  "))
+    assert not llm_integration.is_usable_reply(analyze_email("")["reply"])
@@ -0,0 +1,27 @@
+from metrics import Metrics
+
+
+def recorded_metrics():
+    registry = Metrics()
+    for seconds in (0.002, 0.02, 0.02, 3.0):
+        registry.observe("gemini", seconds)
+    registry.observe("gmail_fetch", 0.3, error=True)
+    registry.inc("llm_tokens_total", 120, task="analysis", direction="prompt")
+    registry.inc("reply_reuse_total")
+    registry.set_gauge("queue_depth", 4, stage='llm "main"')
+    return registry
+
+
+def test_from_prometheus_restores_the_snapshot():
+    registry = recorded_metrics()
+    restored = Metrics.from_prometheus(registry.render_prometheus())
+    assert restored.snapshot() == registry.snapshot()
+    assert restored.render_prometheus() == registry.render_prometheus()
+
+
+def test_load_file_reads_what_write_file_wrote(tmp_path):
+    path = tmp_path / "metrics.prom"
+    assert Metrics.load_file(str(path)) is None
+    registry = recorded_metrics()
+    registry.write_file(str(path))
+    assert Metrics.load_file(str(path)).snapshot() == registry.snapshot()
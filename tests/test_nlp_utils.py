@@ -0,0 +1,15 @@
+from nlp_utils import extract_questions, extract_questions_batch
+
+EMAIL = ("Hi Sam, thanks for the notes. Can we move the review to Thursday? Let me know.\n\n"
+         "On Mon, May 6, 2030 at 9:00 AM Lee <lee@example.com> wrote:\n"
+         "> Is the budget final?\n")
+
+
+def test_fast_tier_is_the_default_and_skips_quoted_text():
+    # Runs without spaCy: the parser is only loaded when a caller asks for it
+    assert extract_questions(EMAIL) == ["Can we move the review to Thursday?"]
+    assert extract_questions(EMAIL, strip_quotes=False)[-1].endswith("> Is the budget final?")
+
+
+def test_batch_uses_the_same_default():
+    assert extract_questions_batch([EMAIL, "No questions here."]) == [["Can we move the review to Thursday?"], []]
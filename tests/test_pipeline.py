@@ -0,0 +1,84 @@
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("googleapiclient")
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("slack_sdk")
+pytest.importorskip("dotenv")
+
+import pipeline
+import reply_index
+from database import Email, STATUS_CLASSIFIED, STATUS_REPLIED
+from google_fakes import batch_response, fake_service, json_response
+
+ANALYSIS = {"summary": "- all good", "reply": "Thanks for letting me know, glad it worked out.",
+            "event_title": "Meeting", "questions": []}
+
+
+@pytest.fixture
+def pipeline_db(session_factory, monkeypatch):
+    monkeypatch.setattr(pipeline, "SessionLocal", session_factory)
+    monkeypatch.setattr(reply_index, "reply_index", reply_index.ReplyIndex(session_factory=session_factory))
+    with session_factory() as session:
+        session.add(Email(id="m1", thread_id="t1", sender="sam@example.com", subject="Update",
+                          body="The deploy went fine, all good.", date=datetime(2030, 5, 6, 9, 0),
+                          status=STATUS_CLASSIFIED))
+        session.commit()
+    return session_factory
+
+
+def test_reply_is_recorded_even_if_marking_it_read_fails(pipeline_db):
+    gmail = fake_service("gmail", "v1", [
+        json_response({"id": "sent-1"}),
+        json_response({"error": {"code": 500, "message": "backend error"}}, status=500),
+    ])
+    worker = pipeline.Pipeline(gmail, calendar_service=None)
+    worker._act(("m1", "The deploy went fine, all good.", dict(ANALYSIS), []))
+
+    with pipeline_db() as session:
+        assert session.get(Email, "m1").status == STATUS_REPLIED
+    # A second attempt finds the email answered and sends nothing (the fake has no responses left)
+    worker._act(("m1", "The deploy went fine, all good.", dict(ANALYSIS), []))
+
+
+def add_meeting_request(session_factory):
+    with session_factory() as session:
+        session.add(Email(id="m2", thread_id="t2", sender="lee@example.com", subject="Sync",
+                          body="Can we meet Friday at 3pm?", date=datetime(2030, 5, 6, 9, 0),
+                          status=STATUS_CLASSIFIED))
+        session.commit()
+
+
+def replied_gmail():
+    return fake_service("gmail", "v1", [json_response({"id": "sent-2"}), json_response({})])
+
+
+def test_meetings_go_through_the_scheduler(pipeline_db):
+    add_meeting_request(pipeline_db)
+    calendar = fake_service("calendar", "v3", [
+        json_response({"calendars": {"primary": {"busy": []}}}),
+        json_response({"items": []}),
+        batch_response([("0", 200, {"id": "event-2", "htmlLink": "https://calendar.example/event-2"})]),
+    ])
+    worker = pipeline.Pipeline(replied_gmail(), calendar, timezone="Asia/Kolkata")
+    worker._act(("m2", "Can we meet Friday at 3pm?", dict(ANALYSIS), []))
+
+    with pipeline_db() as session:
+        assert session.get(Email, "m2").event_id == "event-2"
+
+
+def test_no_meeting_is_booked_over_a_busy_slot(pipeline_db):
+    add_meeting_request(pipeline_db)
+    calendar = fake_service("calendar", "v3", [
+        json_response({"calendars": {"primary": {"busy": [
+            {"start": "2030-05-10T09:00:00Z", "end": "2030-05-10T10:00:00Z"}]}}}),
+        json_response({"items": []}),
+    ])
+    worker = pipeline.Pipeline(replied_gmail(), calendar, timezone="Asia/Kolkata")
+    worker._act(("m2", "Can we meet Friday at 3pm?", dict(ANALYSIS), []))
+
+    with pipeline_db() as session:
+        email = session.get(Email, "m2")
+        assert email.status == STATUS_REPLIED
+        assert email.event_id is None
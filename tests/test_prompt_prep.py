@@ -0,0 +1,48 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from prompt_prep import THREAD_CONTEXT_HEADING, prepare_email_text, strip_boilerplate
+
+DISCLAIMER = ("This email is intended only for the named recipient. If you are not the intended recipient, "
+              "please delete it.")
+
+
+def test_strip_boilerplate_keeps_the_first_paragraph_and_drops_disclaimers():
+    text = f"Please unsubscribe me from the weekly report.\n\nThanks for the help.\n\n{DISCLAIMER}"
+    assert strip_boilerplate(text) == "Please unsubscribe me from the weekly report.\n\nThanks for the help."
+
+
+@pytest.mark.parametrize("footer", [
+    "Click here to unsubscribe or manage your subscription.",
+    "To unsubscribe from this list, reply with REMOVE.",
+    "You are receiving this email because you signed up for updates. Unsubscribe here.",
+])
+def test_unsubscribe_footers_are_dropped_but_requests_are_kept(footer):
+    text = f"Hi Sam,\n\nPlease unsubscribe me from the planning list.\n\n{footer}"
+    assert strip_boilerplate(text) == "Hi Sam,\n\nPlease unsubscribe me from the planning list."
+
+
+def test_thread_texts_are_not_stripped_again():
+    text = (f"{THREAD_CONTEXT_HEADING}\n\nFrom sam@example.com:\nCan we move the call?\n\n"
+            "Latest message, from lee@example.com (reply to this one):\nPlease unsubscribe me from the list.")
+    assert strip_boilerplate(text) == text
+    assert prepare_email_text(text, "analysis") == text
+
+
+def test_thread_messages_are_stripped_one_by_one():
+    pytest.importorskip("sqlalchemy")
+    from threads import build_thread_text
+
+    messages = [
+        SimpleNamespace(sender="sam@example.com", date=datetime(2030, 5, 6, 9, 0)),
+        SimpleNamespace(sender="lee@example.com", date=datetime(2030, 5, 6, 10, 0), body=""),
+    ]
+    texts = [f"Can we move Thursday's call to Friday?\n\n{DISCLAIMER}",
+             "Please unsubscribe me from the planning list.\n\nFriday works for me."]
+    text = build_thread_text(messages, texts)
+
+    assert text.startswith(THREAD_CONTEXT_HEADING)
+    assert "intended recipient" not in text
+    assert text.endswith("(reply to this one):\nPlease unsubscribe me from the planning list.\n\nFriday works for me.")
@@ -0,0 +1,54 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("sqlalchemy")
+
+from reply_index import NUM_PERM, ReplyIndex, minhash
+
+REQUEST = ("Hi Sam, could we schedule a call on Monday at 3pm to go over the quarterly budget? "
+           "I would like to agree on next steps before the end of the week. Thanks, Priya")
+OTHER_DAY = REQUEST.replace("Monday at 3pm", "Friday at 11am")
+UNRELATED = "The invoice for the office chairs is attached, payment is due within thirty days."
+ANALYSIS = {"summary": "- call request", "reply": "Monday at 3pm works for me.", "event_title": "Budget call"}
+
+
+def similarity(a, b):
+    return np.count_nonzero(minhash(a) == minhash(b)) / NUM_PERM
+
+
+def test_minhash_is_deterministic_and_estimates_similarity():
+    assert minhash(REQUEST).shape == (NUM_PERM,)
+    assert np.array_equal(minhash(REQUEST), minhash(REQUEST.upper()))
+    assert similarity(REQUEST, OTHER_DAY) > 0.5
+    assert similarity(REQUEST, UNRELATED) < 0.2
+    assert minhash("  ") is None
+
+
+def test_lookup_suggests_similar_replies(session_factory):
+    index = ReplyIndex(session_factory=session_factory, enabled=True)
+    assert index.lookup(REQUEST) is None
+    reply_id = index.add("m1", REQUEST, ANALYSIS, sender="priya@example.com")
+
+    match = index.lookup(OTHER_DAY)
+    assert match["id"] == reply_id
+    assert match["reply"] == ANALYSIS["reply"]
+    assert index.lookup(UNRELATED) is None
+
+
+def test_reusable_reply_needs_same_text_and_sender(session_factory):
+    index = ReplyIndex(session_factory=session_factory, enabled=True)
+    index.add("m1", REQUEST, ANALYSIS, sender="priya@example.com")
+
+    assert index.reusable_reply(REQUEST, "priya@example.com")["reply"] == ANALYSIS["reply"]
+    assert index.reusable_reply(REQUEST, "sam@example.com") is None
+    assert index.reusable_reply(OTHER_DAY, "priya@example.com") is None
+
+
+def test_index_reloads_from_database_and_skips_reused_replies(session_factory):
+    index = ReplyIndex(session_factory=session_factory, enabled=True)
+    reply_id = index.add("m1", REQUEST, ANALYSIS, sender="priya@example.com")
+    assert index.add("m2", REQUEST, dict(ANALYSIS, reused_from=reply_id), sender="priya@example.com") is None
+
+    reloaded = ReplyIndex(session_factory=session_factory, enabled=True)
+    assert reloaded.stats()["replies"] == 1
+    assert reloaded.lookup(REQUEST)["id"] == reply_id
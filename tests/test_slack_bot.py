@@ -0,0 +1,100 @@
+import threading
+import time
+from urllib.error import URLError
+
+import pytest
+
+pytest.importorskip("slack_sdk")
+pytest.importorskip("dotenv")
+
+from slack_sdk.errors import SlackApiError
+
+import slack_bot
+from slack_bot import SlackNotifier
+
+
+class FakeResponse(dict):
+    def __init__(self, status_code, error, headers=None):
+        super().__init__(ok=False, error=error)
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FakeWebClient:
+    """
+    Records posted messages; fails the first `rate_limited` posts with a 429.
+    """
+    def __init__(self, rate_limited=0):
+        self.rate_limited = rate_limited
+        self.posts = []
+
+    def chat_postMessage(self, channel, text):
+        if self.rate_limited:
+            self.rate_limited -= 1
+            raise SlackApiError("ratelimited", FakeResponse(429, "ratelimited", {"Retry-After": "3"}))
+        self.posts.append((channel, text))
+        return {"ok": True}
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    delays = []
+    monkeypatch.setattr(slack_bot.time, "sleep", delays.append)
+    return delays
+
+
+def test_notifications_are_sent_as_one_digest():
+    client = FakeWebClient()
+    notifier = SlackNotifier(client, channel="C1", window=5)
+    for i in range(3):
+        notifier.notify(f"alert {i}")
+    # Let the worker pick all of them up within its window before stopping it
+    deadline = time.monotonic() + 5
+    while not notifier._queue.empty() and time.monotonic() < deadline:
+        threading.Event().wait(0.01)
+    notifier.flush()
+
+    assert len(client.posts) == 1
+    channel, text = client.posts[0]
+    assert channel == "C1"
+    assert text.startswith("🗂️ *3 notifications*")
+    assert all(f"alert {i}" in text for i in range(3))
+
+
+def test_large_digests_are_split():
+    client = FakeWebClient()
+    notifier = SlackNotifier(client, channel="C1")
+    notifier._post_digest(["x" * 2000, "y" * 2000])
+    assert [text for _, text in client.posts] == ["x" * 2000, "y" * 2000]
+
+
+def test_rate_limited_posts_wait_for_retry_after(no_sleep):
+    client = FakeWebClient(rate_limited=2)
+    notifier = SlackNotifier(client, channel="C1")
+    assert notifier._post("hello")
+    assert client.posts == [("C1", "hello")]
+    assert no_sleep == [3, 3]
+
+
+class UnreachableWebClient:
+    def __init__(self):
+        self.attempts = 0
+
+    def chat_postMessage(self, channel, text):
+        self.attempts += 1
+        raise URLError("network is unreachable")
+
+
+def test_network_errors_do_not_stop_the_worker():
+    client = UnreachableWebClient()
+    notifier = SlackNotifier(client, channel="C1", window=0)
+    assert notifier._post("hello") is False
+
+    for expected in (2, 3):
+        notifier.notify("alert")
+        deadline = time.monotonic() + 5
+        while client.attempts < expected and time.monotonic() < deadline:
+            threading.Event().wait(0.01)
+        assert client.attempts == expected
+        assert notifier._thread.is_alive()
+    notifier.flush()
@@ -0,0 +1,107 @@
+import re
+from collections import defaultdict
+from datetime import datetime
+from database import get_thread_emails, PENDING_STATUSES
+from metrics import metrics
+from nlp_utils import clean_email_text
+from prompt_prep import strip_boilerplate, THREAD_CONTEXT_HEADING
+
+# Earlier messages only provide context, so they are trimmed hard; the newest message is kept whole
+MAX_CONTEXT_MESSAGES = 4
+MAX_CONTEXT_CHARS = 600  # per earlier message
+# Shorter lines ("Thanks,", "Hi Sam,") repeat between unrelated messages, so they never count as quoted
+MIN_SEEN_LINE_CHARS = 20
+_QUOTE_PREFIX_RE = re.compile(r"^[\s>]+")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+def _line_key(line):
+    return _WHITESPACE_RE.sub(" ", _QUOTE_PREFIX_RE.sub("", line)).strip().lower()
+
+def _sort_key(email):
+    return (email.date or datetime.min, email.id)
+
+def new_text_by_message(messages):
+    """
+    Returns what each message adds to its thread, in the order of `messages` (oldest first).
+    Quoted replies and signatures are stripped, then any line already seen in an earlier message
+    is dropped, which also catches quoting without '>' markers or reply headers.
+    """
+    seen = set()
+    texts = []
+    for message in messages:
+        body = message.body or ""
+        kept = [line for line in clean_email_text(body).splitlines()
+                if len(_line_key(line)) < MIN_SEEN_LINE_CHARS or _line_key(line) not in seen]
+        texts.append("\n".join(kept).strip())
+        seen.update(key for key in map(_line_key, body.splitlines()) if len(key) >= MIN_SEEN_LINE_CHARS)
+    return texts
+
+def _describe(message):
+    when = f" ({message.date:%Y-%m-%d %H:%M})" if message.date else ""
+    return f"{message.sender}{when}"
+
+def _shorten(text, limit):
+    if len(text) <= limit:
+        return text
+    return text[:limit].rsplit(" ", 1)[0] + " …"
+
+def build_thread_text(messages, new_texts, max_context_messages=MAX_CONTEXT_MESSAGES,
+                      max_context_chars=MAX_CONTEXT_CHARS):
+    """
+    Builds the text sent to the model for the last message of `messages`: its new content in full,
+    preceded by a trimmed excerpt of the most recent earlier messages.
+    Each message is stripped of boilerplate on its own, so the headings never count as its first paragraph.
+    """
+    latest = messages[-1]
+    # A message that is nothing but a forwarded block strips down to nothing; send it as it is
+    latest_text = strip_boilerplate(new_texts[-1]) or new_texts[-1] or (latest.body or "")
+    earlier = [(message, strip_boilerplate(text)) for message, text in zip(messages[:-1], new_texts[:-1])]
+    earlier = [(message, text) for message, text in earlier if text]
+    earlier = earlier[-max_context_messages:] if max_context_messages else []
+    if not earlier:
+        return latest_text
+
+    parts = [THREAD_CONTEXT_HEADING]
+    for message, text in earlier:
+        parts.append(f"From {_describe(message)}:\n{_shorten(text, max_context_chars)}")
+    parts.append(f"Latest message, from {_describe(latest)} (reply to this one):\n{latest_text}")
+    return "\n\n".join(parts)
+
+def collapse_threads(session, emails):
+    """
+    Groups `emails` by Gmail thread so each conversation costs one model call. Returns one dict per
+    thread, in the order threads first appear in `emails`, with:
+
+    - `email`: the newest of the given emails in the thread, the one to answer
+    - `superseded`: older pending emails of the thread that the answer to `email` covers
+    - `later`: stored emails of the thread that are newer than `email`
+    - `text`: the compact prompt text for `email`, with earlier messages as context
+    """
+    groups = defaultdict(list)
+    for email in emails:
+        groups[email.thread_id or email.id].append(email)
+    history = defaultdict(list)
+    for message in get_thread_emails(session, {email.thread_id for email in emails if email.thread_id}):
+        history[message.thread_id].append(message)
+
+    threads = []
+    for group in groups.values():
+        email = max(group, key=_sort_key)
+        messages = history.get(email.thread_id, [])
+        if email not in messages:
+            messages = messages + [email]
+        messages = sorted(messages, key=_sort_key)
+        position = messages.index(email)
+        earlier, later = messages[:position], messages[position + 1:]
+        new_texts = new_text_by_message(earlier + [email])
+        superseded = [m for m in earlier if m.status in PENDING_STATUSES]
+        superseded += [m for m in group if m is not email and m not in superseded]
+        threads.append({
+            'email': email,
+            'superseded': superseded,
+            'later': later,
+            'text': build_thread_text(earlier + [email], new_texts),
+        })
+        if superseded:
+            metrics.inc('thread_messages_collapsed_total', len(superseded))
+    return threads